@@ -0,0 +1,298 @@
+'''
+Active queue management on the bottleneck link.
+
+TCLink builds the bottleneck port as htb 5: (rate --bw-net) with a netem
+10: child (delay, limit --maxq): a drop-tail queue.  apply() grafts the
+chosen discipline under netem as 20:, at the `parent 10:1` Mininet itself
+hands out after netem, so packets keep the link delay and rate while the
+standing queue forms, and is managed, in the AQM:
+
+    none      drop-tail in netem, as in the original experiments
+    fq_codel  --aqm-target/--aqm-interval (default 5/100 ms), flow queues
+    codel     --aqm-target/--aqm-interval (default 5/100 ms)
+    pie       --aqm-target (default 15 ms)
+    cake      --cake-bandwidth (default --bw-net), --aqm-interval as rtt
+    red       --red-min/--red-max (packets), --red-prob
+
+Every discipline but CAKE (which bounds its memory instead) gets --maxq
+as its packet limit, so the buffer size stays comparable with the
+drop-tail runs, and --aqm-ecn marks instead of dropping.  The qdisc is
+read back over rtnetlink after `tc qdisc replace`, which also reconfigures
+an already installed one in place (session.py); remove() restores the
+drop-tail queue.
+
+decode_xstats() turns the per-kind statistics the kernel reports for 20:
+into the common AQM_FIELDS columns (ECN marks, current delay, drop
+probability, AQM drops, overflow drops, flows); the 'aqm' probe of
+sampler.py records them to aqm.txt next to buffer.txt.  To compare runs
+that differ only by the discipline:
+
+    python3 aqm.py reno-none reno-fq_codel reno-pie
+    python3 aqm.py --show --aqm fq_codel --maxq 100 -b 10   prints the tc command
+'''
+
+import argparse
+import glob
+import json
+import os
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from rtnl import QdiscSampler, parse_attrs, parse_handle
+
+KINDS = ['none', 'fq_codel', 'codel', 'pie', 'cake', 'red']
+PARENT = '10:1'
+HANDLE = '20:'
+MTU = 1500
+
+Aqm = namedtuple('Aqm', 'kind target interval ecn bandwidth red_min red_max red_prob')
+
+
+def add_arguments(parser):
+    """Bottleneck queue discipline options, shared by the Mininet scripts."""
+    parser.add_argument('--aqm', choices=KINDS, default='none',
+                        help="Queue discipline of the bottleneck (none = drop-tail)")
+    parser.add_argument('--aqm-target', type=float, default=None,
+                        help="Target queueing delay in ms (CoDel, fq_codel, PIE)")
+    parser.add_argument('--aqm-interval', type=float, default=100,
+                        help="CoDel/fq_codel interval, CAKE rtt (ms)")
+    parser.add_argument('--aqm-ecn', action='store_true',
+                        help="Mark ECN capable packets instead of dropping them")
+    parser.add_argument('--cake-bandwidth', type=float, default=None,
+                        help="CAKE shaper rate in Mb/s (default --bw-net)")
+    parser.add_argument('--red-min', type=float, default=5,
+                        help="RED min threshold (packets)")
+    parser.add_argument('--red-max', type=float, default=15,
+                        help="RED max threshold (packets)")
+    parser.add_argument('--red-prob', type=float, default=0.1,
+                        help="RED max marking/drop probability")
+
+
+def from_args(args):
+    """Aqm of parsed add_arguments() options, None for drop-tail."""
+    if args.aqm == 'none':
+        return None
+    target = args.aqm_target
+    if target is None:
+        target = 15.0 if args.aqm == 'pie' else 5.0
+    return Aqm(args.aqm, target, args.aqm_interval, args.aqm_ecn,
+               args.cake_bandwidth or args.bw_net, args.red_min, args.red_max,
+               args.red_prob)
+
+
+def qdisc_args(aqm, maxq):
+    """tc arguments after the qdisc kind."""
+    ecn = ' ecn' if aqm.ecn else ''
+    if aqm.kind == 'fq_codel':
+        return 'limit %d target %gms interval %gms %s' % (
+            maxq, aqm.target, aqm.interval, 'ecn' if aqm.ecn else 'noecn')
+    if aqm.kind == 'codel':
+        return 'limit %d target %gms interval %gms%s' % (
+            maxq, aqm.target, aqm.interval, ecn)
+    if aqm.kind == 'pie':
+        return 'limit %d target %gms%s' % (maxq, aqm.target, ecn)
+    if aqm.kind == 'cake':
+        return 'bandwidth %gmbit rtt %gms besteffort' % (aqm.bandwidth, aqm.interval)
+    if aqm.kind == 'red':
+        lo, hi = aqm.red_min * MTU, aqm.red_max * MTU
+        # Burst as recommended by tc-red(8): (2 * min + max) / (3 * avpkt)
+        burst = int((2 * lo + hi) / (3 * MTU)) + 1
+        return 'limit %d min %d max %d avpkt %d burst %d bandwidth %gmbit ' \
+            'probability %g%s' % (max(maxq * MTU, hi * 2), lo, hi, MTU, burst,
+                                  aqm.bandwidth, aqm.red_prob, ecn)
+    raise ValueError('unknown queue discipline %r' % aqm.kind)
+
+
+def command(aqm, iface, maxq):
+    return 'tc qdisc replace dev %s parent %s handle %s %s %s' % (
+        iface, PARENT, HANDLE, aqm.kind, qdisc_args(aqm, maxq))
+
+
+def apply(node, aqm, iface, maxq, outdir=None):
+    """Installs aqm under the netem of iface (a port of switch node) and
+    checks that the kernel has it.  Records it in <outdir>/qdisc.json."""
+    cmd = command(aqm, iface, maxq)
+    out = node.cmd(cmd).strip()
+    sampler = QdiscSampler(iface)
+    try:
+        q = sampler.sample(parse_handle(HANDLE))
+    finally:
+        sampler.close()
+    if q is None or q.kind != aqm.kind:
+        raise RuntimeError('%s: %s failed: %s' % (iface, cmd, out or 'not installed'))
+    if outdir is not None:
+        with open(os.path.join(outdir, 'qdisc.json'), 'w') as f:
+            json.dump({'aqm': aqm._asdict(), 'iface': iface, 'maxq': maxq,
+                       'command': cmd}, f, indent=1)
+    return cmd
+
+
+def remove(node, iface):
+    """Deletes the AQM of iface, leaving the netem drop-tail queue."""
+    out = node.cmd('tc qdisc del dev %s parent %s handle %s' %
+                   (iface, PARENT, HANDLE)).strip()
+    sampler = QdiscSampler(iface)
+    try:
+        q = sampler.sample(parse_handle(HANDLE))
+    finally:
+        sampler.close()
+    if q is not None:
+        raise RuntimeError('%s: AQM %s not removed: %s' % (iface, q.kind, out))
+
+
+# struct tc_fq_codel_xstats (type TCA_FQ_CODEL_XSTATS_QDISC), tc_codel_xstats,
+# tc_pie_xstats (u64 prob since Linux 5.7, u32 before) and tc_red_xstats
+FQ_CODEL_XSTATS = struct.Struct('=I9I')
+CODEL_XSTATS = struct.Struct('=IIIIiIIII')
+PIE_XSTATS = struct.Struct('=QIIIIIIII')
+PIE_XSTATS_OLD = struct.Struct('=IIIIIIII')
+RED_XSTATS = struct.Struct('=IIII')
+PIE_MAX_PROB = float((1 << 64) - 1 >> 8)
+# Nested CAKE statistics (TCA_CAKE_STATS_* / TCA_CAKE_TIN_STATS_*)
+CAKE_STATS_TIN_STATS = 10
+CAKE_TIN_DROPPED_PACKETS = 4
+CAKE_TIN_ECN_MARKED_PACKETS = 8
+CAKE_TIN_AVG_DELAY_US = 19
+CAKE_TIN_SPARSE_FLOWS = 21
+CAKE_TIN_BULK_FLOWS = 22
+U32 = struct.Struct('=I')
+
+# (ecn_mark, delay_us, prob, aqm_drops, drop_overlimit, flows) when unknown
+UNKNOWN = (-1, -1, float('nan'), -1, -1, -1)
+
+
+def unpack(st, data):
+    return st.unpack(data[:st.size].ljust(st.size, b'\0'))
+
+
+def decode_xstats(kind, xstats, drops=0):
+    """AQM columns of the statistics of a qdisc of the given kind; drops
+    is its total drop count (for fq_codel, whose AQM drops are the rest
+    after the overflow drops)."""
+    if not xstats:
+        return UNKNOWN
+    if kind == 'fq_codel':
+        (_, _, overlimit, ecn, _, new_len, old_len, _, _,
+         overmemory) = unpack(FQ_CODEL_XSTATS, xstats)
+        full = overlimit + overmemory
+        return (ecn, -1, float('nan'), max(drops - full, 0), full,
+                new_len + old_len)
+    if kind == 'codel':
+        _, _, _, ldelay, _, overlimit, ecn, _, _ = unpack(CODEL_XSTATS, xstats)
+        return (ecn, ldelay, float('nan'), max(drops - overlimit, 0), overlimit, -1)
+    if kind == 'pie':
+        if len(xstats) >= PIE_XSTATS.size:
+            prob, delay, _, _, _, dropped, overlimit, _, ecn = unpack(PIE_XSTATS, xstats)
+            prob /= PIE_MAX_PROB
+        else:
+            prob, delay, _, _, dropped, overlimit, _, ecn = unpack(PIE_XSTATS_OLD, xstats)
+            prob /= float(0xFFFFFFFF)
+        return (ecn, delay, prob, dropped, overlimit, -1)
+    if kind == 'red':
+        early, pdrop, _, marked = unpack(RED_XSTATS, xstats)
+        return (marked, -1, float('nan'), early, pdrop, -1)
+    if kind == 'cake':
+        tins = parse_attrs(parse_attrs(xstats).get(CAKE_STATS_TIN_STATS, b''))
+        ecn = dropped = flows = 0
+        delay = -1
+        for tin in tins.values():
+            t = parse_attrs(tin)
+            get = lambda a: U32.unpack_from(t[a])[0] if a in t else 0
+            ecn += get(CAKE_TIN_ECN_MARKED_PACKETS)
+            dropped += get(CAKE_TIN_DROPPED_PACKETS)
+            flows += get(CAKE_TIN_SPARSE_FLOWS) + get(CAKE_TIN_BULK_FLOWS)
+            delay = max(delay, get(CAKE_TIN_AVG_DELAY_US))
+        return (ecn, delay, float('nan'), dropped, max(drops - dropped, 0), flows)
+    return UNKNOWN
+
+
+def summarize(d, iface='s0-eth2'):
+    """Discipline, throughput, RTT and AQM counters of a result directory.
+
+    Throughput is the sum of the iperf logs, or else the mean rate of the
+    bottleneck port (rate_<iface>.txt)."""
+    from parsers import iperf_throughput, load
+    ret = {'dir': d, 'aqm': 'none', 'mbps': float('nan')}
+    try:
+        with open(os.path.join(d, 'qdisc.json')) as f:
+            qdisc = json.load(f)
+        ret['aqm'] = qdisc['aqm']['kind']
+        iface = qdisc['iface']
+    except IOError:
+        pass
+    rates = [iperf_throughput(p) for p in glob.glob(os.path.join(d, 'iperf_*.txt'))]
+    path = os.path.join(d, 'rate_%s.txt' % iface)
+    if rates:
+        ret['mbps'] = float(np.nansum(rates))
+    elif os.path.exists(path):
+        r = load(path, 'rate')
+        if len(r) > 1:
+            ret['mbps'] = float(r['tx_bps'][1:].mean() / 1e6)
+    for name in ('ping.txt', 'ping_competition.txt'):
+        path = os.path.join(d, name)
+        if os.path.exists(path):
+            rtt = load(path, 'ping')['rtt']
+            ok = rtt[~np.isnan(rtt)]
+            if len(ok):
+                ret.update(('rtt_p%d' % p, float(np.percentile(ok, p)))
+                           for p in (50, 95, 99))
+            break
+    path = os.path.join(d, 'buffer.txt')
+    if os.path.exists(path):
+        q = load(path, 'buffer')
+        if len(q) and 'drops' in q.dtype.names:
+            ret['drops'] = int(q['drops'][-1] - q['drops'][0])
+    path = os.path.join(d, 'aqm.txt')
+    if os.path.exists(path):
+        a = load(path, 'aqm')
+        if len(a):
+            ret['ecn_mark'] = int(a['ecn_mark'][-1] - a['ecn_mark'][0])
+            ret['aqm_drops'] = int(a['aqm_drops'][-1] - a['aqm_drops'][0])
+    return ret
+
+
+def print_comparison(rows):
+    """One line per run; RTT and throughput also relative to the first."""
+    base = rows[0]
+    print('%-28s %-9s %8s %9s %9s %9s %8s %8s' % (
+        'dir', 'aqm', 'Mb/s', 'p50 ms', 'p95 ms', 'p99 ms', 'drops', 'marks'))
+    for r in rows:
+        get = lambda k: r.get(k, float('nan'))
+        print('%-28s %-9s %8.2f %9.1f %9.1f %9.1f %8s %8s' % (
+            os.path.basename(os.path.normpath(r['dir'])), r['aqm'], get('mbps'),
+            get('rtt_p50'), get('rtt_p95'), get('rtt_p99'), r.get('drops', '-'),
+            r.get('ecn_mark', '-')))
+    for r in rows[1:]:
+        print('%s vs %s: p95 RTT %+.1f ms, throughput %+.1f%%' % (
+            r['aqm'], base['aqm'],
+            r.get('rtt_p95', np.nan) - base.get('rtt_p95', np.nan),
+            (r['mbps'] / base['mbps'] - 1) * 100 if base['mbps'] else np.nan))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bottleneck AQM runs")
+    parser.add_argument('dirs', nargs='*', help="Result directories to compare, "
+                        "the first one as baseline")
+    parser.add_argument('--show', action='store_true',
+                        help="Print the tc command of the --aqm options")
+    parser.add_argument('--iface', default='s0-eth2',
+                        help="Bottleneck port, for runs without iperf logs or qdisc.json")
+    parser.add_argument('--maxq', type=int, default=100)
+    parser.add_argument('--bw-net', '-b', type=float, default=10)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.show:
+        aqm = from_args(args)
+        print(command(aqm, args.iface, args.maxq) if aqm else
+              'drop-tail: netem limit %d' % args.maxq)
+        return
+    if not args.dirs:
+        parser.error('no result directories')
+    print_comparison([summarize(d, args.iface) for d in args.dirs])
+
+
+if __name__ == '__main__':
+    main()
@@ -8,14 +8,21 @@ from mininet.cli import CLI
 
 from subprocess import Popen, PIPE
 from time import sleep, time
-from multiprocessing import Process
 from argparse import ArgumentParser
 
-from monitor import monitor_qlen
+from sampler import start_sampler
+from tsfile import clock, fetch_ok, set_epoch, open_series, FETCH_FIELDS
+import fidelity
+import aqm
+import resultsdb
+import session
+import sweep
+from webload import summarize
 
 import sys
 import os
 import math
+import json
 
 parser = ArgumentParser(description="Bufferbloat tests")
 parser.add_argument('--bw-host', '-B',
@@ -54,6 +61,82 @@ parser.add_argument('--cong',
                     help="Congestion control algorithm to use",
                     default="reno")
 
+# Modo de medição do tempo de busca das páginas web:
+# - curl: 3 buscas sequenciais a cada 5 s (comportamento original)
+# - async: webload.py com buscas concorrentes e periódicas, relatando
+#   tempo de conexão, TTFB e percentis p50/p95/p99
+parser.add_argument('--fetch-mode',
+                    choices=['curl', 'async'],
+                    help="How to measure web page fetch times",
+                    default="curl")
+
+parser.add_argument('--fetch-concurrency',
+                    type=int,
+                    help="Concurrent fetch workers in async fetch mode",
+                    default=4)
+
+parser.add_argument('--fetch-period',
+                    type=float,
+                    help="Seconds between fetches of each worker in async fetch mode",
+                    default=1.0)
+
+# Servidor web: simple é o SimpleHTTPRequestHandler original (uma
+# requisição por vez); threaded/async usam sendfile, keep-alive e
+# registram o tempo de serviço de cada requisição em server.txt
+parser.add_argument('--server-mode',
+                    choices=['simple', 'threaded', 'async'],
+                    help="Web server implementation (http/webserver.py --mode)",
+                    default="simple")
+
+parser.add_argument('--ping-interval',
+                    type=float,
+                    help="Seconds between RTT probes (rttprobe.py, down to 0.001)",
+                    default=0.1)
+
+# Estado TCP (cwnd, srtt, taxa de pacing, estado do BBR) de cada fluxo do
+# iperf, lido do kernel via sock_diag (tcpinfo.py) em tcp_<host>.txt
+parser.add_argument('--tcpinfo-interval',
+                    type=float,
+                    help="Seconds between tcp_info samples of the iperf flows (0 disables)",
+                    default=0.01)
+
+# Captura só dos cabeçalhos (snaplen) dos pacotes que entram no switch do
+# gargalo e dos que saem do enlace do gargalo, para o pcapstream.py
+parser.add_argument('--pcap',
+                    action='store_true',
+                    help="Capture headers on both sides of the bottleneck (tcpdump)")
+
+parser.add_argument('--snaplen',
+                    type=int,
+                    help="Bytes captured per packet with --pcap",
+                    default=96)
+
+# Disciplina de fila do gargalo (aqm.py): fq_codel, codel, pie, cake ou
+# red, instalada via tc abaixo do netem depois que o enlace é criado;
+# 'none' mantém a fila drop-tail de --maxq pacotes
+aqm.add_arguments(parser)
+
+# Banco SQLite de resultados (resultsdb.py) onde a execução é importada
+# ao final; config.json com todos os parâmetros é gravado de qualquer forma
+parser.add_argument('--db',
+                    help="Import the run into this results database when done")
+
+# Número da repetição (repeat.py): não muda o experimento, só distingue
+# execuções repetidas da mesma configuração no cache do sweep.py e no
+# config.json
+parser.add_argument('--trial',
+                    type=int,
+                    help="Repetition number of the configuration",
+                    default=0)
+
+# Sessão (session.py): a topologia é criada uma vez e cada ponto só
+# reconfigura o tc dos enlaces e o controle de congestionamento, sem
+# recriar a rede; cada ponto vai para <dir>/<parâmetros do ponto>
+parser.add_argument('--session',
+                    nargs='+',
+                    metavar='NAME=V1,V2',
+                    help="Run every combination of these values on one warm topology")
+
 # Parâmetros do experimento
 args = parser.parse_args()
 
@@ -61,7 +144,11 @@ args = parser.parse_args()
 class BBTopo(Topo):
     "Topologia simples para experimento de bufferbloat."
 
-    def build(self, n=2):
+    def build(self, n=2, aqm=None):
+        # Disciplina de fila do gargalo (None = drop-tail); aplicada via tc
+        # depois que o enlace existe, ver setup_aqm()
+        self.aqm = aqm
+
         # Criação dos dois hosts: h1 (cliente) e h2 (servidor)
         h1 = self.addHost('h1')
         h2 = self.addHost('h2')
@@ -88,68 +175,203 @@ def start_iperf(net):
     # Inicia cliente iperf em h1 conectando ao servidor h2
     # Fluxo TCP de longa duração (2x o tempo do experimento) para saturar o link
     client = h1.popen('iperf -c ' + str(h2.IP()) + ' --time ' + str(2*args.time))
-
-
-def start_qmon(iface, interval_sec=0.1, outfile="buffer.txt"):
-    monitor = Process(target=monitor_qlen,
-                      args=(iface, interval_sec, outfile))
-    monitor.start()
-    return monitor
+    return [server, client]
+
+
+def start_qmon(iface, interval_sec=0.1, outfile="buffer.txt", probes=()):
+    # Um único processo amostra a fila e as demais sondas em deadlines
+    # absolutos (ver sampler.py), em vez de um processo por monitor
+    return start_sampler([('qdisc', iface, interval_sec, outfile)] + list(probes))
+
+
+def setup_aqm(net, topo, iface):
+    # Instala a AQM da topologia na porta do gargalo e devolve a sonda que
+    # registra as estatísticas dela (aqm.txt); buffer.txt continua sendo o
+    # netem, que conta também os pacotes da AQM
+    if topo.aqm is None:
+        return []
+    print("AQM no gargalo: %s" % aqm.apply(net.get('s0'), topo.aqm, iface,
+                                           args.maxq, args.dir))
+    return [('aqm', iface, 0.1, '%s/aqm.txt' % args.dir, aqm.HANDLE)]
+
+
+def host_probes(net, interval_sec=0.1):
+    # Taxas de todas as interfaces (portas dos switches e dos hosts) numa
+    # única leitura, estatísticas TCP de cada host e tcp_info dos fluxos
+    # do iperf (porta 5001), no mesmo relógio das amostras da fila
+    ifaces = [intf.name for sw in net.switches for intf in sw.intfList()
+              if intf.name != 'lo']
+    ifaces += [(intf.name, host.pid) for host in net.hosts
+               for intf in host.intfList() if intf.name != 'lo']
+    probes = [('linkrate', ifaces, interval_sec, '%s/rate_%%s.txt' % args.dir),
+              ('syscpu', interval_sec, '%s/cpu.txt' % args.dir)]
+    for host in net.hosts:
+        probes.append(('sockstat', host.pid, interval_sec,
+                       '%s/sock_%s.txt' % (args.dir, host.name)))
+        # Uso de CPU do cgroup de cada host, para o veredito de fidelidade
+        probes.append(('hostcpu', host.pid, interval_sec,
+                       '%s/cpu_%s.txt' % (args.dir, host.name)))
+        if args.tcpinfo_interval > 0:
+            probes.append(('tcpinfo', host.pid, args.tcpinfo_interval,
+                           '%s/tcp_%s.txt' % (args.dir, host.name), 5001))
+    return probes
+
+
+def check_fidelity(iface):
+    # Veredito de fidelidade da emulação (fidelity.py): CPU dos hosts e da
+    # máquina, softirq, deadlines perdidos pelo amostrador e taxa do
+    # gargalo comparada com --bw-net.  Um 'fail' indica que a máquina, e
+    # não a rede emulada, limitou o experimento
+    report = fidelity.assess(args.dir, args.bw_net, iface)
+    with open('%s/fidelity.json' % args.dir, 'w') as f:
+        json.dump(report, f, indent=1)
+    print("Fidelidade da emulação: %s" % report['verdict'].upper())
+    for c in report['checks']:
+        if c['status'] in ('warn', 'fail'):
+            print("  %s (%s): %.3f, %s" % (c['check'], c['status'], c['value'],
+                                           c['detail']))
+    return report
+
+
+def tcpdump(node, iface, outfile):
+    # Só pacotes recebidos (-Q in), truncados em --snaplen bytes
+    return node.popen("tcpdump -i %s -Q in -n -s %d -B 16384 -w %s tcp" %
+                      (iface, args.snaplen, outfile))
+
+
+def start_pcap(net):
+    # Entrada: pacotes de h1 chegando em s0 (s0-eth1), antes da fila do
+    # gargalo; saída: pacotes chegando em h2 depois da fila e do enlace.
+    # pcapstream.py casa as duas capturas para obter o tempo de permanência
+    # na fila e os descartes de cada pacote
+    s0 = net.get('s0')
+    h2 = net.get('h2')
+    return [tcpdump(s0, 's0-eth1', '%s/pcap_in_s0-eth1.pcap' % args.dir),
+            tcpdump(h2, 'h2-eth0', '%s/pcap_out_h2-eth0.pcap' % args.dir)]
 
 
 def start_ping(net):
-    # Inicia sequência de pings de h1 para h2 para medir RTT
-    # Ping a cada 0.1 segundos (-i 0.1) para capturar variações de latência
-    # Saída redirecionada para arquivo ping.txt para análise posterior
+    # Inicia o prober de RTT (rttprobe.py) de h1 para h2
+    # Cada sonda registra instantes de envio e recebimento; perdas aparecem
+    # explicitamente (rtt = nan) em ping.txt em vez de serem ignoradas
     h1 = net.get('h1')
     h2 = net.get('h2')
-    h1.popen("ping -i 0.1 " + str(h2.IP()) + " > " + args.dir + "/ping.txt", shell=True)
+    return h1.popen("python3 rttprobe.py -i %s -w %d -o %s/ping.txt %s" %
+                    (args.ping_interval, args.time + 30, args.dir, h2.IP()))
 
 
 def start_webserver(net):
     h1 = net.get('h1')
-    proc = h1.popen("python http/webserver.py", shell=True)
-    sleep(1)
+    if args.server_mode == 'simple':
+        proc = h1.popen("python http/webserver.py", shell=True)
+    else:
+        proc = h1.popen("python3 http/webserver.py --mode %s --log %s/server.txt" %
+                        (args.server_mode, args.dir))
+    # Espera o servidor aceitar conexões na porta 80 em vez de um sleep fixo
+    session.wait_listening(h1, 80)
     return [proc]
 
 
-def fetch_pages(net):
+def fetch_pages(net, out):
     h2 = net.get('h2')
     h1 = net.get('h1')
     result = 0
     for i in range(3):
         # Executa curl para medir tempo de download da página web
-        proc = h2.popen("curl -o /dev/null -s -w %{time_total} " + str(h1.IP()) + "/http/index.html", shell=True, text=True, stdout=PIPE)
-        output = proc.stdout.readline()
-        print(output)
-        result += float(output)
+        # Cada busca também vai para fetch.txt, no formato do webload.py e
+        # com o instante de início no relógio do experimento
+        start = clock()
+        proc = h2.popen("curl -o /dev/null -s -w '%{time_connect} %{time_starttransfer} "
+                        "%{time_total} %{size_download} %{http_code}' " +
+                        str(h1.IP()) + "/http/index.html", shell=True, text=True, stdout=PIPE)
+        connect, ttfb, total, nbytes, status = proc.stdout.readline().split()
+        print(total)
+        out.append(start, int(float(connect) * 1e9), int(float(ttfb) * 1e9),
+                   int(float(total) * 1e9), int(float(nbytes)), int(status))
+        result += float(total)
     return result
 
 
-def bufferbloat():
+def fetch_pages_async(net):
+    # Executa webload.py em h2 durante todo o experimento e lê os tempos
+    # registrados por requisição (em ns) de fetch.txt
+    h2 = net.get('h2')
+    h1 = net.get('h1')
+    outfile = '%s/fetch.txt' % args.dir
+    proc = h2.popen("python3 webload.py http://%s/http/index.html -c %d -p %s -d %d -o %s" %
+                    (h1.IP(), args.fetch_concurrency, args.fetch_period, args.time, outfile))
+    start_time = time()
+    while proc.poll() is None:
+        sleep(5)
+        delta = time() - start_time
+        if delta < args.time:
+            print("%.1fs restantes..." % (args.time - delta))
+    print(proc.stdout.read().decode().strip())
+    times = []
+    for line in open(outfile):
+        if line.startswith('#'):
+            continue
+        fields = line.split(',')
+        if fetch_ok(int(fields[5])):
+            times.append(int(fields[3]) / 1e9)
+    return times
+
+
+def prepare_dir():
     if not os.path.exists(args.dir):
         os.makedirs(args.dir)
+    # Época do experimento: todos os processos iniciados a partir daqui
+    # (amostrador, rttprobe, webload, tcpinfo, servidor web) carimbam suas
+    # amostras no mesmo relógio monotônico (tsfile.clock); os timestamps
+    # CSV do iperf são do relógio de parede, que só se afasta deste pelos
+    # ajustes do NTP durante a execução
+    set_epoch()
+    # Parâmetros, ambiente e época da execução, lidos pelo resultsdb.py
+    resultsdb.write_config(args.dir, args, __file__)
+
+
+def start_net(topo):
     os.system("sysctl -w net.ipv4.tcp_congestion_control=%s" % args.cong)
-    topo = BBTopo()
     net = Mininet(topo=topo, host=CPULimitedHost, link=TCLink)
     net.start()
     # Exibe a topologia e como os nós estão interconectados
     dumpNodeConnections(net.hosts)
     # Teste básico de conectividade entre todos os hosts
     net.pingAll()
-
+    return net
+
+
+def reconfigure(net, old, new):
+    # Entre pontos da sessão: espera as filas esvaziarem, muda banda,
+    # atraso e tamanho de fila dos enlaces no próprio tc (conferindo o
+    # resultado via rtnetlink), remove a AQM se o novo ponto não tem e
+    # limpa as métricas TCP guardadas pelo kernel no ponto anterior
+    start = time()
+    session.drain(net)
+    changed = session.relink(net, old, new)
+    if old.aqm is not None and new.aqm is None:
+        aqm.remove(net.get('s0'), 's0-eth2')
+    session.set_cc(net, args.cong)
+    session.flush_tcp_metrics(net)
+    print("Topologia reconfigurada em %.1f ms (%s)" %
+          ((time() - start) * 1e3, ', '.join(changed) or 'enlaces inalterados'))
+
+
+def experiment(net, topo):
     # Inicia monitoramento do tamanho da fila do switch
     # Monitora interface s0-eth2 (link gargalo entre switch e h2)
     # A numeração das interfaces começa em 1: eth1 para h1, eth2 para h2
     qmon = start_qmon(iface='s0-eth2',
-                      outfile='%s/buffer.txt' % (args.dir))
+                      outfile='%s/buffer.txt' % (args.dir),
+                      probes=setup_aqm(net, topo, 's0-eth2') + host_probes(net))
 
     # Inicia todos os processos necessários para o experimento:
     # - iperf: gera tráfego TCP de fundo para saturar o link
     # - ping: mede latência continuamente 
     # - webserver: serve páginas web para teste de responsividade
-    start_iperf(net)
-    start_ping(net)
+    captures = start_pcap(net) if args.pcap else []
+    iperf = start_iperf(net)
+    ping = start_ping(net)
     start_webserver(net)
 
     # Medição do tempo de transferência de páginas web
@@ -157,35 +379,99 @@ def bufferbloat():
     # Usa curl para medir tempo total de download da página
     times = []
 
-    start_time = time()
-    while True:
-        # Executa 3 medições por iteração e calcula média
-        times.append(fetch_pages(net))
-        sleep(5)
-        now = time()
-        delta = now - start_time
-        if delta > args.time:
-            break
-        print("%.1fs restantes..." % (args.time - delta))
+    if args.fetch_mode == 'async':
+        times = fetch_pages_async(net)
+    else:
+        out = open_series('%s/fetch.txt' % args.dir, FETCH_FIELDS, header=True,
+                          source='curl')
+        start_time = time()
+        while True:
+            # Executa 3 medições por iteração e calcula média
+            times.append(fetch_pages(net, out))
+            sleep(5)
+            now = time()
+            delta = now - start_time
+            if delta > args.time:
+                break
+            print("%.1fs restantes..." % (args.time - delta))
+        out.close()
 
     # Cálculo de estatísticas dos tempos de busca das páginas web
     # Média aritmética e desvio padrão para avaliar impacto do bufferbloat
     # Buffers maiores tendem a aumentar latência e variabilidade dos tempos
-    tempo_medio_busca = sum(times) / len(times)
-    print("Tempo médio de busca da página web quando q = " + str(args.maxq) + ": " + str(tempo_medio_busca))
-    desvio_padrao = (sum([((x - tempo_medio_busca) ** 2) for x in times]) / len(times)) ** 0.5
-    print("Desvio padrão quando q = " + str(args.maxq) + ": " + str(desvio_padrao))
+    if times:
+        tempo_medio_busca = sum(times) / len(times)
+        print("Tempo médio de busca da página web quando q = " + str(args.maxq) + ": " + str(tempo_medio_busca))
+        desvio_padrao = (sum([((x - tempo_medio_busca) ** 2) for x in times]) / len(times)) ** 0.5
+        print("Desvio padrão quando q = " + str(args.maxq) + ": " + str(desvio_padrao))
+        # Percentis dão uma visão melhor da cauda do que média e desvio padrão
+        stats = summarize(times)
+        print("p50/p95/p99 quando q = %d: %.4f / %.4f / %.4f" %
+              (args.maxq, stats['p50'], stats['p95'], stats['p99']))
+    else:
+        # Nenhuma busca terminou (todas falharam ou passaram do fim do experimento)
+        print("Nenhuma busca de página completa quando q = %d" % args.maxq)
 
     # CLI desabilitada para execução automática
     # Descomente a linha abaixo para debug interativo dos hosts h1 e h2
     # CLI(net)
 
     # Finalização do experimento: para monitoramento e limpa recursos
+    # SIGTERM faz o prober gravar as sondas pendentes antes de sair
+    ping.terminate()
+    for proc in captures + iperf:
+        proc.terminate()
     qmon.terminate()
-    net.stop()
+    qmon.join()
+    check_fidelity('s0-eth2')
     # Mata processos do webserver que podem continuar rodando após o experimento
     # Necessário para evitar conflitos em execuções subsequentes
     Popen("pgrep -f webserver.py | xargs kill -9", shell=True).wait()
 
+
+def bufferbloat():
+    prepare_dir()
+    topo = BBTopo(aqm=aqm.from_args(args))
+    net = start_net(topo)
+    try:
+        experiment(net, topo)
+    finally:
+        net.stop()
+
+
+def run_session():
+    # Um ponto por combinação dos valores de --session, todos na mesma
+    # rede: só o primeiro cria a topologia (e faz o pingAll)
+    base = args.dir
+    points = list(sweep.expand({}, sweep.parse_assignments(args.session, multi=True)))
+    net = topo = None
+    try:
+        for params in points:
+            try:
+                session.assign(args, params)
+            except ValueError as e:
+                parser.error(str(e))
+            args.dir = os.path.join(base, session.point_dir(params))
+            print("=== Ponto da sessão: %s ===" % args.dir)
+            prepare_dir()
+            new = BBTopo(aqm=aqm.from_args(args))
+            if net is None:
+                net = start_net(new)
+            else:
+                reconfigure(net, topo, new)
+            topo = new
+            experiment(net, topo)
+            if args.db:
+                resultsdb.ResultsDB(args.db).import_run(args.dir)
+    finally:
+        if net is not None:
+            net.stop()
+
+
 if __name__ == "__main__":
-    bufferbloat()
+    if args.session:
+        run_session()
+    else:
+        bufferbloat()
+        if args.db:
+            resultsdb.ResultsDB(args.db).import_run(args.dir)
@@ -6,16 +6,24 @@ from mininet.log import lg, info
 from mininet.util import dumpNodeConnections
 from mininet.cli import CLI
 
-from subprocess import Popen, PIPE
+from subprocess import Popen
 from time import sleep, time
-from multiprocessing import Process
 from argparse import ArgumentParser
 
-from monitor import monitor_qlen
+from sampler import start_sampler
+from tsfile import clock, set_epoch
+from parsers import IPERF_LAUNCH
+import fidelity
+import aqm
+import resultsdb
+import scenario
+import session
+import sweep
 
 import sys
 import os
 import math
+import json
 
 parser = ArgumentParser(description="Bufferbloat tests")
 parser.add_argument('--bw-host', '-B',
@@ -54,35 +62,98 @@ parser.add_argument('--cong',
                     help="Congestion control algorithm to use",
                     default="reno")
 
+parser.add_argument('--ping-interval',
+                    type=float,
+                    help="Seconds between RTT probes (rttprobe.py, down to 0.001)",
+                    default=0.1)
+
+# Estado TCP (cwnd, srtt, taxa de pacing, estado do BBR) de cada fluxo do
+# iperf, lido do kernel via sock_diag (tcpinfo.py) em tcp_<host>.txt
+parser.add_argument('--tcpinfo-interval',
+                    type=float,
+                    help="Seconds between tcp_info samples of the iperf flows (0 disables)",
+                    default=0.01)
+
+# Captura só dos cabeçalhos (snaplen) dos pacotes que entram no switch do
+# gargalo e dos que saem do enlace do gargalo, para o pcapstream.py
+parser.add_argument('--pcap',
+                    action='store_true',
+                    help="Capture headers on both sides of the bottleneck (tcpdump)")
+
+parser.add_argument('--snaplen',
+                    type=int,
+                    help="Bytes captured per packet with --pcap",
+                    default=96)
+
+# Intervalo dos relatórios do iperf nos cenários de competição
+parser.add_argument('--iperf-interval',
+                    type=float,
+                    help="Seconds between iperf reports of each flow (CSV, -y C)",
+                    default=0.1)
+
 # Parâmetros para cenários de competição TCP
 parser.add_argument('--competition',
                     action='store_true',
                     help="Enable TCP competition scenarios")
 
+# Cenários descritos em scenarios/<nome>.json (ver scenario.py): fluxos,
+# algoritmos, instantes de início/fim, RTT e hosts de cada fluxo
 parser.add_argument('--scenario',
                     type=str,
-                    choices=['reno_vs_bbr', 'dual_reno_vs_dual_bbr', 'dual_reno_vs_bbr', 'reno_vs_cubic'],
                     default='reno_vs_bbr',
-                    help="""Competition scenario to run:
-                    - reno_vs_bbr: 1 Reno vs 1 BBR
-                    - dual_reno_vs_dual_bbr: 2 Reno vs 2 BBR  
-                    - dual_reno_vs_bbr: 2 Reno vs 1 BBR
-                    - reno_vs_cubic: 1 Reno vs 1 Cubic""")
+                    help="Competition scenario: a name in scenarios/ (%s) or a "
+                         "JSON/YAML file" % ', '.join(scenario.available()))
+
+# Disciplina de fila do gargalo (aqm.py): fq_codel, codel, pie, cake ou
+# red, instalada via tc abaixo do netem depois que o enlace é criado;
+# 'none' mantém a fila drop-tail de --maxq pacotes
+aqm.add_arguments(parser)
+
+# Banco SQLite de resultados (resultsdb.py) onde a execução é importada
+# ao final; config.json com todos os parâmetros é gravado de qualquer forma
+parser.add_argument('--db',
+                    help="Import the run into this results database when done")
+
+# Número da repetição (repeat.py): não muda o experimento, só distingue
+# execuções repetidas da mesma configuração no cache do sweep.py e no
+# config.json
+parser.add_argument('--trial',
+                    type=int,
+                    help="Repetition number of the configuration",
+                    default=0)
+
+# Sessão (session.py): a topologia é criada uma vez e cada ponto só
+# reconfigura o tc dos enlaces, sem recriar a rede; cada ponto vai para
+# <dir>/<parâmetros do ponto>
+parser.add_argument('--session',
+                    nargs='+',
+                    metavar='NAME=V1,V2',
+                    help="Run every combination of these values on one warm topology")
 
 # Parâmetros do experimento
 args = parser.parse_args()
 
+try:
+    scen = scenario.load(args.scenario)
+    delays = scenario.access_delays(scen, args.delay)
+except ValueError as e:
+    parser.error(str(e))
+
 
 class CompTopo(Topo):
     "Topologia para experimentos de competição TCP."
 
-    def build(self, n=4):
-        # Criação de hosts baseada no cenário de competição
+    def build(self, scen=None, aqm=None):
+        # Disciplina de fila do gargalo (None = drop-tail); aplicada via tc
+        # depois que o enlace existe, ver setup_aqm()
+        self.aqm = aqm
+
+        # Criação dos hosts do cenário: clientes na ordem do arquivo e,
+        # por último, o servidor
         hosts = []
         if args.competition:
-            # Para cenários de competição, criar múltiplos hosts
-            for i in range(1, n+1):
-                host = self.addHost(f'h{i}')
+            for name in scen.hosts + [scen.server]:
+                host = self.addHost(name)
                 hosts.append(host)
 
         # Criação do switch s0 para clientes, e s1 para o server
@@ -95,9 +166,11 @@ class CompTopo(Topo):
         # Configuração dos links com características específicas:
         if args.competition:
             # Múltiplos clientes conectados ao switch s0
-            for i, host in enumerate(hosts[:-1], 1):
-                # Clientes: alta largura de banda (sem gargalo)
-                self.addLink(host, switch_cliente, bw=args.bw_host, delay=delay_ms)
+            for host in hosts[:-1]:
+                # Clientes: alta largura de banda (sem gargalo); o atraso
+                # do enlace de acesso dá a cada host o RTT pedido no cenário
+                self.addLink(host, switch_cliente, bw=args.bw_host,
+                             delay=f"{delays[host]}ms")
             
             # Link entre o servidor e o switch s1  
             self.addLink(hosts[-1], switch_server, bw=args.bw_host, delay=delay_ms)
@@ -109,86 +182,154 @@ class CompTopo(Topo):
 def start_iperf_competition(net):
     """Inicia fluxos TCP competindo com diferentes algoritmos de congestionamento"""
     print("=== CENÁRIO DE COMPETIÇÃO TCP ===")
-    print(f"Cenário: {args.scenario}")
-    
-    # Determina os algoritmos a serem usados baseado no cenário
-    if args.scenario == 'reno_vs_bbr':
-        # Cenário 1: 1 fluxo Reno vs 1 fluxo BBR (competição básica)
-        flows = [('h1', 'reno'), ('h2', 'bbr')]
-        server_host = 'h3'
-    elif args.scenario == 'dual_reno_vs_dual_bbr':
-        # Cenário 2: 2 fluxos Reno vs 2 fluxos BBR (competição balanceada)
-        flows = [('h1', 'reno'), ('h2', 'reno'), ('h3', 'bbr'), ('h4', 'bbr')]
-        server_host = 'h5'
-    elif args.scenario == 'dual_reno_vs_bbr':
-        # Cenário 3: 2 fluxos Reno vs 1 fluxo BBR (competição desbalanceada)
-        flows = [('h1', 'reno'), ('h2', 'reno'), ('h3', 'bbr')]
-        server_host = 'h4'
-    elif args.scenario == 'reno_vs_cubic':
-        # Cenário 4: 1 fluxo Reno vs 1 fluxo Cubic
-        flows = [('h1', 'reno'), ('h2', 'Cubic')]
-        server_host = 'h3'
+    print(f"Cenário: {scen.name} ({scen.description}), {len(scen.flows)} fluxos")
     
     # Inicia servidor iperf no host de destino
-    server = net.get(server_host)
-    print(f"Iniciando servidor iperf em {server_host}...")
+    server = net.get(scen.server)
+    print(f"Iniciando servidor iperf em {scen.server}...")
     server_proc = server.popen("iperf -s -w 16m -p 5001")
-    sleep(1)
+    session.wait_listening(server, 5001)
     
     # Inicia clientes com diferentes algoritmos TCP
+    # Todos são lançados de uma vez; cada um espera o seu instante de
+    # início (start do cenário, por padrão 0.5 s entre fluxos para evitar
+    # sincronização) e roda até o stop, ou até o fim do experimento
     clients = []
-    for i, (host_name, tcp_algo) in enumerate(flows):
-        client = net.get(host_name)
-        print(f"Iniciando cliente {host_name} com TCP {tcp_algo.upper()}...")
-        
-        # Configura algoritmo TCP no host cliente
-        client.cmd(f"sysctl -w net.ipv4.tcp_congestion_control={tcp_algo}")
+    # Instante de partida de cada cliente no relógio do experimento: os
+    # relatórios do iperf são datados por ele mais o fim do intervalo, pois
+    # o timestamp CSV do iperf 2.0.x tem resolução de 1 s (parsers.py)
+    launch = {}
+    for flow in scen.flows:
+        client = net.get(flow.host)
+        print(f"Iniciando fluxo {flow.name} (TCP {flow.cc.upper()}) em {flow.start:.2f}s...")
         
-        # Inicia iperf client com porta específica e logging
+        # O algoritmo TCP é escolhido por socket (-Z), pois vários fluxos
+        # podem dividir um mesmo host
+        # Relatórios em CSV (-y C) a cada --iperf-interval, com timestamp,
+        # para a análise de justiça ao longo do tempo (fairness.py)
         port = 5001
-        log_file = f"{args.dir}/iperf_{host_name}_{tcp_algo}.txt"
-        client_proc = client.popen(f"iperf -c {server.IP()} -p {port} --time {2*args.time} -i 5 > {log_file}", shell=True)
-        clients.append((host_name, tcp_algo, client_proc))
-        
-        # Pequeno delay entre inícios para evitar sincronização
-        sleep(0.5)
+        duration = 2 * args.time if flow.stop is None else flow.stop - flow.start
+        log_file = f"{args.dir}/iperf_{flow.name}.txt"
+        launch[os.path.basename(log_file)] = clock() + flow.start
+        client_proc = client.popen(f"sleep {flow.start}; exec iperf -c {server.IP()} -p {port} -Z {flow.cc} --time {duration} -i {args.iperf_interval} -y C > {log_file}", shell=True)
+        clients.append((flow.host, flow.cc, client_proc))
+    with open(os.path.join(args.dir, IPERF_LAUNCH), 'w') as f:
+        json.dump(launch, f, indent=1)
     
     return server_proc, clients
 
 
-def start_qmon(iface, interval_sec=0.1, outfile="buffer.txt"):
-    monitor = Process(target=monitor_qlen,
-                      args=(iface, interval_sec, outfile))
-    monitor.start()
-    return monitor
-
-
-def start_ping(net):
-    # Inicia sequência de pings de h1 para h2 para medir RTT
-    # Ping a cada 0.1 segundos (-i 0.1) para capturar variações de latência
-    # Saída redirecionada para arquivo ping.txt para análise posterior
-    h1 = net.get('h1')
-    h2 = net.get('h2')
-    h1.popen("ping -i 0.1 " + str(h2.IP()) + " > " + args.dir + "/ping.txt", shell=True)
+def bottleneck_iface(net):
+    # Porta de s0 no enlace s0-s1 (o gargalo)
+    s0 = net.get('s0')
+    s1 = net.get('s1')
+    link = net.linksBetween(s0, s1)[0]
+    return (link.intf1 if link.intf1.node == s0 else link.intf2).name
+
+
+def start_qmon(iface, interval_sec=0.1, outfile="buffer.txt", probes=()):
+    # Um único processo amostra a fila e as demais sondas em deadlines
+    # absolutos (ver sampler.py), em vez de um processo por monitor
+    return start_sampler([('qdisc', iface, interval_sec, outfile)] + list(probes))
+
+
+def setup_aqm(net, topo, iface):
+    # Instala a AQM da topologia na porta do gargalo e devolve a sonda que
+    # registra as estatísticas dela (aqm.txt); buffer.txt continua sendo o
+    # netem, que conta também os pacotes da AQM
+    if topo.aqm is None:
+        return []
+    print("AQM no gargalo: %s" % aqm.apply(net.get('s0'), topo.aqm, iface,
+                                           args.maxq, args.dir))
+    return [('aqm', iface, 0.1, '%s/aqm.txt' % args.dir, aqm.HANDLE)]
+
+
+def host_probes(net, interval_sec=0.1):
+    # Taxas de todas as interfaces (portas dos switches e dos hosts) numa
+    # única leitura, estatísticas TCP de cada host e tcp_info dos fluxos
+    # do iperf (porta 5001), no mesmo relógio das amostras da fila
+    ifaces = [intf.name for sw in net.switches for intf in sw.intfList()
+              if intf.name != 'lo']
+    ifaces += [(intf.name, host.pid) for host in net.hosts
+               for intf in host.intfList() if intf.name != 'lo']
+    probes = [('linkrate', ifaces, interval_sec, '%s/rate_%%s.txt' % args.dir),
+              ('syscpu', interval_sec, '%s/cpu.txt' % args.dir)]
+    for host in net.hosts:
+        probes.append(('sockstat', host.pid, interval_sec,
+                       '%s/sock_%s.txt' % (args.dir, host.name)))
+        # Uso de CPU do cgroup de cada host, para o veredito de fidelidade
+        probes.append(('hostcpu', host.pid, interval_sec,
+                       '%s/cpu_%s.txt' % (args.dir, host.name)))
+        if args.tcpinfo_interval > 0:
+            probes.append(('tcpinfo', host.pid, args.tcpinfo_interval,
+                           '%s/tcp_%s.txt' % (args.dir, host.name), 5001))
+    return probes
+
+
+def check_fidelity(iface):
+    # Veredito de fidelidade da emulação (fidelity.py): CPU dos hosts e da
+    # máquina, softirq, deadlines perdidos pelo amostrador e taxa do
+    # gargalo comparada com --bw-net.  Um 'fail' indica que a máquina, e
+    # não a rede emulada, limitou o experimento
+    report = fidelity.assess(args.dir, args.bw_net, iface)
+    with open('%s/fidelity.json' % args.dir, 'w') as f:
+        json.dump(report, f, indent=1)
+    print("Fidelidade da emulação: %s" % report['verdict'].upper())
+    for c in report['checks']:
+        if c['status'] in ('warn', 'fail'):
+            print("  %s (%s): %.3f, %s" % (c['check'], c['status'], c['value'],
+                                           c['detail']))
+    return report
+
+
+def tcpdump(node, iface, outfile):
+    # Só pacotes recebidos (-Q in), truncados em --snaplen bytes
+    return node.popen("tcpdump -i %s -Q in -n -s %d -B 16384 -w %s tcp" %
+                      (iface, args.snaplen, outfile))
+
+
+def start_pcap(net):
+    # Entrada: pacotes dos clientes chegando em s0 (s0-eth1..), antes da
+    # fila do gargalo; saída: pacotes chegando em s1 pelo enlace do gargalo.
+    # pcapstream.py casa as capturas para obter o tempo de
+    # permanência na fila e os descartes de cada pacote
+    s0 = net.get('s0')
+    s1 = net.get('s1')
+    clients = [intf.name for intf in s0.intfList() if intf.name != 'lo' and
+               s1 not in (intf.link.intf1.node, intf.link.intf2.node)]
+    captures = [tcpdump(s0, iface, '%s/pcap_in_%s.pcap' % (args.dir, iface))
+                for iface in clients]
+    link = net.linksBetween(s0, s1)[0]
+    out = (link.intf2 if link.intf2.node == s1 else link.intf1).name
+    captures.append(tcpdump(s1, out, '%s/pcap_out_%s.pcap' % (args.dir, out)))
+    return captures
+
+
+def start_ping(net, server_host, outfile):
+    # Inicia o prober de RTT (rttprobe.py) do host 'ping' do cenário (por
+    # padrão o do primeiro fluxo) para o servidor
+    # Cada sonda registra instantes de envio e recebimento; perdas aparecem
+    # explicitamente (rtt = nan) em vez de serem ignoradas
+    h1 = net.get(scen.ping)
+    server = net.get(server_host)
+    return h1.popen("python3 rttprobe.py -i %s -w %d -o %s %s" %
+                    (args.ping_interval, args.time + 30, outfile, server.IP()))
 
 
-def bufferbloat():
+def prepare_dir():
     if not os.path.exists(args.dir):
         os.makedirs(args.dir)
-    
-    # Determina topologia baseada no modo
-    if args.competition:
-        if args.scenario == 'dual_reno_vs_dual_bbr':
-            # 2 Reno + 2 BBR + 1 servidor = 5 hosts
-            num_hosts = 5
-        elif args.scenario == 'dual_reno_vs_bbr':
-            # 2 Reno + 1 BBR + 1 servidor = 4 hosts
-            num_hosts = 4
-        else:
-            # Para reno_vs_bbr e reno_vs_cubic: 3 hosts (2 clientes + 1 servidor)
-            num_hosts = 3
-        topo = CompTopo(n=num_hosts)
-    
+    # Época do experimento: todos os processos iniciados a partir daqui
+    # (amostrador, rttprobe, webload, tcpinfo, servidor web) carimbam suas
+    # amostras no mesmo relógio monotônico (tsfile.clock); os timestamps
+    # CSV do iperf são do relógio de parede, que só se afasta deste pelos
+    # ajustes do NTP durante a execução
+    set_epoch()
+    # Parâmetros, ambiente e época da execução, lidos pelo resultsdb.py
+    resultsdb.write_config(args.dir, args, __file__)
+
+
+def start_net(topo):
     net = Mininet(topo=topo, host=CPULimitedHost, link=TCLink, controller=Controller)
     net.start()
     
@@ -196,31 +337,43 @@ def bufferbloat():
     dumpNodeConnections(net.hosts)
     # Teste básico de conectividade entre todos os hosts
     net.pingAll()
-
+    return net
+
+
+def reconfigure(net, old, new):
+    # Entre pontos da sessão: espera as filas esvaziarem, muda banda,
+    # atraso e tamanho de fila dos enlaces no próprio tc (conferindo o
+    # resultado via rtnetlink), remove a AQM se o novo ponto não tem e
+    # limpa as métricas TCP guardadas pelo kernel no ponto anterior.
+    # O algoritmo de cada fluxo é escolhido por socket (-Z)
+    start = time()
+    session.drain(net)
+    changed = session.relink(net, old, new)
+    if old.aqm is not None and new.aqm is None:
+        aqm.remove(net.get('s0'), bottleneck_iface(net))
+    session.flush_tcp_metrics(net)
+    print("Topologia reconfigurada em %.1f ms (%s)" %
+          ((time() - start) * 1e3, ', '.join(changed) or 'enlaces inalterados'))
+
+
+def experiment(net, topo):
     # Inicia monitoramento do tamanho da fila do switch
-    # Para competição, monitora a interface do servidor (última interface)
-    if args.competition:
-        interface = 's1-eth2'  # Interface do servidor (h5)
+    # A fila que enche é a da porta de s0 em direção a s1 (sentido dos
+    # dados); a porta de s1 em direção a s0 só carrega ACKs
+    interface = bottleneck_iface(net)
     
-    qmon = start_qmon(iface=interface, outfile='%s/buffer.txt' % (args.dir))
+    qmon = start_qmon(iface=interface, outfile='%s/buffer.txt' % (args.dir),
+                      probes=setup_aqm(net, topo, interface) + host_probes(net))
 
     if args.competition:
         # Modo competição: inicia fluxos TCP competindo
-        print(f"\n=== INICIANDO CENÁRIO DE COMPETIÇÃO: {args.scenario.upper()} ===")
+        print(f"\n=== INICIANDO CENÁRIO DE COMPETIÇÃO: {scen.name.upper()} ===")
+        captures = start_pcap(net) if args.pcap else []
         server_proc, clients = start_iperf_competition(net)
         
-        # Inicia ping apenas do primeiro cliente para o servidor
-        if args.scenario == 'dual_reno_vs_dual_bbr':
-            server_host = 'h5'
-        elif args.scenario == 'dual_reno_vs_bbr':
-            server_host = 'h4'
-        else:
-            server_host = 'h3'
-        
-        h1 = net.get('h1')
-        server = net.get(server_host)
-        print(f"Iniciando monitoramento de latência de h1 para {server_host}...")
-        h1.popen(f"ping -i 0.1 {server.IP()} > {args.dir}/ping_competition.txt", shell=True)
+        # Inicia ping apenas de um cliente para o servidor
+        print(f"Iniciando monitoramento de latência de {scen.ping} para {scen.server}...")
+        ping = start_ping(net, scen.server, f"{args.dir}/ping_competition.txt")
         
         # Aguarda experimento terminar
         print(f"\nExperimento rodando por {args.time} segundos...")
@@ -234,62 +387,98 @@ def bufferbloat():
                 client_proc.terminate()
             except:
                 pass
+        ping.terminate()
+        for proc in captures:
+            proc.terminate()
 
     # CLI desabilitada para execução automática
     # CLI(net)
 
     # Finalização do experimento
     qmon.terminate()
-    net.stop()
+    qmon.join()
+    check_fidelity(interface)
     
     # Limpeza de processos
     if not args.competition:
         Popen("pgrep -f webserver.py | xargs kill -9", shell=True).wait()
 
+
+def bufferbloat():
+    prepare_dir()
+    # Topologia derivada do cenário (hosts, servidor e atrasos de acesso)
+    topo = CompTopo(scen=scen, aqm=aqm.from_args(args))
+    net = start_net(topo)
+    try:
+        experiment(net, topo)
+    finally:
+        net.stop()
+
+
+def load_scenario():
+    # Cenário e atrasos de acesso dos parâmetros atuais (mudam com
+    # --delay ou --scenario entre pontos da sessão)
+    global scen, delays
+    scen = scenario.load(args.scenario)
+    delays = scenario.access_delays(scen, args.delay)
+
+
+def run_session():
+    # Um ponto por combinação dos valores de --session, todos na mesma
+    # rede: só o primeiro cria a topologia (e faz o pingAll); um ponto
+    # com outros hosts (outro cenário) exigiria recriar a rede
+    base = args.dir
+    points = list(sweep.expand({}, sweep.parse_assignments(args.session, multi=True)))
+    net = topo = None
+    try:
+        for params in points:
+            try:
+                session.assign(args, params)
+                load_scenario()
+            except ValueError as e:
+                parser.error(str(e))
+            args.dir = os.path.join(base, session.point_dir(params))
+            print(f"=== Ponto da sessão: {args.dir} ===")
+            prepare_dir()
+            new = CompTopo(scen=scen, aqm=aqm.from_args(args))
+            if net is None:
+                net = start_net(new)
+            else:
+                reconfigure(net, topo, new)
+            topo = new
+            experiment(net, topo)
+            if args.competition:
+                analyze_tcp_competition()
+            if args.db:
+                resultsdb.ResultsDB(args.db).import_run(args.dir)
+    finally:
+        if net is not None:
+            net.stop()
+
 def analyze_tcp_competition():
     """Analisa os resultados da competição TCP e determina o 'vencedor'"""
     
-    import glob
-    import re
-    
-    # Busca arquivos de log do iperf
-    log_files = glob.glob(f"{args.dir}/iperf_*.txt")
+    from parsers import iperf_throughput
+    import fairness
     
     results = {}
     
-    for log_file in log_files:
-        # Extrai informações do nome do arquivo
-        match = re.search(r'iperf_h(\d+)_(\w+)\.txt', log_file)
-        if not match:
+    # Um log por fluxo do cenário: iperf_<fluxo>.txt
+    for flow in scen.flows:
+        log_file = f"{args.dir}/iperf_{flow.name}.txt"
+        if not os.path.exists(log_file):
             continue
-            
-        host_num = match.group(1)
-        tcp_algo = match.group(2)
         
         try:
-            with open(log_file, 'r') as f:
-                content = f.read()
-                
-            # Busca pela linha de resumo final do iperf
-            # Formato típico: "[  3]  0.0-10.0 sec   113 MBytes  94.9 Mbits/sec"
-            summary_match = re.search(r'\[\s*\d+\]\s+[\d\.-]+\s+sec\s+([\d\.]+)\s+(\w+Bytes)\s+([\d\.]+)\s+(\w+bits/sec)', content)
-            
-            if summary_match:
-                throughput_value = float(summary_match.group(3))
-                throughput_unit = summary_match.group(4)
-                
-                # Converte para Mbits/sec se necessário
-                if 'Gbits' in throughput_unit:
-                    throughput_mbps = throughput_value * 1000
-                elif 'Kbits' in throughput_unit:
-                    throughput_mbps = throughput_value / 1000
-                else:
-                    throughput_mbps = throughput_value
-                    
-                results[f"h{host_num}_{tcp_algo}"] = {
+            # Usa a linha de resumo final do iperf (texto ou CSV -y C)
+            # Sem resumo (iperf interrompido), usa a média dos intervalos
+            throughput_mbps = iperf_throughput(log_file)
+
+            if not math.isnan(throughput_mbps):
+                results[flow.name] = {
                     'throughput_mbps': throughput_mbps,
-                    'host': f"h{host_num}",
-                    'tcp_algo': tcp_algo.upper()
+                    'host': flow.host,
+                    'tcp_algo': flow.cc.upper()
                 }
                 
         except Exception as e:
@@ -304,8 +493,8 @@ def analyze_tcp_competition():
     print("-" * 50)
     total_throughput = 0
     
-    for flow_id, data in sorted(results.items()):
-        print(f"{data['host']} (TCP {data['tcp_algo']}): {data['throughput_mbps']:.2f} Mbits/sec")
+    for flow_id, data in results.items():
+        print(f"{flow_id} (TCP {data['tcp_algo']}): {data['throughput_mbps']:.2f} Mbits/sec")
         total_throughput += data['throughput_mbps']
     
     print("-" * 50)
@@ -316,12 +505,29 @@ def analyze_tcp_competition():
     if len(results) >= 2:
         sorted_results = sorted(results.items(), key=lambda x: x[1]['throughput_mbps'], reverse=True)
         winner = sorted_results[0]
+        runner_up = sorted_results[1]
+        margin = winner[1]['throughput_mbps'] / max(runner_up[1]['throughput_mbps'], 1e-9)
+        print(f"\nVencedor: {winner[0]} (TCP {winner[1]['tcp_algo']}), "
+              f"{margin:.2f}x a vazão de {runner_up[0]} (TCP {runner_up[1]['tcp_algo']})")
         
         # Análise de fairness (justiça)
         throughputs = [data['throughput_mbps'] for data in results.values()]
         fairness_index = calculate_fairness_index(throughputs)
         print(f"\nÍndice de Justiça (Jain's Fairness Index): {fairness_index:.3f}")
         print("(1.0 = perfeitamente justo, menor = mais injusto)")
+        
+        # Justiça ao longo do tempo: índice de Jain por janela, tempo de
+        # convergência e oscilação de cada fluxo (fairness.json / fairness.csv)
+        names = list(results)
+        result, t, jain_t, share = fairness.analyze(
+            [f"{args.dir}/iperf_{name}.txt" for name in names], names,
+            dt=args.iperf_interval,
+            bw_net=args.bw_net)
+        with open(f"{args.dir}/fairness.json", 'w') as f:
+            json.dump(result, f, indent=1)
+        fairness.write_csv(f"{args.dir}/fairness.csv", names, t, jain_t, share)
+        print("\nJustiça ao longo do tempo:")
+        fairness.print_result(result)
 
 
 def calculate_fairness_index(throughputs):
@@ -339,6 +545,11 @@ def calculate_fairness_index(throughputs):
     return (sum_x * sum_x) / (n * sum_x_squared)
 
 if __name__ == "__main__":
-    bufferbloat()
-    if args.competition:
-        analyze_tcp_competition()
+    if args.session:
+        run_session()
+    else:
+        bufferbloat()
+        if args.competition:
+            analyze_tcp_competition()
+        if args.db:
+            resultsdb.ResultsDB(args.db).import_run(args.dir)
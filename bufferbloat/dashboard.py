@@ -0,0 +1,408 @@
+'''
+Live terminal dashboard of a running experiment.
+
+Attaches to the --dir of bufferbloat.py, bufferbloat_competition.py (or
+simulate.py) and follows its output files while they grow: queue
+occupancy from buffer.txt, RTT from ping.txt / ping_competition.txt and
+per-host throughput from the rate_<host>-eth0.txt files of the link-rate
+probe, falling back to the iperf_*.txt interval lines.  Each file is read
+from the offset where the previous read stopped (pread, no seeking of a
+shared offset), so the samplers are never blocked and only new bytes are
+parsed; every series keeps at most --window seconds in a bounded deque.
+A series that stops growing for --stale seconds is flagged, which is how
+a dead iperf or prober shows up early.
+
+    python3 dashboard.py reno-q100
+    python3 dashboard.py competition_results/scenario1_reno_vs_bbr --plain
+'''
+
+import argparse
+import curses
+import glob
+import json
+import os
+import re
+import sys
+from collections import deque
+from time import monotonic, sleep
+
+from tsfile import is_binary, read_header, record_struct
+
+SPARKS = u' ▁▂▃▄▅▆▇█'
+# On attach, only the last part of a long file is read
+ATTACH_BYTES = 256 << 10
+MAX_READ = 4 << 20
+
+_ping_pat = re.compile(r'icmp_seq=(\d+) .*time=([\d.]+)')
+_iperf_pat = re.compile(r'^\[\s*\d+\]\s+([\d.]+)\s*-\s*([\d.]+)\s+sec\s+[\d.]+\s+\w*Bytes\s+'
+                        r'([\d.]+)\s+([KMG]?)bits/sec')
+# iperf -y C: date,src,sport,dst,dport,id,start-end,bytes,bps
+_iperf_csv_pat = re.compile(r'^\d{14}(?:\.\d+)?,[^,]*,\d+,[^,]*,\d+,-?\d+,'
+                            r'([\d.]+)-([\d.]+),\d+,(\d+)')
+_BIT_UNITS = {'': 1e-6, 'K': 1e-3, 'M': 1.0, 'G': 1e3}
+
+
+class Tail(object):
+    """Follows a growing file from the offset of the last read."""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.offset = 0
+        self.rest = b''
+        self.grew_at = monotonic()
+
+    def _open(self):
+        try:
+            self.fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return False
+        size = os.fstat(self.fd).st_size
+        self.offset = self.start_offset(size)
+        return True
+
+    def start_offset(self, size):
+        if size <= ATTACH_BYTES:
+            return 0
+        # Skip to the start of a line near the end
+        data = os.pread(self.fd, 4096, size - ATTACH_BYTES)
+        return size - ATTACH_BYTES + data.find(b'\n') + 1
+
+    def read(self):
+        """New bytes since the last call (b'' if none)."""
+        if self.fd is None and not self._open():
+            return b''
+        size = os.fstat(self.fd).st_size
+        if size < self.offset:
+            # Rewritten by a new run
+            self.offset = 0
+            self.rest = b''
+        if size == self.offset:
+            return b''
+        data = os.pread(self.fd, min(size - self.offset, MAX_READ), self.offset)
+        self.offset += len(data)
+        self.grew_at = monotonic()
+        return data
+
+    def lines(self):
+        """Complete new lines; a trailing partial line waits for the rest."""
+        data = self.rest + self.read()
+        if not data:
+            return []
+        lines = data.split(b'\n')
+        self.rest = lines.pop()
+        return [l.decode('ascii', 'replace') for l in lines]
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class BinaryTail(Tail):
+    """Follows a .bts file, returning whole records only."""
+
+    def _open(self):
+        try:
+            header = read_header(self.path)
+        except (OSError, ValueError):
+            return False
+        self.names = [n for n, _ in header['fields']]
+        self.rec = record_struct(header['fields'])
+        self.header_len = header['header_len']
+        return Tail._open(self)
+
+    def start_offset(self, size):
+        n = (size - self.header_len) // self.rec.size
+        keep = min(n, ATTACH_BYTES // self.rec.size)
+        return self.header_len + (n - keep) * self.rec.size
+
+    def records(self):
+        data = self.rest + self.read()
+        whole = len(data) - len(data) % self.rec.size
+        self.rest = data[whole:]
+        return [dict(zip(self.names, r))
+                for r in self.rec.iter_unpack(data[:whole])]
+
+
+class Series(object):
+    """(time, value) samples of the last `window` seconds."""
+
+    def __init__(self, label, unit, window, maxlen=100000):
+        self.label = label
+        self.unit = unit
+        self.window = window
+        self.points = deque(maxlen=maxlen)
+        self.lost = 0
+        self.count = 0
+
+    def add(self, t, v):
+        self.count += 1
+        if v != v:
+            self.lost += 1
+        self.points.append((t, v))
+        while self.points and self.points[0][0] < t - self.window:
+            self.points.popleft()
+
+    def values(self):
+        return [v for _, v in self.points if v == v]
+
+
+class Source(object):
+    """A file feeding one series, parsed line by line."""
+
+    def __init__(self, path, series, parse):
+        self.tail = BinaryTail(path) if is_binary(path) else Tail(path)
+        self.series = series
+        self.parse = parse
+
+    def poll(self):
+        if isinstance(self.tail, BinaryTail):
+            for r in self.tail.records():
+                self.parse(self.series, r)
+            return
+        for line in self.tail.lines():
+            if line and not line.startswith('#'):
+                try:
+                    self.parse(self.series, line)
+                except (ValueError, IndexError):
+                    continue
+
+
+def parse_buffer(series, line):
+    if isinstance(line, dict):
+        series.add(line['time'], line['qlen'])
+        return
+    f = line.split(',')
+    series.add(float(f[0]), float(f[1]))
+
+
+def parse_probe(series, line):
+    if isinstance(line, dict):
+        series.add(line['time'], line['rtt'])
+        return
+    f = line.split(',')
+    series.add(float(f[0]), float(f[2]))
+
+
+def ping_parser(interval):
+    def parse(series, line):
+        if line.startswith('#'):
+            return
+        m = _ping_pat.search(line)
+        if m is not None:
+            series.add((int(m.group(1)) - 1) * interval, float(m.group(2)))
+    return parse
+
+
+def parse_rate(series, line):
+    if isinstance(line, dict):
+        series.add(line['time'], line['tx_bps'] / 1e6)
+        return
+    f = line.split(',')
+    series.add(float(f[0]), float(f[1]) / 1e6)
+
+
+def parse_iperf(series, line):
+    m = _iperf_pat.search(line)
+    if m is not None:
+        mbps = float(m.group(3)) * _BIT_UNITS[m.group(4)]
+    else:
+        m = _iperf_csv_pat.match(line)
+        if m is None:
+            return
+        mbps = float(m.group(3)) / 1e6
+    start, end = float(m.group(1)), float(m.group(2))
+    if series.points and start < series.points[-1][0] - 1e-6:
+        # Final summary line
+        return
+    series.add(end, mbps)
+
+
+def sparkline(points, width, t_end, window):
+    """Max of the points in each of `width` time bins of the window."""
+    if width <= 0:
+        return ''
+    bins = [None] * width
+    t0 = t_end - window
+    for t, v in points:
+        if v != v or t < t0:
+            continue
+        i = min(width - 1, int((t - t0) / window * width))
+        bins[i] = v if bins[i] is None else max(bins[i], v)
+    vals = [b for b in bins if b is not None]
+    if not vals:
+        return ' ' * width
+    top = max(vals) or 1.0
+    return ''.join(' ' if b is None else
+                   SPARKS[min(len(SPARKS) - 1, 1 + int(b / top * (len(SPARKS) - 2)))]
+                   for b in bins)
+
+
+class Dashboard(object):
+    def __init__(self, path, window=60.0, stale=3.0, ping_interval=0.1,
+                 ifaces='h*-eth0'):
+        self.dir = path
+        self.window = window
+        self.stale = stale
+        self.ping_interval = ping_interval
+        self.ifaces = ifaces
+        self.sources = {}
+        self.params = self.read_params()
+
+    def read_params(self):
+        # Written by sweep.py, absent for plain runs
+        try:
+            with open(os.path.join(self.dir, 'params.json')) as f:
+                return json.load(f).get('params', {})
+        except (OSError, ValueError):
+            return {}
+
+    def add(self, key, path, label, unit, parse):
+        if key not in self.sources:
+            self.sources[key] = Source(path, Series(label, unit, self.window), parse)
+
+    def first(self, *names):
+        for name in names:
+            path = os.path.join(self.dir, name)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def discover(self):
+        """Picks up output files as the experiment creates them."""
+        path = self.first('buffer.bts', 'buffer.txt')
+        if path:
+            self.add('queue', path, 'Queue', 'pkts', parse_buffer)
+        path = self.first('ping.bts', 'ping.txt', 'ping_competition.txt')
+        if path:
+            if is_binary(path):
+                parse = parse_probe
+            else:
+                with open(path) as f:
+                    probe = f.read(1) == '#'
+                parse = parse_probe if probe else ping_parser(self.ping_interval)
+            self.add('rtt', path, 'RTT', 'ms', parse)
+        rates = sorted(glob.glob(os.path.join(self.dir, 'rate_%s.*' % self.ifaces)))
+        for path in rates:
+            name = os.path.basename(path)[5:].rsplit('.', 1)[0]
+            self.add('rate:' + name, path, name + ' tx', 'Mb/s', parse_rate)
+        if not rates:
+            for path in sorted(glob.glob(os.path.join(self.dir, 'iperf_*.txt'))):
+                name = os.path.basename(path)[6:-4]
+                self.add('iperf:' + name, path, name, 'Mb/s', parse_iperf)
+
+    def poll(self):
+        for src in self.sources.values():
+            src.poll()
+
+    def lines(self, width):
+        now = monotonic()
+        head = 'dir %s' % self.dir
+        if self.params:
+            head += '  ' + ' '.join('%s=%s' % kv for kv in sorted(self.params.items()))
+        out = [head[:width], '']
+        if not self.sources:
+            out.append('waiting for output files...')
+        for key in sorted(self.sources, key=lambda k: (k.split(':')[0] != 'queue', k)):
+            src = self.sources[key]
+            s = src.series
+            vals = s.values()
+            if src.tail.fd is None:
+                state = 'missing'
+            elif now - src.tail.grew_at > self.stale:
+                state = 'STALE'
+            else:
+                state = ''
+            if vals:
+                stats = '%8.2f now %8.2f min %8.2f max' % (vals[-1], min(vals), max(vals))
+            else:
+                stats = '%8s now %8s min %8s max' % ('-', '-', '-')
+            if s.lost:
+                stats += ' %5.1f%% lost' % (100.0 * s.lost / s.count)
+            label = '%-14s %-5s %s %s' % (s.label[:14], s.unit, stats, state)
+            out.append(label[:width])
+            t_end = s.points[-1][0] if s.points else 0.0
+            out.append(sparkline(s.points, width - 2, t_end, self.window))
+            out.append('')
+        return out
+
+    def close(self):
+        for src in self.sources.values():
+            src.tail.close()
+
+
+def run_curses(stdscr, dash, hz):
+    curses.curs_set(0)
+    stdscr.nodelay(True)
+    rediscover = 0
+    while True:
+        if rediscover <= 0:
+            dash.discover()
+            rediscover = hz * 2
+        rediscover -= 1
+        dash.poll()
+        height, width = stdscr.getmaxyx()
+        stdscr.erase()
+        lines = dash.lines(width - 1) + ['', 'q: quit']
+        for y, line in enumerate(lines[:height - 1]):
+            stdscr.addstr(y, 0, line)
+        stdscr.refresh()
+        deadline = monotonic() + 1.0 / hz
+        while monotonic() < deadline:
+            if stdscr.getch() in (ord('q'), ord('Q')):
+                return
+            sleep(0.02)
+
+
+def run_plain(dash, hz, count=None):
+    n = 0
+    while count is None or n < count:
+        dash.discover()
+        dash.poll()
+        print('\n'.join(dash.lines(100)))
+        print('-' * 100)
+        sys.stdout.flush()
+        n += 1
+        sleep(1.0 / hz)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live view of an experiment directory")
+    parser.add_argument('dir', help="Output directory of the running experiment")
+    parser.add_argument('--hz', type=float, default=2.0,
+                        help="Refreshes per second")
+    parser.add_argument('--window', type=float, default=60.0,
+                        help="Seconds of history shown")
+    parser.add_argument('--stale', type=float, default=3.0,
+                        help="Flag a series that did not grow for this many seconds")
+    parser.add_argument('--ifaces', default='h*-eth0',
+                        help="Glob of the rate_<iface> files to show")
+    parser.add_argument('--ping-interval', type=float, default=0.1,
+                        help="Interval of plain ping output (no timestamps)")
+    parser.add_argument('--plain', action='store_true',
+                        help="Print text snapshots instead of the curses UI")
+    parser.add_argument('--count', type=int, default=None,
+                        help="With --plain, stop after this many snapshots")
+    args = parser.parse_args()
+
+    # Stay out of the way of the samplers
+    try:
+        os.nice(10)
+    except OSError:
+        pass
+    dash = Dashboard(args.dir, args.window, args.stale, args.ping_interval,
+                     args.ifaces)
+    try:
+        if args.plain or not sys.stdout.isatty():
+            run_plain(dash, args.hz, args.count)
+        else:
+            curses.wrapper(run_curses, dash, args.hz)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dash.close()
+
+
+if __name__ == '__main__':
+    main()
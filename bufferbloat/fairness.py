@@ -0,0 +1,233 @@
+'''
+Time-resolved fairness of competing flows.
+
+Reads the iperf_<flow>.txt logs of a competition run (CSV from
+`iperf -y C -i 0.1`, or the human readable -i output of older runs),
+puts every flow on a common time grid and computes, for all flows at once:
+
+    jain          Jain's index over the flows active at each instant
+    share         per-flow share of the delivered throughput over a
+                  sliding window
+    convergence   time after which every flow stays within --tol of the
+                  fair share (total / active flows) until the end
+    oscillation   per-flow std and p95 - p5 of the windowed throughput
+                  once all flows are running
+
+CSV logs carry a timestamp per report, so flows started at different
+times line up; text logs are aligned on their own start.
+
+    python3 fairness.py competition_results/scenario1_reno_vs_bbr
+    python3 fairness.py sim-s1 --window 2 --tol 0.1 --bw-net 10
+'''
+
+import argparse
+import glob
+import json
+import os
+import re
+
+import numpy as np
+
+from parsers import parse_iperf
+
+_log_pat = re.compile(r'iperf_(.+)\.txt$')
+
+
+def natural_key(s):
+    """Sort key putting h2 before h10."""
+    return [(0, int(p), '') if p.isdigit() else (1, 0, p)
+            for p in re.split(r'(\d+)', s)]
+
+
+def flow_logs(d):
+    """[(flow name, path)] of the iperf client logs of a result directory,
+    flows named as in the scenario (h<N>_<cong>[_<k>] by default)."""
+    logs = []
+    for path in glob.glob(os.path.join(d, 'iperf_*.txt')):
+        m = _log_pat.search(os.path.basename(path))
+        if m:
+            logs.append((m.group(1), path))
+    return sorted(logs, key=lambda l: natural_key(l[0]))
+
+
+def flow_intervals(path):
+    """(origin, start, end, bytes) of the interval reports of one log.
+
+    origin is the epoch of the flow's time 0 when the log has timestamps
+    (the latest time - end: -y C rounds them down, to the second on old
+    iperf), else NaN."""
+    rec = parse_iperf(path).intervals
+    streams = rec[rec['id'] >= 0] if (rec['id'] >= 0).any() else rec
+    stamped = np.isfinite(streams['time'])
+    origin = (streams['time'] - streams['end'])[stamped].max() if stamped.any() \
+        else np.nan
+    return origin, streams['start'], streams['end'], streams['bytes']
+
+
+def load_rates(paths, dt=0.1):
+    """(t, rates): grid times and an (flows, len(t)) matrix of Mb/s, NaN
+    where a flow was not running.  Reports of any length are spread over
+    the grid cells they cover by interpolating the cumulative bytes."""
+    flows = [flow_intervals(p) for p in paths]
+    origins = np.array([f[0] for f in flows])
+    if np.isnan(origins).any():
+        offsets = np.zeros(len(flows))
+    else:
+        offsets = origins - origins.min()
+    ends = [o + f[2].max() for o, f in zip(offsets, flows) if len(f[2])]
+    n = int(np.ceil(max(ends) / dt - 1e-6)) if ends else 0
+    edges = np.arange(n + 1) * dt
+    rates = np.full((len(flows), n), np.nan)
+    for i, (offset, (_, start, end, nbytes)) in enumerate(zip(offsets, flows)):
+        if not len(end):
+            continue
+        order = np.argsort(end)
+        x = np.concatenate([[start[order].min()], end[order]]) + offset
+        y = np.concatenate([[0.0], np.cumsum(nbytes[order])])
+        cum = np.interp(edges, x, y)
+        active = (edges[1:] > x[0] + 1e-9) & (edges[:-1] < x[-1] - 1e-9)
+        rates[i, active] = (np.diff(cum) * 8 / dt / 1e6)[active]
+    return edges[:-1], rates
+
+
+def jain(rates, axis=0):
+    """Jain's index along axis, ignoring NaN (inactive) entries."""
+    n = np.sum(~np.isnan(rates), axis=axis)
+    s = np.nansum(rates, axis=axis)
+    s2 = np.nansum(rates ** 2, axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        j = s ** 2 / (n * s2)
+    j[(n > 0) & (s2 == 0)] = 1.0
+    return j
+
+
+def windowed(rates, cells):
+    """Trailing mean over `cells` grid cells of each flow, counting only
+    the cells where it was active (NaN if none)."""
+    valid = ~np.isnan(rates)
+    pad = np.zeros((rates.shape[0], 1))
+    cs = np.concatenate([pad, np.cumsum(np.where(valid, rates, 0.0), axis=1)], axis=1)
+    cn = np.concatenate([pad, np.cumsum(valid, axis=1)], axis=1)
+    hi = np.arange(1, rates.shape[1] + 1)
+    lo = np.maximum(hi - cells, 0)
+    with np.errstate(invalid='ignore'):
+        mean = (cs[:, hi] - cs[:, lo]) / (cn[:, hi] - cn[:, lo])
+    mean[~valid] = np.nan
+    return mean
+
+
+def shares(rates):
+    """Fraction of the total throughput of each flow at each instant."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return rates / np.nansum(rates, axis=0)
+
+
+def convergence_index(rates, tol):
+    """First grid index from which every active flow stays within
+    tol * fair share until the end, or None."""
+    active = np.sum(~np.isnan(rates), axis=0)
+    fair = np.nansum(rates, axis=0) / np.maximum(active, 1)
+    with np.errstate(invalid='ignore'):
+        ok = np.all(np.isnan(rates) | (np.abs(rates - fair) <= tol * fair), axis=0)
+    ok &= active > 0
+    stays = np.logical_and.accumulate(ok[::-1])[::-1]
+    return int(np.argmax(stays)) if stays.any() else None
+
+
+def analyze(paths, names=None, dt=0.1, window=1.0, tol=0.2, bw_net=None):
+    """Metrics of a set of flow logs; also returns the series for the CSV."""
+    names = names or [os.path.basename(p) for p in paths]
+    t, rates = load_rates(paths, dt)
+    cells = max(1, int(round(window / dt)))
+    smooth = windowed(rates, cells)
+    share = shares(smooth)
+    fairness = jain(smooth)
+    # Period in which every flow is running (competition flows start 0.5 s apart)
+    all_on = np.all(~np.isnan(rates), axis=0)
+    on = np.flatnonzero(all_on)
+    result = {'flows': names, 'dt': dt, 'window': window, 'tol': tol}
+    if len(on):
+        first, last = on[0], on[-1] + 1
+        # Skip the first window, which still averages the ramp-up
+        steady = slice(min(first + cells, last - 1), last)
+        conv = convergence_index(smooth[:, first:last], tol)
+        result.update({
+            'all_active_from': float(t[first]),
+            'convergence_time': None if conv is None else float(t[first + conv] - t[first]),
+            'jain_mean': float(np.nanmean(fairness[first:last])),
+            'jain_min': float(np.nanmin(fairness[steady])),
+        })
+        seg = smooth[:, steady]
+        amp = np.nanpercentile(seg, 95, axis=1) - np.nanpercentile(seg, 5, axis=1)
+        total = np.nansum(rates[:, first:last], axis=1)
+    else:
+        seg = smooth
+        amp = np.full(len(names), np.nan)
+        total = np.nansum(rates, axis=1)
+    mbps = np.nanmean(rates, axis=1)
+    result['per_flow'] = dict(
+        (name, {'mean_mbps': float(mbps[i]),
+                'share': float(total[i] / total.sum()) if total.sum() else None,
+                'std_mbps': float(np.nanstd(seg[i])),
+                'p5_p95_mbps': float(amp[i])})
+        for i, name in enumerate(names))
+    if bw_net:
+        result['utilization'] = float(np.nansum(rates, axis=0)[all_on].mean() / bw_net) \
+            if len(on) else None
+    return result, t, fairness, share
+
+
+def write_csv(fname, names, t, fairness, share):
+    with open(fname, 'w') as f:
+        f.write('# time,jain,' + ','.join('share_' + n for n in names) + '\n')
+        np.savetxt(f, np.column_stack([t, fairness, share.T]), fmt='%.4g',
+                   delimiter=',')
+
+
+def print_result(result):
+    for name, m in result['per_flow'].items():
+        print('%-12s %8.2f Mb/s  share %5s  std %6.2f  p5-p95 %6.2f Mb/s' % (
+            name, m['mean_mbps'],
+            '-' if m['share'] is None else '%.3f' % m['share'],
+            m['std_mbps'], m['p5_p95_mbps']))
+    if 'jain_mean' in result:
+        conv = result['convergence_time']
+        print("Jain's index over %.1f s windows: mean %.3f, min %.3f"
+              % (result['window'], result['jain_mean'], result['jain_min']))
+        print('Convergence to within %d%% of the fair share: %s'
+              % (result['tol'] * 100,
+                 'never' if conv is None else '%.1f s after the last flow started' % conv))
+    if result.get('utilization') is not None:
+        print('Utilization: %.1f%%' % (result['utilization'] * 100))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fairness over time of competing flows")
+    parser.add_argument('dir', help="Result directory with iperf_<flow>.txt logs")
+    parser.add_argument('--dt', type=float, default=0.1,
+                        help="Grid resolution in seconds")
+    parser.add_argument('--window', type=float, default=1.0,
+                        help="Sliding window for shares and fairness (s)")
+    parser.add_argument('--tol', type=float, default=0.2,
+                        help="Relative distance to the fair share for convergence")
+    parser.add_argument('--bw-net', '-b', type=float, default=None,
+                        help="Bottleneck rate (Mb/s), to report utilization")
+    parser.add_argument('--out', '-o', default=None,
+                        help="Prefix of the outputs (default <dir>/fairness)")
+    args = parser.parse_args()
+
+    logs = flow_logs(args.dir)
+    if not logs:
+        parser.error('no iperf_<flow>.txt in %s' % args.dir)
+    names = [n for n, _ in logs]
+    result, t, fairness, share = analyze([p for _, p in logs], names, args.dt,
+                                         args.window, args.tol, args.bw_net)
+    out = args.out or os.path.join(args.dir, 'fairness')
+    with open(out + '.json', 'w') as f:
+        json.dump(result, f, indent=1)
+    write_csv(out + '.csv', names, t, fairness, share)
+    print_result(result)
+
+
+if __name__ == '__main__':
+    main()
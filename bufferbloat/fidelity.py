@@ -0,0 +1,362 @@
+'''
+Emulation fidelity: was the machine, rather than the emulated network,
+the bottleneck of a run?
+
+Mininet results are only meaningful while every host, switch port and
+sampler keeps up in real time.  Two sampler probes record the evidence:
+
+    ('hostcpu', pid, interval_sec, fname)   CPU time of the cgroup of a
+                                            Mininet host (cgroup v1 or v2)
+                                            and how long it was throttled
+    ('syscpu', interval_sec, fname)         /proc/stat: mean and busiest
+                                            core, softirq and steal time
+
+and assess() grades a result directory once the run is over:
+
+    core_busy        p95 of the busiest core's utilization
+    softirq          p95 of the busiest core's softirq share (packet
+                     processing of the veth pairs and qdiscs)
+    steal            p95 of the mean steal time (a VM losing its CPUs)
+    host_cpu         p95 of a host's cgroup usage over its CPU limit
+                     (CFS quota, or the cores it may run on)
+    host_throttled   share of the run a host's cgroup was throttled
+    sampler_missed   share of the sampling deadlines missed, worst file
+    bottleneck_rate  rate of the bottleneck port while its queue was
+                     backlogged, against --bw-net: below it the emulator
+                     could not serve the link, above it shaping failed
+
+Each check passes, warns or fails against THRESHOLDS; the verdict is the
+worst of them.  Checks without data are reported as 'skip', and a run
+without any CPU, host or rate evidence (the sampler alone cannot tell
+whether the machine kept up) gets at least a warning.
+
+    python3 fidelity.py reno-q100 --bw-net 1.5 --iface s0-eth2
+'''
+
+import argparse
+import glob
+import json
+import os
+from time import monotonic
+
+import numpy as np
+
+from parsers import load
+
+# (warn, fail) on the value of each check; higher is worse
+THRESHOLDS = {
+    'core_busy': (0.85, 0.95),
+    'softirq': (0.25, 0.5),
+    'steal': (0.05, 0.2),
+    'host_cpu': (0.9, 0.98),
+    'host_throttled': (0.01, 0.05),
+    'sampler_missed': (0.01, 0.05),
+    'bottleneck_rate': (0.05, 0.1),
+}
+STATUSES = ['skip', 'pass', 'warn', 'fail']
+# Queue length (packets) above which the bottleneck must be busy
+BACKLOGGED = 2
+
+
+class CgroupCpu(object):
+    """CPU usage of the cgroup of a process.
+
+    read() returns the cumulative (usage_sec, nr_throttled,
+    throttled_sec); limit is the CPU share it may use, in cores."""
+
+    def __init__(self, pid, root='/sys/fs/cgroup'):
+        v1 = {}
+        v2 = None
+        with open('/proc/%d/cgroup' % pid) as f:
+            for line in f:
+                _, controllers, path = line.rstrip('\n').split(':', 2)
+                if controllers:
+                    for c in controllers.split(','):
+                        v1[c] = (controllers, path)
+                else:
+                    v2 = path
+        self.fds = {}
+        if 'cpuacct' in v1:
+            acct = self._dir(root, 'cpuacct', *v1['cpuacct'])
+            cpu = self._dir(root, 'cpu', *v1.get('cpu', v1['cpuacct']))
+            self.version = 1
+            self._open('usage', acct, 'cpuacct.usage')
+            self._open('stat', cpu, 'cpu.stat')
+            quota = self._read_file(cpu, 'cpu.cfs_quota_us')
+            period = self._read_file(cpu, 'cpu.cfs_period_us')
+            quota = int(quota) if quota else -1
+            period = int(period) if period else 100000
+        elif v2 is not None:
+            d = os.path.join(root, v2.lstrip('/'))
+            self.version = 2
+            self._open('stat', d, 'cpu.stat')
+            cpu_max = (self._read_file(d, 'cpu.max') or 'max 100000').split()
+            quota = -1 if cpu_max[0] == 'max' else int(cpu_max[0])
+            period = int(cpu_max[1])
+        else:
+            raise ValueError('pid %d: no cpu cgroup' % pid)
+        cores = len(os.sched_getaffinity(pid))
+        self.limit = min(cores, quota / float(period)) if quota > 0 else float(cores)
+
+    @staticmethod
+    def _dir(root, controller, controllers, path):
+        for mount in (controllers, controller, 'cpu,cpuacct'):
+            d = os.path.join(root, mount, path.lstrip('/'))
+            if os.path.isdir(d):
+                return d
+        raise ValueError('no %s cgroup directory for %s' % (controller, path))
+
+    @staticmethod
+    def _read_file(d, name):
+        try:
+            with open(os.path.join(d, name)) as f:
+                return f.read().strip()
+        except IOError:
+            return None
+
+    def _open(self, key, d, name):
+        path = os.path.join(d, name)
+        if os.path.exists(path):
+            self.fds[key] = os.open(path, os.O_RDONLY)
+
+    def read(self):
+        stat = {}
+        if 'stat' in self.fds:
+            for line in os.pread(self.fds['stat'], 4096, 0).split(b'\n'):
+                f = line.split()
+                if len(f) == 2:
+                    stat[f[0].decode()] = int(f[1])
+        if self.version == 1:
+            usage = int(os.pread(self.fds['usage'], 64, 0)) / 1e9
+            throttled = stat.get('throttled_time', 0) / 1e9
+        else:
+            usage = stat.get('usage_usec', 0) / 1e6
+            throttled = stat.get('throttled_usec', 0) / 1e6
+        return usage, stat.get('nr_throttled', 0), throttled
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+
+
+class HostCpuSampler(object):
+    """Cores used by a host's cgroup between two samples."""
+
+    def __init__(self, pid):
+        self.cgroup = CgroupCpu(pid)
+        self.last = None
+
+    def sample(self):
+        """(usage cores, limit cores, nr_throttled, throttled_sec), None on
+        the first call."""
+        now = monotonic()
+        usage, nr, throttled = self.cgroup.read()
+        prev, self.last = self.last, (now, usage)
+        if prev is None or now <= prev[0]:
+            return None
+        return ((usage - prev[1]) / (now - prev[0]), self.cgroup.limit, nr,
+                throttled)
+
+    def close(self):
+        self.cgroup.close()
+
+
+# /proc/stat columns after the cpuN label
+USER, NICE, SYSTEM, IDLE, IOWAIT, IRQ, SOFTIRQ, STEAL = range(8)
+
+
+def parse_proc_stat(data):
+    """(cpus, 8) array of the per-core jiffies of /proc/stat contents."""
+    rows = [l.split()[1:9] for l in data.split(b'\n')
+            if l.startswith(b'cpu') and l[3:4].isdigit()]
+    return np.array(rows, dtype=np.int64)
+
+
+class SysCpuSampler(object):
+    """Per-core utilization from /proc/stat, reduced to the mean and the
+    busiest core."""
+
+    def __init__(self):
+        self.fd = os.open('/proc/stat', os.O_RDONLY)
+        self.prev = None
+
+    def sample(self):
+        """(busy_mean, busy_max, softirq_mean, softirq_max, steal_mean) as
+        fractions, None on the first call."""
+        cur = parse_proc_stat(os.pread(self.fd, 1 << 20, 0))
+        prev, self.prev = self.prev, cur
+        if prev is None or prev.shape != cur.shape:
+            return None
+        d = (cur - prev).astype(float)
+        total = np.maximum(d.sum(axis=1), 1)
+        # A core without a tick in the interval counts as idle
+        busy = (total - d[:, IDLE] - d[:, IOWAIT]) / total * (d.sum(axis=1) > 0)
+        softirq = d[:, SOFTIRQ] / total
+        return (busy.mean(), busy.max(), softirq.mean(), softirq.max(),
+                (d[:, STEAL] / total).mean())
+
+    def close(self):
+        os.close(self.fd)
+
+
+def grade(value, name, thresholds=THRESHOLDS):
+    warn, fail = thresholds[name]
+    if value is None or np.isnan(value):
+        return 'skip'
+    return 'fail' if value >= fail else 'warn' if value >= warn else 'pass'
+
+
+def check(name, value, detail, thresholds=THRESHOLDS):
+    warn, fail = thresholds[name]
+    value = None if value is None or np.isnan(value) else float(value)
+    return {'check': name, 'status': grade(value, name, thresholds),
+            'value': value, 'warn': warn, 'fail': fail, 'detail': detail}
+
+
+def series_file(d, name):
+    """Path of a sampler output, text or .bts, or None."""
+    for ext in ('.txt', '.bts'):
+        path = os.path.join(d, name + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def p95(x):
+    x = np.asarray(x, dtype=float)
+    x = x[~np.isnan(x)]
+    return np.percentile(x, 95) if len(x) else np.nan
+
+
+def system_checks(d, thresholds=THRESHOLDS):
+    path = series_file(d, 'cpu')
+    if path is None:
+        return [check(n, None, 'no cpu.txt', thresholds)
+                for n in ('core_busy', 'softirq', 'steal')]
+    s = load(path, 'syscpu')
+    return [
+        check('core_busy', p95(s['busy_max']),
+              'busiest core, p95 over %d samples (mean over cores %.2f)'
+              % (len(s), np.mean(s['busy_mean']) if len(s) else np.nan), thresholds),
+        check('softirq', p95(s['softirq_max']),
+              'softirq share of the busiest core, p95', thresholds),
+        check('steal', p95(s['steal_mean']), 'mean steal time, p95', thresholds),
+    ]
+
+
+def host_checks(d, thresholds=THRESHOLDS):
+    usage, throttled = [], []
+    for path in sorted(glob.glob(os.path.join(d, 'cpu_*.txt')) +
+                       glob.glob(os.path.join(d, 'cpu_*.bts'))):
+        host = os.path.splitext(os.path.basename(path))[0][len('cpu_'):]
+        s = load(path, 'hostcpu')
+        if len(s) < 2:
+            continue
+        span = s['time'][-1] - s['time'][0]
+        usage.append((p95(s['usage'] / s['limit']), host, s['limit'][-1]))
+        throttled.append(((s['throttled_sec'][-1] - s['throttled_sec'][0]) /
+                          max(span, 1e-9), host))
+    if not usage:
+        return [check(n, None, 'no cpu_<host>.txt', thresholds)
+                for n in ('host_cpu', 'host_throttled')]
+    u = max(usage)
+    t = max(throttled)
+    return [
+        check('host_cpu', u[0], '%s, p95 of its usage over a limit of %.2f cores'
+              % (u[1], u[2]), thresholds),
+        check('host_throttled', t[0], '%s, share of the run throttled' % t[1],
+              thresholds),
+    ]
+
+
+def missed_fraction(s):
+    """Missed deadlines over the deadlines of a sampler output."""
+    samples = len(np.unique(s['time']))
+    missed = int(s['missed'][-1])
+    return missed / float(samples + missed) if samples else np.nan
+
+
+def sampler_checks(d, thresholds=THRESHOLDS):
+    kinds = [('buffer', 'buffer'), ('rate_*', 'rate'), ('sock_*', 'sock'),
+             ('tcp_*', 'tcpinfo'), ('cpu_*', 'hostcpu'), ('cpu', 'syscpu')]
+    worst = (np.nan, None)
+    for pattern, kind in kinds:
+        for path in glob.glob(os.path.join(d, pattern + '.txt')) + \
+                glob.glob(os.path.join(d, pattern + '.bts')):
+            s = load(path, kind)
+            if 'missed' not in s.dtype.names or not len(s):
+                continue
+            frac = missed_fraction(s)
+            if not np.isnan(frac) and not frac <= worst[0]:
+                worst = (frac, os.path.basename(path))
+    return [check('sampler_missed', worst[0], worst[1] or 'no sampler outputs',
+                  thresholds)]
+
+
+def rate_check(d, bw_net, iface, thresholds=THRESHOLDS):
+    qpath = series_file(d, 'buffer')
+    rpath = series_file(d, 'rate_%s' % iface)
+    if bw_net is None or qpath is None or rpath is None:
+        return [check('bottleneck_rate', None, 'needs buffer.txt, rate_%s.txt '
+                      'and --bw-net' % iface, thresholds)]
+    q = load(qpath, 'buffer')
+    r = load(rpath, 'rate')
+    if len(q) < 2 or len(r) < 2:
+        return [check('bottleneck_rate', None, 'too few samples', thresholds)]
+    # Queue length as of the start and the end of every rate interval
+    order = np.argsort(q['time'], kind='stable')
+    qt, qlen = q['time'][order], q['qlen'][order]
+    at = lambda t: qlen[np.maximum(np.searchsorted(qt, t, 'right') - 1, 0)]
+    busy = (at(r['time'][:-1]) >= BACKLOGGED) & (at(r['time'][1:]) >= BACKLOGGED)
+    rate = r['tx_bps'][1:][busy]
+    if len(rate) < 10:
+        return [check('bottleneck_rate', None, 'the queue was never backlogged',
+                      thresholds)]
+    ratio = np.median(rate) / (bw_net * 1e6)
+    return [check('bottleneck_rate', abs(1 - ratio),
+                  '%s sent %.3f Mb/s (median of %d backlogged samples) for '
+                  '--bw-net %g' % (iface, ratio * bw_net, len(rate), bw_net),
+                  thresholds)]
+
+
+def assess(d, bw_net=None, iface='s0-eth2', thresholds=THRESHOLDS):
+    """Fidelity report of a result directory: {'verdict', 'checks'}."""
+    system = system_checks(d, thresholds) + host_checks(d, thresholds)
+    sampler = sampler_checks(d, thresholds)
+    rate = rate_check(d, bw_net, iface, thresholds)
+    checks = system + sampler + rate
+    evidence = system + rate
+    verdict = max((c['status'] for c in checks), key=STATUSES.index)
+    if all(c['status'] == 'skip' for c in evidence):
+        verdict = max(verdict, 'warn', key=STATUSES.index)
+    return {'verdict': verdict,
+            'bw_net': bw_net, 'iface': iface, 'checks': checks}
+
+
+def print_report(report):
+    for c in report['checks']:
+        print('%-16s %-4s  %8s  %s' % (
+            c['check'], c['status'],
+            '-' if c['value'] is None else '%.3f' % c['value'], c['detail']))
+    print('Fidelity: %s' % report['verdict'].upper())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulation fidelity of a run")
+    parser.add_argument('dir', help="Result directory")
+    parser.add_argument('--bw-net', '-b', type=float, default=None,
+                        help="Configured bottleneck rate (Mb/s)")
+    parser.add_argument('--iface', default='s0-eth2',
+                        help="Bottleneck switch port")
+    parser.add_argument('--out', '-o', default=None,
+                        help="JSON report (default <dir>/fidelity.json)")
+    args = parser.parse_args()
+
+    report = assess(args.dir, args.bw_net, args.iface)
+    with open(args.out or os.path.join(args.dir, 'fidelity.json'), 'w') as f:
+        json.dump(report, f, indent=1)
+    print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,8 @@ import matplotlib.pyplot as plt
 import argparse
 import math
 
+import helper_np
+
 def read_list(fname, delim=','):
     lines = open(fname)
     ret = []
@@ -73,7 +75,7 @@ def xaxis(values, limit):
 def grouper(n, iterable, fillvalue=None):
     "grouper(3, 'ABCDEFG', 'x') --> ABC DEF Gxx"
     args = [iter(iterable)] * n
-    return itertools.izip_longest(fillvalue=fillvalue, *args)
+    return itertools.zip_longest(fillvalue=fillvalue, *args)
 
 def cdf(values):
     values.sort()
@@ -88,28 +90,15 @@ def cdf(values):
 
     return (x, y)
 
-def parse_cpu_usage(fname, nprocessors=8):
-    """Returns (user,system,nice,iowait,hirq,sirq,steal) tuples
-	aggregated over all processors.  DOES NOT RETURN IDLE times."""
+CPU_FIELDS = helper_np.CPU_FIELDS
 
-    data = grouper(nprocessors, open(fname).readlines())
+def parse_cpu_usage(fname, nprocessors=None):
+    """Returns (user,system,nice,iowait,hirq,sirq,steal) lists
+    aggregated over all processors.  DOES NOT RETURN IDLE times.
 
-    """Typical line looks like:
-    Cpu0  :  0.0%us,  1.0%sy,  0.0%ni, 97.0%id,  0.0%wa,  0.0%hi,  2.0%si,  0.0%st
-    """
-    ret = [] 
-    for collection in data:
-        total = [0]*8
-        for cpu in collection:
-          usages = cpu.split(':')[1]
-          usages = map(lambda e: e.split('%')[0],
-                       usages.split(','))
-          for i in xrange(len(usages)):
-              total[i] += float(usages[i])
-        total = map(lambda t: t/nprocessors, total)
-		# Skip idle time
-        ret.append(total[0:3] + total[4:])
-    return ret
+    Parsed by helper_np.parse_cpu_usage (per-CPU lines of `top` batch
+    output, old or new style)."""
+    return helper_np.parse_cpu_usage(fname, nprocessors).tolist()
 
 def pc95(lst):
     l = len(lst)
@@ -0,0 +1,141 @@
+'''
+NumPy version of helper.py for the plot scripts.
+
+Same names as helper.py, but everything takes and returns arrays:
+read_list() gives a 2-D float array, col() a column view, and ewma(),
+the percentiles and cdf() run in C instead of Python loops, so runs of
+10^7 samples take milliseconds once loaded (see tsfile.read_series for
+loading them without parsing).  Like helper.py it sets up matplotlib, so
+`from helper_np import *` is a drop-in replacement.
+'''
+
+import re
+import argparse
+import math
+import matplotlib as m
+m.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+
+try:
+    from scipy.signal import lfilter
+except ImportError:
+    lfilter = None
+
+
+def read_list(fname, delim=',', usecols=None):
+    """Numeric columns of a delimited file as a 2-D float array.
+
+    '#' lines are skipped; empty fields and the 'ms'/'s' units helper.py
+    used to zero become NaN instead."""
+    try:
+        return np.loadtxt(fname, delimiter=delim, comments='#',
+                          usecols=usecols, ndmin=2)
+    except ValueError:
+        data = np.genfromtxt(fname, delimiter=delim, comments='#',
+                             usecols=usecols, invalid_raise=False)
+        return data.reshape(1, -1) if data.ndim == 1 else data
+
+
+def col(n, obj):
+    """Column n of a 2-D array (or of a list of rows)."""
+    return np.asarray(obj)[:, n]
+
+
+def transpose(a):
+    return np.asarray(a).T
+
+
+def avg(a):
+    return float(np.mean(a))
+
+
+def stdev(a):
+    return float(np.std(a))
+
+
+def coeff_variation(a):
+    return stdev(a) / avg(a)
+
+
+def xaxis(values, limit):
+    values = np.asarray(values)
+    return np.arange(len(values)) * float(limit) / len(values), values
+
+
+def _ewma_blocks(alpha, v, y0):
+    # y[i] = alpha^(i+1) y0 + (1 - alpha) sum_j alpha^(i-j) v[j]: scale by
+    # alpha^-j, cumsum, scale back.  Blocks keep alpha^-j within range.
+    block = len(v) if alpha >= 1 else max(1, int(100 / -math.log10(alpha)))
+    out = np.empty(len(v))
+    for s in range(0, len(v), block):
+        chunk = v[s:s + block]
+        powers = alpha ** np.arange(len(chunk))
+        out[s:s + len(chunk)] = powers * alpha * y0 + \
+            (1 - alpha) * powers * np.cumsum(chunk / powers)
+        y0 = out[s + len(chunk) - 1]
+    return out
+
+
+def ewma(alpha, values):
+    """prev = alpha * prev + (1 - alpha) * v, starting from prev = 0."""
+    v = np.asarray(values, dtype=float)
+    if alpha == 0 or len(v) == 0:
+        return v
+    if lfilter is not None:
+        return lfilter([1 - alpha], [1, -alpha], v)
+    return _ewma_blocks(float(alpha), v, 0.0)
+
+
+def pc(a, q):
+    """Element at index int(q * n) of the sorted data, like helper.pc95,
+    found by partial selection instead of a full sort."""
+    a = np.asarray(a)
+    k = int(q * len(a))
+    return np.partition(a, k)[k]
+
+
+def pc95(a):
+    return pc(a, 0.95)
+
+
+def pc99(a):
+    return pc(a, 0.99)
+
+
+def cdf(values):
+    """Returns (x, y) with x sorted and y the fraction of samples <= x."""
+    x = np.sort(np.asarray(values))
+    return x, np.arange(1, len(x) + 1) / float(len(x))
+
+
+_cpu_pat = re.compile(r'^%?Cpu(\d+)\s*:(.*)$', re.M)
+_cpu_field_pat = re.compile(r'([\d.]+)\s*%?\s*(us|sy|ni|id|wa|hi|si|st)')
+CPU_FIELDS = ['us', 'sy', 'ni', 'id', 'wa', 'hi', 'si', 'st']
+
+
+def parse_cpu_usage(fname, nprocessors=None, per_core=False):
+    """Parses per-CPU lines of `top` batch output, old or new style:
+
+        Cpu0  :  0.0%us,  1.0%sy,  0.0%ni, 97.0%id,  0.0%wa,  0.0%hi,  2.0%si,  0.0%st
+        %Cpu0  :  0.0 us,  1.0 sy,  0.0 ni, 97.0 id,  0.0 wa,  0.0 hi,  2.0 si,  0.0 st
+
+    Returns an (samples, cpus, 8) array in CPU_FIELDS order with
+    per_core=True, else the (samples, 7) average over the CPUs without
+    the idle time, like helper.parse_cpu_usage.  The CPU count is taken
+    from the data unless nprocessors is given."""
+    text = open(fname).read()
+    rows = []
+    cpus = []
+    for m_ in _cpu_pat.finditer(text):
+        vals = dict((k, float(v)) for v, k in _cpu_field_pat.findall(m_.group(2)))
+        rows.append([vals.get(k, 0.0) for k in CPU_FIELDS])
+        cpus.append(int(m_.group(1)))
+    if nprocessors is None:
+        nprocessors = max(cpus) + 1 if cpus else 1
+    n = len(rows) // nprocessors
+    data = np.array(rows[:n * nprocessors]).reshape(n, nprocessors, len(CPU_FIELDS))
+    if per_core:
+        return data
+    total = data.mean(axis=1)
+    return np.delete(total, CPU_FIELDS.index('id'), axis=1)
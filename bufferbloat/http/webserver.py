@@ -1,3 +1,31 @@
+'''
+Web server used by the bufferbloat experiment.
+
+--mode simple is the original single-threaded SimpleHTTPRequestHandler
+server (still works on Python 2).  The other modes need Python 3:
+
+  threaded  a thread per connection, HTTP/1.1 keep-alive, and files sent
+            with os.sendfile instead of being copied through Python
+  async     asyncio server with keep-alive, files sent with loop.sendfile
+            (os.sendfile underneath)
+
+In both, GET /obj/<size> returns <size> bytes generated in memory, so the
+object size can be varied without touching the disk, and every request is
+timed from the request line to the last byte handed to the kernel.  The
+timing goes out as a Server-Timing header (time to the response headers)
+and, with --log, as one line per request:
+
+    time,path,status,bytes,service_us
+
+with time on the experiment clock of the run (BUFFERBLOAT_EPOCH, see
+tsfile.py) when the experiment script exported one.
+'''
+
+import argparse
+import os
+import threading
+from time import time
+
 try:
     # Python 2
     import SimpleHTTPServer
@@ -12,12 +40,278 @@ except ImportError:
     HTTPRequestHandler = http.server.SimpleHTTPRequestHandler
 
 PORT = 80
+REASONS = {200: 'OK', 403: 'Forbidden', 404: 'Not Found'}
+OBJ_PREFIX = '/obj/'
+MAX_OBJ_SIZE = 1 << 30
+
+# tsfile.clock(), which cannot be imported from http/ (nor on Python 2)
+try:
+    from time import monotonic
+    EPOCH = [float(v) for v in os.environ['BUFFERBLOAT_EPOCH'].split()]
+except (ImportError, KeyError, ValueError):
+    EPOCH = None
+
+
+def clock():
+    if EPOCH is None:
+        return time()
+    return EPOCH[0] + (monotonic() - EPOCH[1])
 
 class Handler(HTTPRequestHandler):
     # Disable logging DNS lookups
     def address_string(self):
         return str(self.client_address[0])
 
-httpd = HTTPServer(("", PORT), Handler)
-print("Server1: httpd serving at port", PORT)
-httpd.serve_forever()
+
+class RequestLog(object):
+    """Thread-safe, line-buffered per-request timing log."""
+
+    def __init__(self, fname):
+        self.out = open(fname, 'w', 1) if fname else None
+        self.lock = threading.Lock()
+
+    def write(self, path, status, nbytes, service_s):
+        if self.out is None:
+            return
+        line = '%f,%s,%d,%d,%d\n' % (clock(), path.replace(',', '%2C'), status,
+                                     nbytes, service_s * 1e6)
+        with self.lock:
+            self.out.write(line)
+
+
+class Objects(object):
+    """Synthetic objects of any size, all views of one shared buffer."""
+
+    def __init__(self):
+        self.buf = b''
+
+    def get(self, path):
+        """Returns the body for /obj/<size>, or None for other paths."""
+        if not path.startswith(OBJ_PREFIX):
+            return None
+        try:
+            size = int(path[len(OBJ_PREFIX):].split('?')[0])
+        except ValueError:
+            return None
+        if size < 0 or size > MAX_OBJ_SIZE:
+            return None
+        if size > len(self.buf):
+            self.buf = b'x' * size
+        return memoryview(self.buf)[:size]
+
+
+def threaded_server(port, log):
+    from time import perf_counter
+
+    objects = Objects()
+
+    class SendfileHandler(Handler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def parse_request(self):
+            self.t0 = perf_counter()
+            return Handler.parse_request(self)
+
+        def do_GET(self):
+            self.status = 200
+            self.nbytes = 0
+            body = objects.get(self.path)
+            if body is not None:
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                self.nbytes = len(body)
+            else:
+                f = self.send_head()
+                if f:
+                    try:
+                        self.sendfile(f)
+                    finally:
+                        f.close()
+            log.write(self.path, self.status, self.nbytes, perf_counter() - self.t0)
+
+        def send_response(self, code, message=None):
+            self.status = code
+            Handler.send_response(self, code, message)
+
+        def send_header(self, keyword, value):
+            if keyword.lower() == 'content-length':
+                self.length = int(value)
+            Handler.send_header(self, keyword, value)
+
+        def send_error(self, code, message=None, explain=None):
+            self.length = 0
+            Handler.send_error(self, code, message, explain)
+            # send_error() writes the error page itself
+            self.nbytes = self.length
+
+        def end_headers(self):
+            # send_head() of SimpleHTTPRequestHandler ends up here too
+            self.send_header('Server-Timing',
+                             'app;dur=%.3f' % ((perf_counter() - self.t0) * 1e3))
+            Handler.end_headers(self)
+
+        def sendfile(self, f):
+            try:
+                fd = f.fileno()
+            except (AttributeError, OSError, ValueError):
+                # Directory listings come as an in-memory BytesIO
+                self.copyfile(f, self.wfile)
+                self.nbytes = f.tell()
+                return
+            self.wfile.flush()
+            sock = self.connection.fileno()
+            offset = 0
+            size = os.fstat(fd).st_size
+            while offset < size:
+                sent = os.sendfile(sock, fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+            self.nbytes = offset
+
+    class Server(socketserver.ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+        allow_reuse_address = True
+        request_queue_size = 128
+
+    httpd = Server(("", port), SendfileHandler)
+    print("Server1: threaded httpd serving at port", port)
+    httpd.serve_forever()
+
+
+def async_server(port, log):
+    import asyncio
+    import mimetypes
+    import posixpath
+    from time import perf_counter
+    from urllib.parse import unquote, urlsplit
+
+    objects = Objects()
+    root = os.path.realpath(os.getcwd())
+
+    def resolve(path):
+        """(file, status): the file under root for a request target, or
+        None with 403 for targets outside root and 404 for missing files."""
+        path = unquote(urlsplit(path).path)
+        if not path.startswith('/'):
+            return None, 403
+        full = os.path.realpath(os.path.join(root, posixpath.normpath(path).lstrip('/')))
+        if full != root and not full.startswith(root + os.sep):
+            return None, 403
+        if os.path.isdir(full):
+            full = os.path.join(full, 'index.html')
+        return (full, 200) if os.path.isfile(full) else (None, 404)
+
+    async def respond(loop, writer, path, keep_alive, t0):
+        body = objects.get(path)
+        f = None
+        if body is None:
+            full, status = resolve(path)
+            if full is not None:
+                try:
+                    f = open(full, 'rb')
+                except OSError as e:
+                    status = 404 if isinstance(e, FileNotFoundError) else 403
+            if f is None:
+                body, ctype = REASONS[status].encode('ascii') + b'\n', 'text/plain'
+            else:
+                ctype = mimetypes.guess_type(full)[0] or 'application/octet-stream'
+                length = os.fstat(f.fileno()).st_size
+        else:
+            status, ctype = 200, 'application/octet-stream'
+        if f is None:
+            length = len(body)
+        reason = REASONS[status]
+        head = ('HTTP/1.1 %d %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n'
+                'Connection: %s\r\nServer-Timing: app;dur=%.3f\r\n\r\n'
+                % (status, reason, ctype, length,
+                   'keep-alive' if keep_alive else 'close',
+                   (perf_counter() - t0) * 1e3))
+        writer.write(head.encode('ascii'))
+        if f is None:
+            writer.write(body)
+            await writer.drain()
+        else:
+            try:
+                await writer.drain()
+                await loop.sendfile(writer.transport, f)
+            finally:
+                f.close()
+        return status, length
+
+    async def handle(reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                t0 = perf_counter()
+                parts = line.split()
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b'\r\n', b'\n', b''):
+                        break
+                    k, _, v = h.decode('latin-1').partition(':')
+                    headers[k.strip().lower()] = v.strip().lower()
+                if len(parts) < 2 or parts[0] != b'GET':
+                    writer.write(b'HTTP/1.1 501 Not Implemented\r\n'
+                                 b'Content-Length: 0\r\nConnection: close\r\n\r\n')
+                    break
+                version = parts[2] if len(parts) > 2 else b'HTTP/1.0'
+                keep_alive = (headers.get('connection') != 'close' and
+                              (version == b'HTTP/1.1' or
+                               headers.get('connection') == 'keep-alive'))
+                path = parts[1].decode('latin-1')
+                status, nbytes = await respond(loop, writer, path, keep_alive, t0)
+                log.write(path, status, nbytes, perf_counter() - t0)
+                if not keep_alive:
+                    break
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, '', port, backlog=128,
+                                            reuse_address=True)
+        print("Server1: async httpd serving at port", port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+
+def simple_server(port):
+    class Server(HTTPServer):
+        # Rebinds over the TIME_WAIT sockets of a previous run in the same
+        # namespace (session.py runs several points on one network)
+        allow_reuse_address = True
+
+    httpd = Server(("", port), Handler)
+    print("Server1: httpd serving at port", port)
+    httpd.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Experiment web server")
+    parser.add_argument('--mode', choices=['simple', 'threaded', 'async'],
+                        default='simple')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--log', default=None,
+                        help="Per-request timing log (threaded/async modes)")
+    args = parser.parse_args()
+    if args.mode == 'threaded':
+        threaded_server(args.port, RequestLog(args.log))
+    elif args.mode == 'async':
+        async_server(args.port, RequestLog(args.log))
+    else:
+        simple_server(args.port)
@@ -0,0 +1,97 @@
+'''
+Native link-rate sampler, replacing bwm-ng.
+
+Counters of every interface are read in one pass into an (ifaces x
+counters) array, and instantaneous and EWMA rates are computed for all
+interfaces at once.  Interfaces in the root namespace (the switch ports)
+are read from /sys/class/net/<if>/statistics with pread() on fds kept
+open; interfaces that live in a Mininet host namespace are not visible in
+our sysfs, so they are read from /proc/<pid>/net/dev of that host.
+'''
+
+import os
+from time import monotonic
+
+import numpy as np
+
+COUNTERS = ['tx_bytes', 'rx_bytes', 'tx_packets', 'rx_packets',
+            'tx_dropped', 'rx_dropped']
+# Column of each counter in a /proc/net/dev row, after the 'iface:' prefix
+NETDEV_COLUMNS = [8, 0, 9, 1, 11, 3]
+
+
+def parse_netdev(data, wanted):
+    """Returns {iface: [counters in COUNTERS order]} for the ifaces in
+    wanted, from the contents of /proc/net/dev."""
+    ret = {}
+    for line in data.split(b'\n')[2:]:
+        name, sep, rest = line.partition(b':')
+        name = name.strip().decode()
+        if sep and name in wanted:
+            f = rest.split()
+            ret[name] = [int(f[c]) for c in NETDEV_COLUMNS]
+    return ret
+
+
+class LinkRateSampler(object):
+    """ifaces is a list of names (root namespace) or (name, pid) pairs."""
+
+    def __init__(self, ifaces, alpha=0.9):
+        self.alpha = alpha
+        self.names = []
+        self.sysfs = []
+        self.netns = {}
+        for i, iface in enumerate(ifaces):
+            name, pid = iface if isinstance(iface, (tuple, list)) else (iface, None)
+            self.names.append(name)
+            if pid is None:
+                self.sysfs.append((i, [os.open('/sys/class/net/%s/statistics/%s'
+                                               % (name, c), os.O_RDONLY)
+                                       for c in COUNTERS]))
+            else:
+                if pid not in self.netns:
+                    fd = os.open('/proc/%d/net/dev' % pid, os.O_RDONLY)
+                    self.netns[pid] = (fd, {})
+                self.netns[pid][1][name] = i
+        n = len(self.names)
+        self.counters = np.zeros((n, len(COUNTERS)), dtype=np.int64)
+        self.prev = np.zeros_like(self.counters)
+        self.rate = np.zeros((n, len(COUNTERS)))
+        self.ewma = np.zeros((n, len(COUNTERS)))
+        self.last = None
+
+    def read_counters(self):
+        c = self.counters
+        for i, fds in self.sysfs:
+            c[i] = [int(os.pread(fd, 32, 0)) for fd in fds]
+        for fd, rows in self.netns.values():
+            for name, vals in parse_netdev(os.pread(fd, 65536, 0), rows).items():
+                c[rows[name]] = vals
+        return c
+
+    def sample(self):
+        """Reads all counters; returns (rate, ewma) in units per second.
+
+        Byte columns are converted to bits/s.  The first call only primes
+        the counters and returns zeros."""
+        now = monotonic()
+        self.prev[:] = self.counters
+        self.read_counters()
+        if self.last is not None and now > self.last:
+            np.divide(self.counters - self.prev, now - self.last, out=self.rate)
+            self.rate[:, :2] *= 8
+            self.ewma *= self.alpha
+            self.ewma += (1 - self.alpha) * self.rate
+        self.last = now
+        return self.rate, self.ewma
+
+    def close(self):
+        for i, fds in self.sysfs:
+            for fd in fds:
+                os.close(fd)
+        for fd, rows in self.netns.values():
+            os.close(fd)
+
+
+def all_ifaces():
+    return sorted(i for i in os.listdir('/sys/class/net') if i != 'lo')
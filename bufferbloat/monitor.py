@@ -1,30 +1,82 @@
 from time import sleep, time
 from subprocess import *
 import re
+import signal
+import sys
+
+from rtnl import QdiscSampler
+from tsfile import open_series, QDISC_FIELDS
 
 default_dir = '.'
 
+def exit_on_sigterm():
+    """Process.terminate() sends SIGTERM; turn it into SystemExit so the
+    monitors get to flush their buffered samples."""
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
 def monitor_qlen(iface, interval_sec = 0.01, fname='%s/qlen.txt' % default_dir):
     pat_queued = re.compile(rb'backlog\s[^\s]+\s([\d]+)p')
     cmd = "tc -s qdisc show dev %s" % (iface)
-    ret = []
-    open(fname, 'w').write('')
-    while 1:
-        p = Popen(cmd, shell=True, stdout=PIPE)
-        output = p.stdout.read()
-        # Not quite right, but will do for now
-        matches = pat_queued.findall(output)
-        if matches and len(matches) > 1:
-            ret.append(matches[1])
-            t = "%f" % time()
-            open(fname, 'a').write('{},{}\n'.format(t, matches[1].decode('utf-8')))
-        sleep(interval_sec)
-    #open('qlen.txt', 'w').write('\n'.join(ret))
-    return
-
-def monitor_devs_ng(fname="%s/txrate.txt" % default_dir, interval_sec=0.01):
-    """Uses bwm-ng tool to collect iface tx rate stats.  Very reliable."""
-    cmd = ("sleep 1; bwm-ng -t %s -o csv "
-           "-u bits -T rate -C ',' > %s" %
-           (interval_sec * 1000, fname))
-    Popen(cmd, shell=True).wait()
+    out = open_series(fname, QDISC_FIELDS[:2], capacity=64)
+    exit_on_sigterm()
+    try:
+        while 1:
+            p = Popen(cmd, shell=True, stdout=PIPE)
+            output = p.stdout.read()
+            # Not quite right, but will do for now
+            matches = pat_queued.findall(output)
+            if matches and len(matches) > 1:
+                out.append(time(), int(matches[1]))
+            sleep(interval_sec)
+    finally:
+        out.close()
+
+def monitor_qdisc(iface, interval_sec = 0.01, fname='%s/qlen.txt' % default_dir,
+                  handle=None):
+    """Samples qdisc stats over a persistent rtnetlink socket.
+
+    Records time,qlen,backlog_bytes,drops,overlimits,requeues, so the first
+    two columns match what monitor_qlen used to produce.  fname ending in
+    .bts selects the binary format (see tsfile.py)."""
+    sampler = QdiscSampler(iface)
+    out = open_series(fname, QDISC_FIELDS)
+    last_flush = time()
+    exit_on_sigterm()
+    try:
+        while 1:
+            q = sampler.sample(handle)
+            now = time()
+            if q is not None:
+                out.append(now, q.qlen, q.backlog, q.drops, q.overlimits,
+                           q.requeues)
+            if now - last_flush >= 1:
+                out.flush()
+                last_flush = now
+            sleep(interval_sec)
+    finally:
+        out.close()
+        sampler.close()
+
+def monitor_devs_ng(fname="%s/txrate.txt" % default_dir, interval_sec=0.01,
+                    ifaces=None, alpha=0.9):
+    """Collects iface tx/rx rates in-process (used to shell out to bwm-ng).
+
+    Writes time,iface,tx_bps,rx_bps,tx_pps,rx_pps,tx_bps_ewma,rx_bps_ewma
+    per interface and sample.  ifaces defaults to every non-loopback
+    interface in /sys/class/net."""
+    from linkrate import LinkRateSampler, all_ifaces
+    sampler = LinkRateSampler(ifaces or all_ifaces(), alpha)
+    out = open(fname, 'w')
+    exit_on_sigterm()
+    try:
+        while 1:
+            rate, ewma = sampler.sample()
+            now = time()
+            for name, r, e in zip(sampler.names, rate.tolist(), ewma.tolist()):
+                out.write('%f,%s,%f,%f,%f,%f,%f,%f\n' %
+                          (now, name, r[0], r[1], r[2], r[3], e[0], e[1]))
+            sleep(interval_sec)
+    finally:
+        out.close()
+        sampler.close()
+
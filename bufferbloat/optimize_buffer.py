@@ -0,0 +1,324 @@
+'''
+Searches --maxq for the knee between bottleneck utilization and latency.
+
+For a given --bw-net, --delay and congestion control, the smallest buffer
+that keeps the bottleneck utilization at or above --target also has the
+lowest p99 RTT among those that do (utilization and queueing delay both
+grow with the buffer), so the optimum is found by a search on the
+utilization constraint over a log scale of buffer sizes:
+
+    bisect   k-ary search, --batch candidates per round (1 = bisection);
+             the simulator evaluates a batch in one vectorized run
+    golden   golden-section search minimizing p99 RTT plus a penalty for
+             every point of utilization below the target, for backends
+             too noisy for a strict constraint
+
+Every evaluated buffer is kept, and the Pareto frontier of (utilization,
+p99 RTT) over them is reported with the optimum; --frontier-points adds a
+log-spaced grid to fill it in.  Buffers are in packets, or in multiples
+of the bandwidth-delay product with --bdp (RTT = 4 * delay on BBTopo,
+6 * delay on CompTopo).
+
+Backends:
+
+    sim       simulate.py, in-process (seconds)
+    mininet   bufferbloat.py / bufferbloat_competition.py runs through the
+              sweep.py cache, so points of earlier searches are reused
+
+    python3 optimize_buffer.py -b 10 --delay 5 --cong reno --target 0.95
+    python3 optimize_buffer.py -b 10 --delay 5 --cong bbr --bdp --min 0.05 --max 4 -o knee.json
+    sudo python3 optimize_buffer.py --backend mininet -b 1.5 --delay 5 --cong reno -t 60
+'''
+
+import argparse
+import glob
+import json
+import math
+import os
+
+import numpy as np
+
+import simulate
+import sweep
+from parsers import iperf_throughput, load
+
+MSS = simulate.MSS
+GOLDEN = (math.sqrt(5) - 1) / 2
+
+
+class SimBackend(object):
+    """Buffers evaluated by the fluid model, a batch per simulate() call."""
+
+    def __init__(self, algos, bw_net, delay, duration, warmup, hops=2,
+                 **kwargs):
+        self.algos = algos
+        self.bw_net = bw_net
+        self.delay = delay
+        self.duration = duration
+        self.warmup = warmup
+        self.hops = hops
+        self.kwargs = kwargs
+
+    def evaluate(self, qs):
+        n = len(qs)
+        res = simulate.simulate(self.algos, [self.bw_net] * n, [self.delay] * n,
+                                list(qs), self.duration, hops=self.hops,
+                                **self.kwargs)
+        t = res['t']
+        i0 = min(np.searchsorted(t, self.warmup), len(t) - 2)
+        delivered = res['delivered'].sum(axis=1)
+        mbps = (delivered[:, -1] - delivered[:, i0]) * 8 / (t[-1] - t[i0]) / 1e6
+        rtt = res['ping_rtt'][:, res['ping_t'] >= self.warmup]
+        with np.errstate(invalid='ignore'):
+            p99 = [np.nanpercentile(r, 99) if (~np.isnan(r)).any() else np.nan
+                   for r in rtt]
+        return [{'utilization': float(m / self.bw_net), 'p99_rtt_ms': float(p)}
+                for m, p in zip(mbps, p99)]
+
+
+def measure(run_dir, bw_net, iface='s0-eth2', warmup=0.0):
+    """Utilization and p99 RTT of a finished Mininet run: throughput of the
+    iperf logs (competition runs), else of the bottleneck port."""
+    logs = glob.glob(os.path.join(run_dir, 'iperf_*.txt'))
+    rate_file = os.path.join(run_dir, 'rate_%s.txt' % iface)
+    if logs:
+        mbps = float(np.nansum([iperf_throughput(p) for p in logs]))
+    elif os.path.exists(rate_file):
+        r = load(rate_file, 'rate')
+        r = r[r['time'] >= r['time'][0] + warmup] if len(r) else r
+        mbps = float(r['tx_bps'].mean() / 1e6) if len(r) else np.nan
+    else:
+        mbps = np.nan
+    p99 = np.nan
+    for name in ('ping.txt', 'ping_competition.txt'):
+        path = os.path.join(run_dir, name)
+        if os.path.exists(path):
+            p = load(path, 'ping')
+            rtt = p['rtt'][p['time'] >= p['time'][0] + warmup] if len(p) else p['rtt']
+            rtt = rtt[~np.isnan(rtt)]
+            p99 = float(np.percentile(rtt, 99)) if len(rtt) else np.nan
+            break
+    return {'utilization': mbps / bw_net, 'p99_rtt_ms': p99}
+
+
+class MininetBackend(object):
+    """Buffers evaluated by real runs, cached like sweep.py points."""
+
+    def __init__(self, script, fixed, bw_net, root='sweeps', iface='s0-eth2',
+                 warmup=0.0, cleanup='on-failure'):
+        self.script = script
+        self.fixed = fixed
+        self.bw_net = bw_net
+        self.root = root
+        self.iface = iface
+        self.warmup = warmup
+        self.cleanup = cleanup
+        self.code = sweep.code_version(script)
+
+    def evaluate(self, qs):
+        ret = []
+        for q in qs:
+            params = dict(self.fixed, maxq=int(q))
+            key, status = sweep.run_point(self.script, params, self.root,
+                                          self.code, self.cleanup)
+            print('  maxq %d: %s/%s %s' % (q, self.root, key, status))
+            if status not in ('done', 'cached'):
+                raise RuntimeError('maxq %d: %s' % (q, status))
+            ret.append(measure(os.path.join(self.root, key), self.bw_net,
+                               self.iface, self.warmup))
+        return ret
+
+
+class Evaluator(object):
+    """Caches backend results per buffer size."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.points = {}
+
+    def __call__(self, qs):
+        new = sorted(set(int(q) for q in qs) - set(self.points))
+        if new:
+            for q, m in zip(new, self.backend.evaluate(new)):
+                self.points[q] = m
+        return [self.points[int(q)] for q in qs]
+
+
+def log_points(lo, hi, n):
+    """Up to n distinct integers strictly between lo and hi, log spaced."""
+    x = np.unique(np.rint(np.geomspace(lo, hi, n + 2)[1:-1]).astype(int))
+    return [q for q in x.tolist() if lo < q < hi]
+
+
+def bisect(evaluate, lo, hi, target, rel_tol=0.05, batch=1):
+    """Smallest buffer in [lo, hi] whose utilization reaches target, to
+    within rel_tol (or one packet), or None if hi does not."""
+    ok = lambda m: m['utilization'] >= target
+    first, last = evaluate([lo, hi])
+    if ok(first):
+        return lo
+    if not ok(last):
+        return None
+    while hi - lo > 1 and hi > lo * (1 + rel_tol):
+        qs = log_points(lo, hi, batch) or [(lo + hi) // 2]
+        for q, m in zip(qs, evaluate(qs)):
+            if ok(m):
+                hi = q
+                break
+            lo = q
+    return hi
+
+
+def golden(evaluate, lo, hi, target, rel_tol=0.05, penalty=10.0):
+    """Buffer minimizing p99 RTT * (1 + penalty * utilization shortfall),
+    by golden-section search on log(maxq)."""
+    def cost(q):
+        m = evaluate([q])[0]
+        short = max(target - m['utilization'], 0)
+        return m['p99_rtt_ms'] * (1 + penalty * short) + 1e6 * short
+
+    a, b = math.log(lo), math.log(hi)
+    c, d = b - GOLDEN * (b - a), a + GOLDEN * (b - a)
+    fc, fd = cost(int(round(math.exp(c)))), cost(int(round(math.exp(d))))
+    while math.exp(b - a) > 1 + rel_tol and round(math.exp(b)) - round(math.exp(a)) > 1:
+        if fc <= fd:
+            b, d, fd = d, c, fc
+            c = b - GOLDEN * (b - a)
+            fc = cost(int(round(math.exp(c))))
+        else:
+            a, c, fc = c, d, fd
+            d = a + GOLDEN * (b - a)
+            fd = cost(int(round(math.exp(d))))
+    return int(round(math.exp(c if fc <= fd else d)))
+
+
+def pareto(points):
+    """Buffers not dominated in (higher utilization, lower p99 RTT)."""
+    front = []
+    best_rtt = np.inf
+    # By decreasing utilization, a point is on the frontier if its RTT is
+    # below that of every point with at least its utilization
+    for q, m in sorted(points.items(), key=lambda kv: (-kv[1]['utilization'],
+                                                       kv[1]['p99_rtt_ms'])):
+        if m['p99_rtt_ms'] < best_rtt:
+            front.append(q)
+            best_rtt = m['p99_rtt_ms']
+    return sorted(front)
+
+
+def report(points, best, front, bdp, target):
+    print('%8s %8s %12s %12s' % ('maxq', 'xBDP', 'utilization', 'p99 RTT ms'))
+    for q in sorted(points):
+        m = points[q]
+        mark = ' <- smallest with utilization >= %.2f' % target if q == best else \
+            ' *' if q in front else ''
+        print('%8d %8.2f %12.3f %12.1f%s' % (q, q / bdp, m['utilization'],
+                                             m['p99_rtt_ms'], mark))
+    if best is None:
+        print('No buffer up to %d packets reaches utilization %.2f' % (max(points), target))
+    print('Pareto frontier (*): %s' % ', '.join(str(q) for q in front))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Buffer size optimizer")
+    parser.add_argument('--backend', choices=['sim', 'mininet'], default='sim')
+    parser.add_argument('--bw-net', '-b', type=float, required=True,
+                        help="Bandwidth of bottleneck link (Mb/s)")
+    parser.add_argument('--delay', type=float, required=True,
+                        help="Link propagation delay (ms)")
+    parser.add_argument('--cong', nargs='+', default=['reno'],
+                        help="Congestion control of each flow")
+    parser.add_argument('--scenario',
+                        help="Competition scenario instead of --cong (CompTopo)")
+    parser.add_argument('--time', '-t', type=float, default=60,
+                        help="Seconds per run")
+    parser.add_argument('--warmup', type=float, default=5.0,
+                        help="Seconds excluded from the metrics")
+    parser.add_argument('--target', type=float, default=0.95,
+                        help="Minimum bottleneck utilization")
+    parser.add_argument('--bdp', action='store_true',
+                        help="--min/--max are multiples of the BDP instead of packets")
+    parser.add_argument('--min', type=float, default=None,
+                        help="Smallest buffer (default 1 packet / 0.05 BDP)")
+    parser.add_argument('--max', type=float, default=None,
+                        help="Largest buffer (default 1000 packets / 4 BDP)")
+    parser.add_argument('--strategy', choices=['bisect', 'golden'], default='bisect')
+    parser.add_argument('--rel-tol', type=float, default=0.05,
+                        help="Stop when the bracket is narrower than this ratio")
+    parser.add_argument('--batch', type=int, default=None,
+                        help="Candidates per bisection round (default 7 sim, 1 mininet)")
+    parser.add_argument('--frontier-points', type=int, default=0,
+                        help="Extra log-spaced buffers evaluated for the frontier")
+    parser.add_argument('--root', default='sweeps',
+                        help="sweep.py cache of the mininet backend")
+    parser.add_argument('--iface', default='s0-eth2',
+                        help="Bottleneck port (mininet backend, bufferbloat.py runs)")
+    parser.add_argument('--fixed', nargs='+', metavar='NAME=VALUE',
+                        help="Extra options of the Mininet script")
+    parser.add_argument('--out', '-o', help="JSON report")
+    args = parser.parse_args()
+
+    competition = args.scenario is not None
+    rtt = (6 if competition else 4) * args.delay / 1e3
+    bdp = max(args.bw_net * 1e6 * rtt / (8 * MSS), 1e-9)
+    scale = bdp if args.bdp else 1.0
+    lo = int(max(1, round((args.min if args.min is not None else
+                           (0.05 if args.bdp else 1)) * scale)))
+    hi = int(max(lo + 1, round((args.max if args.max is not None else
+                                (4 if args.bdp else 1000)) * scale)))
+
+    if args.backend == 'sim':
+        kwargs = {}
+        if competition:
+            import scenario
+            scen = scenario.load(args.scenario)
+            algos = [f.cc for f in scen.flows]
+            kwargs = dict(starts=[f.start for f in scen.flows],
+                          stops=[np.inf if f.stop is None else f.stop for f in scen.flows],
+                          base_rtt=[np.nan if f.rtt is None else f.rtt / 1e3
+                                    for f in scen.flows])
+        else:
+            algos = args.cong
+        backend = SimBackend(algos, args.bw_net, args.delay, args.time,
+                             args.warmup, hops=3 if competition else 2, **kwargs)
+        batch = args.batch or 7
+    else:
+        fixed = {'bw-net': args.bw_net, 'delay': args.delay,
+                 'time': int(args.time)}
+        if competition:
+            script = 'bufferbloat_competition.py'
+            fixed.update({'competition': True, 'scenario': args.scenario})
+        else:
+            script = 'bufferbloat.py'
+            fixed['cong'] = args.cong[0]
+        fixed.update(sweep.parse_assignments(args.fixed, multi=False))
+        backend = MininetBackend(script, fixed, args.bw_net, args.root,
+                                 args.iface, args.warmup)
+        batch = args.batch or 1
+
+    evaluate = Evaluator(backend)
+    print('BDP %.1f packets; searching maxq in [%d, %d] for utilization >= %.2f'
+          % (bdp, lo, hi, args.target))
+    if args.frontier_points:
+        evaluate([lo, hi] + log_points(lo, hi, args.frontier_points))
+    if args.strategy == 'bisect':
+        best = bisect(evaluate, lo, hi, args.target, args.rel_tol, batch)
+    else:
+        best = golden(evaluate, lo, hi, args.target, args.rel_tol)
+        if evaluate([best])[0]['utilization'] < args.target:
+            best = None
+    points = evaluate.points
+    front = pareto(points)
+    report(points, best, front, bdp, args.target)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'bdp_packets': bdp, 'target': args.target,
+                       'strategy': args.strategy, 'best_maxq': best,
+                       'best_bdp': None if best is None else best / bdp,
+                       'frontier': front,
+                       'points': [dict(points[q], maxq=q, bdp=q / bdp)
+                                  for q in sorted(points)]}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,385 @@
+'''
+Bulk parsers for buffer.txt, ping.txt, tcp_<host>.txt and iperf logs.
+
+Files are memory mapped and cut into line-aligned chunks.  Numeric CSV
+(buffer.txt, rttprobe.py output, rate files) goes through NumPy's C
+loadtxt; ping and iperf output through compiled byte regexes whose
+matches are converted in one np.fromstring call instead of one float()
+per line.  The whole-file parsers return NumPy structured arrays with the
+field names of the tsfile schemas ('time', 'qlen', 'rtt', ...), so text
+and .bts files look the same to the plotters; load() picks by extension.
+
+The iter_* variants yield one array per chunk, to reduce files larger
+than memory:
+
+    peak = 0
+    for block in iter_buffer('buffer.txt'):
+        peak = max(peak, block['qlen'].max())
+
+    python3 parsers.py reno-q100/buffer.txt reno-q100/ping.txt ...
+
+prints streaming summaries of the given files.
+'''
+
+import io
+import itertools
+import json
+import mmap
+import os
+import re
+import sys
+import warnings
+from collections import namedtuple
+from time import mktime, strptime
+
+import numpy as np
+
+from tsfile import (is_binary, read_series, QDISC_FIELDS, RTT_FIELDS,
+                    TCPINFO_FIELDS, RATE_FIELDS, SOCK_FIELDS, HOSTCPU_FIELDS,
+                    SYSCPU_FIELDS, AQM_FIELDS)
+
+CHUNK_BYTES = 64 << 20
+
+BUFFER_NAMES = [n for n, _ in QDISC_FIELDS] + ['missed']
+PING_NAMES = ['time', 'seq', 'rtt']
+TCPINFO_NAMES = [n for n, _ in TCPINFO_FIELDS] + ['missed']
+# Other sampler outputs, all with the 'missed' column of sampler.py
+SERIES_NAMES = dict((kind, [n for n, _ in fields] + ['missed']) for kind, fields in
+                    [('rate', RATE_FIELDS), ('sock', SOCK_FIELDS),
+                     ('hostcpu', HOSTCPU_FIELDS), ('syscpu', SYSCPU_FIELDS),
+                     ('aqm', AQM_FIELDS)])
+TYPES = dict(QDISC_FIELDS + RTT_FIELDS + TCPINFO_FIELDS + SOCK_FIELDS +
+             HOSTCPU_FIELDS + AQM_FIELDS +
+             [('missed', 'i4'), ('id', 'i4')])
+
+
+def iter_chunks(fname, chunk_bytes=CHUNK_BYTES):
+    """Yields the file contents in pieces of about chunk_bytes that end on
+    a line boundary (the last piece may end without a newline)."""
+    with open(fname, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            while start < size:
+                end = min(start + chunk_bytes, size)
+                if end < size:
+                    nl = mm.rfind(b'\n', start, end)
+                    if nl < 0:
+                        # A line longer than a chunk
+                        nl = mm.find(b'\n', end)
+                    end = size if nl < 0 else nl + 1
+                yield mm[start:end]
+                start = end
+        finally:
+            mm.close()
+
+
+def records(columns, names):
+    """Structured array from equally long columns."""
+    dtype = np.dtype([(n, '<' + TYPES.get(n, 'f8')) for n in names])
+    out = np.empty(len(columns[0]) if columns else 0, dtype=dtype)
+    for n, c in zip(names, columns):
+        out[n] = c
+    return out
+
+
+def concat(blocks, names):
+    blocks = [b for b in blocks if len(b)]
+    if not blocks:
+        return records([np.zeros(0)] * len(names), names)
+    return np.concatenate(blocks)
+
+
+def csv_block(buf):
+    """2-D float array of a chunk of numeric CSV; '#' lines are skipped."""
+    with warnings.catch_warnings():
+        # loadtxt warns about chunks holding only comments
+        warnings.simplefilter('ignore', UserWarning)
+        try:
+            return np.loadtxt(io.BytesIO(buf), delimiter=',', comments='#',
+                              ndmin=2)
+        except ValueError:
+            # Empty fields or a truncated last line (file still being
+            # written): slower, but skips or NaN-fills them
+            data = np.genfromtxt(io.BytesIO(buf), delimiter=',',
+                                 comments='#', invalid_raise=False)
+    if data.ndim == 1:
+        data = data.reshape(1, -1)
+    return data
+
+
+def csv_header(fname):
+    """Column names of a '# a,b,c' header line, or None."""
+    with open(fname, 'rb') as f:
+        line = f.readline()
+    if line.startswith(b'#'):
+        return line[1:].decode('ascii', 'replace').strip().split(',')
+    return None
+
+
+def _csv_records(data, names):
+    names = names[:data.shape[1]]
+    return records([data[:, i] for i in range(len(names))], names)
+
+
+def iter_buffer(fname, chunk_bytes=CHUNK_BYTES):
+    """Queue samples: time,qlen[,backlog,drops,overlimits,requeues,missed]."""
+    names = csv_header(fname) or BUFFER_NAMES
+    for buf in iter_chunks(fname, chunk_bytes):
+        data = csv_block(buf)
+        if data.size:
+            yield _csv_records(data, names)
+
+
+def parse_buffer(fname):
+    return concat(iter_buffer(fname), BUFFER_NAMES[:2])
+
+
+def parse_series(fname, names):
+    """Numeric CSV with the given columns, or those of its '#' header."""
+    names = csv_header(fname) or names
+    return concat((_csv_records(csv_block(buf), names)
+                   for buf in iter_chunks(fname)), names)
+
+
+def parse_tcpinfo(fname):
+    """tcpinfo.py samples, all flows of a host (see tcpinfo.flow_series)."""
+    return parse_series(fname, TCPINFO_NAMES)
+
+
+_ping_pat = re.compile(rb'icmp_seq=(\d+) ttl=\d+ time=([\d.]+)')
+# ping -D
+_ping_ts_pat = re.compile(rb'\[([\d.]+)\] \d+ bytes from [^\n]*?'
+                          rb'icmp_seq=(\d+) ttl=\d+ time=([\d.]+)')
+
+
+def numbers(matches, ncols):
+    """Converts regex findall() output to an (n, ncols) float array."""
+    if not matches:
+        return np.zeros((0, ncols))
+    if ncols == 1:
+        flat = matches
+    else:
+        flat = itertools.chain.from_iterable(matches)
+    return np.fromstring(b' '.join(flat), sep=' ').reshape(-1, ncols)
+
+
+def ping_format(fname):
+    """'probe' for rttprobe.py CSV, 'ping-D' for ping -D, else 'ping'."""
+    with open(fname, 'rb') as f:
+        head = f.read(4096)
+    if head.startswith(b'#'):
+        return 'probe'
+    return 'ping-D' if _ping_ts_pat.search(head) else 'ping'
+
+
+def iter_ping(fname, interval=0.1, chunk_bytes=CHUNK_BYTES):
+    """Yields (time, seq, rtt[, recv_time]) records per chunk.
+
+    Plain ping output has no timestamps, time is (icmp_seq - 1) *
+    interval.  Lost probes are absent from ping output (see parse_ping)
+    and NaN rows in rttprobe.py output."""
+    fmt = ping_format(fname)
+    if fmt == 'probe':
+        names = csv_header(fname)
+        for buf in iter_chunks(fname, chunk_bytes):
+            data = csv_block(buf)
+            if data.size:
+                yield _csv_records(data, names)
+        return
+    for buf in iter_chunks(fname, chunk_bytes):
+        if fmt == 'ping-D':
+            data = numbers(_ping_ts_pat.findall(buf), 3)
+            t, seq, rtt = data[:, 0], data[:, 1], data[:, 2]
+        else:
+            data = numbers(_ping_pat.findall(buf), 2)
+            seq, rtt = data[:, 0], data[:, 1]
+            t = (seq - 1) * interval
+        if len(seq):
+            yield records([t, seq, rtt], PING_NAMES)
+
+
+def parse_ping(fname, interval=0.1, fill_gaps=True):
+    """All probes of a ping or rttprobe.py file in sequence order.
+
+    For ping output, duplicate replies are dropped and, with fill_gaps,
+    every missing icmp_seq becomes a NaN rtt row, so losses show up as
+    gaps and do not shift later samples."""
+    fmt = ping_format(fname)
+    data = concat(iter_ping(fname, interval), PING_NAMES)
+    if fmt == 'probe' or len(data) == 0:
+        return data
+    seq = data['seq']
+    _, first = np.unique(seq, return_index=True)
+    data = data[np.sort(first)]
+    data = data[np.argsort(data['seq'], kind='stable')]
+    if not fill_gaps:
+        return data
+    seq = data['seq']
+    full = np.zeros(seq[-1] - seq[0] + 1, dtype=data.dtype)
+    full['seq'] = np.arange(seq[0], seq[-1] + 1)
+    full['rtt'] = np.nan
+    idx = seq - seq[0]
+    full['rtt'][idx] = data['rtt']
+    if fmt == 'ping-D':
+        # Interpolate the send time of lost probes
+        full['time'] = np.interp(full['seq'], seq, data['time'])
+    else:
+        full['time'] = (full['seq'] - 1) * interval
+    return full
+
+
+IPERF_NAMES = ['id', 'start', 'end', 'bytes', 'bps', 'time']
+IperfLog = namedtuple('IperfLog', 'intervals summary')
+
+_iperf_pat = re.compile(rb'^\[\s*(\d+|SUM)\]\s+([\d.]+)\s*-\s*([\d.]+)\s+sec\s+'
+                        rb'([\d.]+)\s+([KMGT]?)Bytes\s+([\d.]+)\s+([KMGT]?)bits/sec',
+                        re.M)
+# iperf -y C: date,src,sport,dst,dport,id,start-end,bytes,bps
+_iperf_csv_pat = re.compile(rb'^(\d{14}(?:\.\d+)?),[^,]*,\d+,[^,]*,\d+,(-?\d+),'
+                            rb'([\d.]+)-([\d.]+),(\d+),(\d+)', re.M)
+_BYTE_UNITS = {b'': 1, b'K': 1024, b'M': 1024 ** 2, b'G': 1024 ** 3, b'T': 1024 ** 4}
+_BIT_UNITS = {b'': 1, b'K': 1e3, b'M': 1e6, b'G': 1e9, b'T': 1e12}
+
+
+def _unit_scale(units, table):
+    units = np.asarray(units, dtype='S1')
+    scale = np.ones(len(units))
+    for u, s in table.items():
+        scale[units == u] = s
+    return scale
+
+
+def iperf_timestamps(stamps):
+    """Epoch seconds of -y C timestamps (YYYYMMDDHHMMSS[.mmm], local time)."""
+    out = np.empty(len(stamps))
+    seconds = {}
+    for i, s in enumerate(stamps):
+        sec, _, frac = s.partition(b'.')
+        if sec not in seconds:
+            seconds[sec] = mktime(strptime(sec.decode(), '%Y%m%d%H%M%S'))
+        out[i] = seconds[sec] + (float(b'0.' + frac) if frac else 0.0)
+    return out
+
+
+# Experiment-clock launch time of each iperf client, by log file name,
+# written by bufferbloat_competition.py next to the logs
+IPERF_LAUNCH = 'iperf_launch.json'
+
+
+def iperf_launch(fname):
+    """Launch time of the client that wrote fname, None if not recorded."""
+    try:
+        with open(os.path.join(os.path.dirname(fname), IPERF_LAUNCH)) as f:
+            return json.load(f).get(os.path.basename(fname))
+    except (OSError, ValueError):
+        return None
+
+
+def parse_iperf(fname, launch=None):
+    """iperf client or server log, human readable (-i) or CSV (-y C).
+
+    Returns IperfLog(intervals, summary): structured arrays of (id, start,
+    end, bytes, bps, time), with id -1 for [SUM] lines and time the epoch
+    of the report.  That is launch (default: from iperf_launch.json) plus
+    the end of the interval when the launch time is known, else the CSV
+    timestamp, which old iperf rounds down to the second (NaN for text
+    logs).  A line whose interval
+    starts before the end of the previous one of the same stream (the
+    final "0.0-120.4 sec" line, iperf3 sender/receiver lines) is a
+    summary; if a stream has a single line it counts as both."""
+    rows = []
+    for buf in iter_chunks(fname):
+        m = _iperf_csv_pat.findall(buf)
+        if m:
+            stamps = [r[0] for r in m]
+            rows.append(np.column_stack([numbers([r[1:] for r in m], 5),
+                                         iperf_timestamps(stamps)]))
+            continue
+        m = _iperf_pat.findall(buf)
+        if not m:
+            continue
+        cols = list(zip(*m))
+        ids = np.array([-1 if i == b'SUM' else int(i) for i in cols[0]], dtype=float)
+        start, end, value, rate = [numbers(list(c), 1)[:, 0]
+                                   for c in (cols[1], cols[2], cols[3], cols[5])]
+        rows.append(np.column_stack([
+            ids, start, end, value * _unit_scale(cols[4], _BYTE_UNITS),
+            rate * _unit_scale(cols[6], _BIT_UNITS), np.full(len(ids), np.nan)]))
+    data = np.concatenate(rows) if rows else np.zeros((0, 6))
+    recs = _csv_records(data, IPERF_NAMES)
+    if launch is None:
+        launch = iperf_launch(fname)
+    if launch is not None:
+        recs['time'] = launch + recs['end']
+    is_summary = np.zeros(len(recs), dtype=bool)
+    single = np.zeros(len(recs), dtype=bool)
+    for i in np.unique(recs['id']):
+        idx = np.flatnonzero(recs['id'] == i)
+        ends = recs['end'][idx]
+        prev = np.concatenate([[-np.inf], np.maximum.accumulate(ends)[:-1]])
+        is_summary[idx] = recs['start'][idx] < prev - 1e-9
+        single[idx] = len(idx) == 1
+    return IperfLog(recs[~is_summary], recs[is_summary | single])
+
+
+def iperf_throughput(fname, stream=None):
+    """Average throughput in Mb/s: the last summary line of the stream
+    (all streams with stream=None), else the duration-weighted mean of
+    the intervals (run cut before iperf printed its summary)."""
+    intervals, summary = parse_iperf(fname)
+    if stream is not None:
+        summary = summary[summary['id'] == stream]
+        intervals = intervals[intervals['id'] == stream]
+    if len(summary):
+        return summary['bps'][-1] / 1e6
+    if len(intervals):
+        dur = intervals['end'] - intervals['start']
+        return intervals['bytes'].sum() * 8 / max(dur.sum(), 1e-9) / 1e6
+    return float('nan')
+
+
+def load(fname, kind, **kwargs):
+    """Records of a 'buffer', 'ping' or 'tcpinfo' file, or of another
+    sampler output (SERIES_NAMES), text or .bts."""
+    if is_binary(fname):
+        return read_series(fname)[1]
+    if kind in SERIES_NAMES:
+        return parse_series(fname, SERIES_NAMES[kind])
+    return {'buffer': parse_buffer, 'ping': parse_ping,
+            'tcpinfo': parse_tcpinfo}[kind](fname, **kwargs)
+
+
+def summarize(fname):
+    """Streaming count/mean/max of the main column of a log."""
+    name = os.path.basename(fname)
+    if name.startswith('iperf'):
+        return 'throughput %.3f Mb/s' % iperf_throughput(fname)
+    if name.startswith('ping'):
+        blocks, column = iter_ping(fname), 'rtt'
+    else:
+        blocks, column = iter_buffer(fname), 'qlen'
+    n = lost = 0
+    total = 0.0
+    peak = -np.inf
+    for block in blocks:
+        v = block[column].astype(float)
+        ok = ~np.isnan(v)
+        lost += len(v) - ok.sum()
+        v = v[ok]
+        n += len(v)
+        total += v.sum()
+        if len(v):
+            peak = max(peak, v.max())
+    if n == 0:
+        return 'no samples'
+    return '%s: %d samples, mean %.3f, max %.3f%s' % (
+        column, n, total / n, peak, ', %d lost' % lost if lost else '')
+
+
+if __name__ == '__main__':
+    for fname in sys.argv[1:]:
+        print('%s: %s' % (fname, summarize(fname)))
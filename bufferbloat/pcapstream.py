@@ -0,0 +1,667 @@
+'''
+Streaming analysis of header-only captures taken around the bottleneck.
+
+The experiment scripts (--pcap) capture packets entering the bottleneck
+switch from the senders (ingress) and leaving the bottleneck link on the
+far side (egress).  This module reads those pcap files through mmap in
+blocks of packets, decodes the IPv4/TCP headers of a whole block into
+NumPy arrays at once and joins ingress with egress on (flow, seq, IP id),
+keeping only the packets of the last --horizon seconds in memory:
+
+    sojourn      egress time - ingress time - link delay, per packet
+    drops        packets seen entering but never leaving the bottleneck
+    retransmits  ingress data packets that do not extend the flow's
+                 highest sequence number
+    goodput      new payload bytes leaving the bottleneck per second
+
+so captures of several GB need memory proportional to the horizon, not to
+the file.  Sojourn percentiles come from a fixed log-spaced histogram.
+
+    python3 pcapstream.py --in res/pcap_in_s0-eth1.pcap --out res/pcap_out_s1-eth2.pcap \\
+        --delay 20 --sojourn res/sojourn.bts
+
+synthesize() (--synth DIR) writes a pair of captures of flows through a
+drop-tail FIFO with known drops and queueing delays, plus truth.json, to
+check the analyzer without Mininet.
+'''
+
+import argparse
+import heapq
+import json
+import mmap
+import os
+import random
+import struct
+
+import numpy as np
+
+from tsfile import open_series
+
+BLOCK_PACKETS = 1 << 16
+
+PCAP_HDR = struct.Struct('IHHiIII')
+REC_HDR_LE = struct.Struct('<IIII')
+REC_HDR_BE = struct.Struct('>IIII')
+MAGIC_US = 0xa1b2c3d4
+MAGIC_NS = 0xa1b23c4d
+MAGIC_PCAPNG = 0x0a0d0d0a
+# Offset of the IP header for the link types tcpdump writes
+LINKTYPES = {1: 14, 101: 0, 113: 16, 276: 20}
+
+PACKET_DTYPE = np.dtype([('time', 'f8'), ('src', 'u4'), ('dst', 'u4'),
+                         ('sport', 'u2'), ('dport', 'u2'), ('seq', 'u4'),
+                         ('ack', 'u4'), ('ip_id', 'u2'), ('flags', 'u1'),
+                         ('payload', 'u4')])
+SOJOURN_FIELDS = [('time', 'f8'), ('flow', 'i4'), ('seq', 'i8'),
+                  ('sojourn_ms', 'f8')]
+DROP_FIELDS = [('time', 'f8'), ('flow', 'i4'), ('seq', 'i8'), ('bytes', 'i4')]
+
+# Sojourn histogram: log bins from 1 us to 100 s
+HIST_EDGES = np.logspace(-6, 2, 1601)
+
+
+class PcapReader(object):
+    """Iterates over a classic pcap file in arrays of decoded IPv4/TCP
+    headers; packets of other protocols are skipped."""
+
+    def __init__(self, fname, block=BLOCK_PACKETS):
+        self.fname = fname
+        self.block = block
+        with open(fname, 'rb') as f:
+            head = f.read(PCAP_HDR.size)
+        if len(head) < PCAP_HDR.size:
+            raise ValueError('%s: not a pcap file' % fname)
+        magic, = struct.unpack('<I', head[:4])
+        if magic in (MAGIC_US, MAGIC_NS):
+            self.endian = '<'
+        elif struct.unpack('>I', head[:4])[0] in (MAGIC_US, MAGIC_NS):
+            self.endian = '>'
+            magic = struct.unpack('>I', head[:4])[0]
+        elif magic == MAGIC_PCAPNG:
+            raise ValueError('%s: pcapng, capture with tcpdump -w or convert '
+                             'with editcap -F pcap' % fname)
+        else:
+            raise ValueError('%s: not a pcap file' % fname)
+        fields = struct.unpack(self.endian + PCAP_HDR.format, head)
+        self.linktype = fields[6] & 0xFFFF
+        if self.linktype not in LINKTYPES:
+            raise ValueError('%s: unsupported link type %d' % (fname, self.linktype))
+        self.l2 = LINKTYPES[self.linktype]
+        self.scale = 1e-9 if magic == MAGIC_NS else 1e-6
+        self.rec = REC_HDR_LE if self.endian == '<' else REC_HDR_BE
+
+    def __iter__(self):
+        with open(self.fname, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= PCAP_HDR.size:
+                return
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                off = PCAP_HDR.size
+                while True:
+                    offsets, off = self._offsets(mm, off, size)
+                    if not offsets:
+                        break
+                    buf = np.frombuffer(mm, dtype=np.uint8)
+                    try:
+                        block = self._decode(buf, np.array(offsets, dtype=np.int64))
+                    finally:
+                        del buf
+                    # Drop the pages already decoded from our resident set
+                    done = offsets[0] & ~(mmap.PAGESIZE - 1)
+                    if done and hasattr(mm, 'madvise'):
+                        mm.madvise(mmap.MADV_DONTNEED, 0, done)
+                    yield block
+            finally:
+                mm.close()
+
+    def _offsets(self, mm, off, size):
+        # The only per-packet Python work: walking the record lengths
+        unpack = self.rec.unpack_from
+        offsets = []
+        append = offsets.append
+        for _ in range(self.block):
+            if off + 16 > size:
+                break
+            incl = unpack(mm, off)[2]
+            if off + 16 + incl > size:
+                # Truncated last record: capture still being written
+                break
+            append(off)
+            off += 16 + incl
+        return offsets, off
+
+    def _u32(self, buf, pos):
+        b = buf[pos[:, None] + np.arange(4)].astype(np.uint32)
+        if self.endian == '<':
+            return b[:, 0] | b[:, 1] << 8 | b[:, 2] << 16 | b[:, 3] << 24
+        return b[:, 3] | b[:, 2] << 8 | b[:, 1] << 16 | b[:, 0] << 24
+
+    def _decode(self, buf, off):
+        last = len(buf) - 1
+        incl = self._u32(buf, off + 8)
+        t = self._u32(buf, off).astype(np.float64) + \
+            self._u32(buf, off + 4) * self.scale
+        ip = off + 16 + self.l2
+        ok = incl >= self.l2 + 40
+        if self.linktype == 1:
+            ok &= be16(buf, np.minimum(ip - 2, last)) == 0x0800
+        elif self.linktype in (113, 276):
+            proto_pos = off + 16 + (14 if self.linktype == 113 else 0)
+            ok &= be16(buf, np.minimum(proto_pos, last)) == 0x0800
+        ipc = np.minimum(ip, last - 20)
+        vihl = buf[ipc]
+        ok &= (vihl >> 4 == 4) & (buf[ipc + 9] == 6)
+        ihl = (vihl & 0x0F).astype(np.int64) * 4
+        tcp = np.minimum(ip + ihl, last - 20)
+        ok &= incl >= self.l2 + ihl + 20
+        out = np.empty(int(ok.sum()), dtype=PACKET_DTYPE)
+        ipc, tcp, ihl = ipc[ok], tcp[ok], ihl[ok]
+        out['time'] = t[ok]
+        out['src'] = be32(buf, ipc + 12)
+        out['dst'] = be32(buf, ipc + 16)
+        out['ip_id'] = be16(buf, ipc + 4)
+        out['sport'] = be16(buf, tcp)
+        out['dport'] = be16(buf, tcp + 2)
+        out['seq'] = be32(buf, tcp + 4)
+        out['ack'] = be32(buf, tcp + 8)
+        out['flags'] = buf[tcp + 13]
+        doff = (buf[tcp + 12] >> 4).astype(np.int64) * 4
+        out['payload'] = np.maximum(be16(buf, ipc + 2).astype(np.int64) - ihl - doff, 0)
+        return out
+
+
+def be16(buf, pos):
+    return buf[pos].astype(np.uint32) << 8 | buf[pos + 1]
+
+
+def be32(buf, pos):
+    b = buf[pos[:, None] + np.arange(4)].astype(np.uint32)
+    return b[:, 0] << 24 | b[:, 1] << 16 | b[:, 2] << 8 | b[:, 3]
+
+
+class TimeCursor(object):
+    """Merges the packet blocks of several captures and hands them out by
+    time: take(until) returns every packet with time < until, sorted."""
+
+    def __init__(self, fnames, block=BLOCK_PACKETS):
+        self.iters = [iter(PcapReader(f, block)) for f in fnames]
+        self.pending = [np.zeros(0, dtype=PACKET_DTYPE) for _ in fnames]
+        self.done = [False] * len(fnames)
+
+    def exhausted(self):
+        return all(self.done) and not any(len(p) for p in self.pending)
+
+    def start(self):
+        """Time of the earliest packet left, or None."""
+        for i in range(len(self.iters)):
+            self._fill(i, None)
+        times = [p['time'][0] for p in self.pending if len(p)]
+        return min(times) if times else None
+
+    def take(self, until):
+        parts = []
+        for i in range(len(self.iters)):
+            self._fill(i, until)
+            p = self.pending[i]
+            n = np.searchsorted(p['time'], until)
+            parts.append(p[:n])
+            self.pending[i] = p[n:]
+        out = np.concatenate(parts)
+        return out[np.argsort(out['time'], kind='stable')]
+
+    def _fill(self, i, until):
+        # Read blocks until one reaches past `until` (or any, for None)
+        while not self.done[i] and (not len(self.pending[i]) or (
+                until is not None and self.pending[i]['time'][-1] < until)):
+            block = next(self.iters[i], None)
+            if block is None:
+                self.done[i] = True
+                break
+            if len(block):
+                # tcpdump output is time ordered up to small reorderings
+                block = block[np.argsort(block['time'], kind='stable')]
+                self.pending[i] = np.concatenate([self.pending[i], block])
+
+
+class FlowTable(object):
+    """Numbers flows by (src, dst, sport, dport) in order of appearance."""
+
+    def __init__(self):
+        self.index = {}
+        self.keys = []
+
+    def lookup(self, pkts):
+        tuples = np.empty(len(pkts), dtype=[('src', 'u4'), ('dst', 'u4'),
+                                            ('sport', 'u2'), ('dport', 'u2')])
+        for n in tuples.dtype.names:
+            tuples[n] = pkts[n]
+        uniq, inverse = np.unique(tuples, return_inverse=True)
+        ids = np.empty(len(uniq), dtype=np.int64)
+        for i, u in enumerate(uniq.tolist()):
+            if u not in self.index:
+                self.index[u] = len(self.keys)
+                self.keys.append(u)
+            ids[i] = self.index[u]
+        return ids[inverse.reshape(-1)]
+
+    def name(self, i):
+        src, dst, sport, dport = self.keys[i]
+        return '%s:%d>%s:%d' % (ip_str(src), sport, ip_str(dst), dport)
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def ip_str(addr):
+    return '%d.%d.%d.%d' % (addr >> 24, addr >> 16 & 255, addr >> 8 & 255, addr & 255)
+
+
+def grow(a, n, fill=0):
+    if len(a) >= n:
+        return a
+    extra = np.full((n - len(a),) + a.shape[1:], fill, dtype=a.dtype)
+    return np.concatenate([a, extra])
+
+
+class FlowStats(object):
+    """Per-flow counters, grown as flows appear."""
+
+    def __init__(self):
+        self.isn = np.zeros(0, dtype=np.int64)
+        self.has_isn = np.zeros(0, dtype=bool)
+        self.max_in = np.full(0, -1, dtype=np.int64)
+        self.max_out = np.full(0, -1, dtype=np.int64)
+        self.counts = dict((k, np.zeros(0, dtype=np.int64)) for k in
+                           ['packets_in', 'packets_out', 'bytes_in', 'bytes_out',
+                            'goodput_bytes', 'retransmits', 'drops', 'matched'])
+        self.first_out = np.zeros(0)
+        self.last_out = np.zeros(0)
+        self.hist = np.zeros((0, len(HIST_EDGES) + 1), dtype=np.int64)
+        self.sojourn_sum = np.zeros(0)
+        self.sojourn_max = np.zeros(0)
+        # Latest ingress time of a packet that made it through
+        self.last_matched_in = np.zeros(0)
+
+    def resize(self, n):
+        self.isn = grow(self.isn, n)
+        self.has_isn = grow(self.has_isn, n, False)
+        self.max_in = grow(self.max_in, n, -1)
+        self.max_out = grow(self.max_out, n, -1)
+        for k in self.counts:
+            self.counts[k] = grow(self.counts[k], n)
+        self.first_out = grow(self.first_out, n, np.inf)
+        self.last_out = grow(self.last_out, n, -np.inf)
+        self.hist = grow(self.hist, n)
+        self.sojourn_sum = grow(self.sojourn_sum, n)
+        self.sojourn_max = grow(self.sojourn_max, n)
+        self.last_matched_in = grow(self.last_matched_in, n, -np.inf)
+
+    def relative_seq(self, flow, seq):
+        """Sequence numbers relative to the first one seen in the flow
+        (valid for flows under 4 GB)."""
+        new = np.flatnonzero(~self.has_isn[flow])
+        if len(new):
+            f, first = np.unique(flow[new], return_index=True)
+            self.isn[f] = seq[new[first]].astype(np.int64)
+            self.has_isn[f] = True
+        return (seq.astype(np.int64) - self.isn[flow]) % (1 << 32)
+
+    def advance(self, flow, end, maximum):
+        """Running per-flow maximum of end over the block, in packet order,
+        starting from maximum[flow].  Returns the maximum before each
+        packet and updates `maximum`."""
+        if not len(flow):
+            return end
+        order = np.argsort(flow, kind='stable')
+        f, e = flow[order], end[order]
+        # Groups become increasing bands, so one accumulate runs per flow
+        band = f * (1 << 34)
+        e = np.maximum(e, maximum[f])
+        cum = np.maximum.accumulate(e + band) - band
+        first = np.r_[True, f[1:] != f[:-1]]
+        prev = np.empty_like(cum)
+        prev[1:] = cum[:-1]
+        prev[first] = maximum[f[first]]
+        out = np.empty_like(prev)
+        out[order] = prev
+        last = np.r_[f[1:] != f[:-1], True]
+        maximum[f[last]] = cum[last]
+        return out
+
+    def add_sojourn(self, flow, sojourn):
+        bins = np.searchsorted(HIST_EDGES, sojourn)
+        np.add.at(self.hist, (flow, bins), 1)
+        np.add.at(self.sojourn_sum, flow, sojourn)
+        np.maximum.at(self.sojourn_max, flow, sojourn)
+
+
+def hist_percentile(hist, q):
+    """Upper edge of the histogram bin holding quantile q."""
+    total = hist.sum()
+    if not total:
+        return float('nan')
+    i = int(np.searchsorted(np.cumsum(hist), q * total))
+    return float(HIST_EDGES[min(i, len(HIST_EDGES) - 1)])
+
+
+def join_keys(flow, rel_seq, ip_id):
+    return (flow << 48) | (rel_seq << 16) | ip_id.astype(np.int64)
+
+
+def analyze(ingress, egress, delay=0.0, horizon=5.0, step=1.0,
+            block=BLOCK_PACKETS, sojourn_out=None, drops_out=None):
+    """Streams the ingress and egress captures and returns per-flow results.
+
+    delay (s) is subtracted from egress - ingress; packets still unmatched
+    `horizon` seconds after entering are drops.  With sojourn_out /
+    drops_out set, every matched packet / drop is also written there
+    (tsfile.open_series: .bts or text)."""
+    flows = FlowTable()
+    stats = FlowStats()
+    cin = TimeCursor(ingress, block) if ingress else None
+    cout = TimeCursor(egress, block)
+    starts = [c.start() for c in (cin, cout) if c is not None]
+    starts = [s for s in starts if s is not None]
+    if not starts:
+        return {'flows': []}
+    t0 = min(starts)
+    souj = open_series(sojourn_out, SOJOURN_FIELDS, header=True) if sojourn_out else None
+    drop = open_series(drops_out, DROP_FIELDS, header=True) if drops_out else None
+    pending = np.zeros(0, dtype=[('key', 'i8'), ('time', 'f8'), ('flow', 'i8'),
+                                 ('seq', 'i8'), ('bytes', 'i8')])
+    unmatched_out = unresolved = 0
+    until = t0
+    while not (cout.exhausted() and (cin is None or cin.exhausted())):
+        until += step
+        # Ingress packets before egress ones: an egress packet entered at
+        # most `until` ago
+        if cin is not None:
+            pin = cin.take(until)
+            fin = flows.lookup(pin)
+            stats.resize(len(flows))
+            data = pin['payload'] > 0
+            pin, fin = pin[data], fin[data]
+            rel = stats.relative_seq(fin, pin['seq'])
+            end = rel + pin['payload']
+            before = stats.advance(fin, end, stats.max_in)
+            retrans = end <= before
+            np.add.at(stats.counts['packets_in'], fin, 1)
+            np.add.at(stats.counts['bytes_in'], fin, pin['payload'].astype(np.int64))
+            np.add.at(stats.counts['retransmits'], fin, retrans.astype(np.int64))
+            new = np.empty(len(pin), dtype=pending.dtype)
+            new['key'] = join_keys(fin, rel, pin['ip_id'])
+            new['time'] = pin['time']
+            new['flow'] = fin
+            new['seq'] = rel
+            new['bytes'] = pin['payload']
+            pending = np.concatenate([pending, new])
+            pending = pending[np.argsort(pending['key'], kind='stable')]
+
+        pout = cout.take(until)
+        fout = flows.lookup(pout)
+        stats.resize(len(flows))
+        data = pout['payload'] > 0
+        pout, fout = pout[data], fout[data]
+        rel = stats.relative_seq(fout, pout['seq'])
+        end = rel + pout['payload']
+        before = stats.advance(fout, end, stats.max_out)
+        # Advance of the highest sequence number: holes left by drops count
+        # once the flow moves past them, retransmissions filling them never
+        fresh = np.where(before < 0, pout['payload'], np.maximum(end - before, 0))
+        np.add.at(stats.counts['packets_out'], fout, 1)
+        np.add.at(stats.counts['bytes_out'], fout, pout['payload'].astype(np.int64))
+        np.add.at(stats.counts['goodput_bytes'], fout, fresh)
+        np.minimum.at(stats.first_out, fout, pout['time'])
+        np.maximum.at(stats.last_out, fout, pout['time'])
+
+        if cin is not None and len(pout):
+            keys = join_keys(fout, rel, pout['ip_id'])
+            pos = np.searchsorted(pending['key'], keys)
+            pos_c = np.minimum(pos, max(len(pending) - 1, 0))
+            hit = (pos < len(pending)) & (pending['key'][pos_c] == keys) \
+                if len(pending) else np.zeros(len(keys), dtype=bool)
+            # A key can appear twice (identical retransmission): keep the
+            # first egress of each matched ingress
+            hit_pos, first = np.unique(pos[hit], return_index=True)
+            idx = np.flatnonzero(hit)[first]
+            unmatched_out += len(keys) - len(idx)
+            sojourn = pout['time'][idx] - pending['time'][hit_pos] - delay
+            f = fout[idx]
+            np.add.at(stats.counts['matched'], f, 1)
+            np.maximum.at(stats.last_matched_in, f, pending['time'][hit_pos])
+            stats.add_sojourn(f, np.maximum(sojourn, 0.0))
+            if souj is not None:
+                for rec in zip(pending['time'][hit_pos].tolist(), f.tolist(),
+                               pending['seq'][hit_pos].tolist(),
+                               (sojourn * 1e3).tolist()):
+                    souj.append(*rec)
+            keep = np.ones(len(pending), dtype=bool)
+            keep[hit_pos] = False
+            pending = pending[keep]
+
+        if cin is not None:
+            if not cout.exhausted():
+                expired = pending['time'] < until - horizon
+                lost = pending[expired]
+            else:
+                # Egress capture over: a packet is a drop only if a later
+                # one of its flow got through, else it is unresolved
+                expired = np.ones(len(pending), dtype=bool)
+                later = pending['time'] < stats.last_matched_in[pending['flow']]
+                lost = pending[later]
+                unresolved += len(pending) - len(lost)
+            np.add.at(stats.counts['drops'], lost['flow'], 1)
+            if drop is not None:
+                lost = lost[np.argsort(lost['time'], kind='stable')]
+                for rec in zip(lost['time'].tolist(), lost['flow'].tolist(),
+                               lost['seq'].tolist(), lost['bytes'].tolist()):
+                    drop.append(*rec)
+            pending = pending[~expired]
+    for out in (souj, drop):
+        if out is not None:
+            out.close()
+    result = report(flows, stats, cin is not None)
+    result.update({'unmatched_egress': unmatched_out, 'unresolved': unresolved})
+    return result
+
+
+def report(flows, stats, joined):
+    ret = []
+    c = stats.counts
+    for i in range(len(flows)):
+        if not c['packets_in'][i] and not c['packets_out'][i]:
+            # Pure ACK flows
+            continue
+        dur = stats.last_out[i] - stats.first_out[i]
+        flow = {
+            'flow': flows.name(i),
+            'packets_in': int(c['packets_in'][i]),
+            'packets_out': int(c['packets_out'][i]),
+            'bytes_in': int(c['bytes_in'][i]),
+            'bytes_out': int(c['bytes_out'][i]),
+            'goodput_mbps': float(c['goodput_bytes'][i] * 8 / dur / 1e6) if dur > 0 else None,
+            'retransmits': int(c['retransmits'][i]),
+        }
+        if joined:
+            n = int(c['matched'][i])
+            top = stats.sojourn_max[i]
+            flow.update({
+                'drops': int(c['drops'][i]),
+                'sojourn_ms': {
+                    'mean': float(stats.sojourn_sum[i] / n * 1e3) if n else None,
+                    'p50': min(hist_percentile(stats.hist[i], 0.5), top) * 1e3,
+                    'p95': min(hist_percentile(stats.hist[i], 0.95), top) * 1e3,
+                    'p99': min(hist_percentile(stats.hist[i], 0.99), top) * 1e3,
+                    'max': float(stats.sojourn_max[i] * 1e3) if n else None,
+                },
+            })
+        ret.append(flow)
+    return {'flows': ret}
+
+
+def print_report(result):
+    for f in result['flows']:
+        line = '%-40s %8.2f Mb/s  %6d retrans' % (
+            f['flow'], f['goodput_mbps'] or 0.0, f['retransmits'])
+        if 'drops' in f:
+            s = f['sojourn_ms']
+            line += '  %6d drops  sojourn mean %s p95 %.1f p99 %.1f ms' % (
+                f['drops'], '-' if s['mean'] is None else '%.1f' % s['mean'],
+                s['p95'], s['p99'])
+        print(line)
+
+
+# Synthetic captures
+
+def ipv4(s):
+    a, b, c, d = (int(x) for x in s.split('.'))
+    return a << 24 | b << 16 | c << 8 | d
+
+
+def tcp_frame(src, dst, sport, dport, seq, ack, flags, payload, ip_id, snaplen):
+    """Ethernet/IPv4/TCP headers of a packet with `payload` bytes, cut at
+    snaplen like tcpdump -s; returns (bytes, original length)."""
+    ip_len = 20 + 20 + payload
+    frame = b'\x00\x00\x00\x00\x00\x02\x00\x00\x00\x00\x00\x01\x08\x00' + \
+        struct.pack('!BBHHHBBHII', 0x45, 0, ip_len, ip_id, 0x4000, 64, 6, 0,
+                    src, dst) + \
+        struct.pack('!HHIIBBHHH', sport, dport, seq, ack, 5 << 4, flags,
+                    65535, 0, 0)
+    orig = 14 + ip_len
+    frame += b'\0' * min(payload, max(snaplen - len(frame), 0))
+    return frame[:snaplen], orig
+
+
+class PcapWriter(object):
+    def __init__(self, fname, snaplen=96):
+        self.snaplen = snaplen
+        self.out = open(fname, 'wb')
+        self.out.write(struct.pack('<' + PCAP_HDR.format, MAGIC_US, 2, 4, 0, 0,
+                                   snaplen, 1))
+
+    def write(self, t, frame, orig):
+        sec = int(t)
+        usec = int(round((t - sec) * 1e6))
+        if usec == 1000000:
+            sec, usec = sec + 1, 0
+        self.out.write(REC_HDR_LE.pack(sec, usec, len(frame), orig) + frame)
+
+    def close(self):
+        self.out.close()
+
+
+def synthesize(d, flows=2, bw=10e6, maxq=50, duration=5.0, delay=0.01,
+               mss=1448, load=1.2, rto=0.2, snaplen=96, seed=1, start=1e9):
+    """Ingress/egress captures of `flows` senders through a drop-tail FIFO
+    of maxq packets served at bw bit/s.  Each sender transmits at random
+    times, load * bw in total; a dropped packet is resent (same seq, next
+    IP id) at the first transmission rto after the drop, in place of new
+    data.  Writes d/in.pcap, d/out.pcap and d/truth.json with the exact
+    per-flow drops, retransmits, delivered bytes and mean sojourn
+    (queueing + serialization)."""
+    if not os.path.exists(d):
+        os.makedirs(d)
+    rng = random.Random(seed)
+    server = ipv4('10.0.0.%d' % (flows + 1))
+    wire = (mss + 54) * 8.0 / bw
+    gap = wire * flows / load
+    slots = [(rng.uniform(0, gap), f) for f in range(flows)]
+    heapq.heapify(slots)
+    next_seq = [rng.randrange(1 << 32) for _ in range(flows)]
+    ip_ids = [rng.randrange(1 << 16) for _ in range(flows)]
+    # Per flow, (due time, seq) of the packets to resend
+    resend = [[] for _ in range(flows)]
+    win = PcapWriter(os.path.join(d, 'in.pcap'), snaplen)
+    wout = PcapWriter(os.path.join(d, 'out.pcap'), snaplen)
+    truth = [{'drops': 0, 'retransmits': 0, 'delivered': 0, 'sojourn': 0.0}
+             for _ in range(flows)]
+    departures = []
+    busy_until = 0.0
+    outq = []
+    while slots:
+        t, f = heapq.heappop(slots)
+        if t + rng.expovariate(1.0 / gap) < duration:
+            heapq.heappush(slots, (t + rng.expovariate(1.0 / gap), f))
+        tr = truth[f]
+        if resend[f] and resend[f][0][0] <= t:
+            seq = heapq.heappop(resend[f])[1]
+            tr['retransmits'] += 1
+        else:
+            seq = next_seq[f]
+            next_seq[f] = (seq + mss) % (1 << 32)
+        ip_id = ip_ids[f]
+        ip_ids[f] = (ip_id + 1) & 0xFFFF
+        frame = tcp_frame(ipv4('10.0.0.%d' % (f + 1)), server, 40000 + f, 5001,
+                          seq, 1, 0x18, mss, ip_id, snaplen)
+        win.write(start + t, *frame)
+        while outq and outq[0][0] <= t:
+            te, fr = heapq.heappop(outq)
+            wout.write(start + te, *fr)
+        while departures and departures[0] <= t:
+            heapq.heappop(departures)
+        if len(departures) >= maxq:
+            tr['drops'] += 1
+            heapq.heappush(resend[f], (t + rto, seq))
+            continue
+        done = max(t, busy_until) + wire
+        busy_until = done
+        heapq.heappush(departures, done)
+        tr['sojourn'] += done - t
+        tr['delivered'] += 1
+        heapq.heappush(outq, (done + delay, frame))
+    while outq:
+        te, fr = heapq.heappop(outq)
+        wout.write(start + te, *fr)
+    win.close()
+    wout.close()
+    result = [{'flow': '10.0.0.%d:%d>%s:5001' % (f + 1, 40000 + f, ip_str(server)),
+               'drops': tr['drops'], 'retransmits': tr['retransmits'],
+               'delivered_packets': tr['delivered'],
+               'sojourn_ms_mean': tr['sojourn'] / max(tr['delivered'], 1) * 1e3}
+              for f, tr in enumerate(truth)]
+    with open(os.path.join(d, 'truth.json'), 'w') as out:
+        json.dump({'delay': delay, 'bw': bw, 'maxq': maxq, 'flows': result},
+                  out, indent=1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming pcap analysis of the bottleneck")
+    parser.add_argument('--in', dest='ingress', nargs='*', default=[],
+                        help="Captures of the packets entering the bottleneck")
+    parser.add_argument('--out', dest='egress', nargs='*', default=[],
+                        help="Captures of the packets leaving the bottleneck link")
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help="Propagation delay of the bottleneck link (ms), "
+                             "subtracted from the sojourn times")
+    parser.add_argument('--horizon', type=float, default=5.0,
+                        help="Seconds after which an unmatched ingress packet is a drop")
+    parser.add_argument('--sojourn', help="Write per-packet sojourn times here")
+    parser.add_argument('--drops', help="Write dropped packets here")
+    parser.add_argument('--json', '-o', help="Write the per-flow results here")
+    parser.add_argument('--synth', metavar='DIR',
+                        help="Write synthetic in.pcap/out.pcap/truth.json to DIR")
+    parser.add_argument('--synth-flows', type=int, default=2)
+    parser.add_argument('--synth-time', type=float, default=5.0,
+                        help="Seconds of synthetic traffic")
+    args = parser.parse_args()
+
+    if args.synth:
+        truth = synthesize(args.synth, flows=args.synth_flows,
+                           duration=args.synth_time, delay=args.delay / 1e3)
+        print(json.dumps(truth, indent=1))
+        return
+    if not args.egress:
+        parser.error('--out is required')
+    result = analyze(args.ingress, args.egress, delay=args.delay / 1e3,
+                     horizon=args.horizon, sojourn_out=args.sojourn,
+                     drops_out=args.drops)
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+'''
+Throughput phase plots of competing flows: the trajectory of the rate of
+one flow (or group of flows) against another, with the fairness line
+(every flow at the same rate) and the efficiency line (the bottleneck
+full).
+
+Flows are read from the iperf_<flow>.txt logs of a competition result
+directory and put on a common time grid (fairness.load_rates).  Each
+panel draws the whole trajectory as one LineCollection colored by time,
+with direction arrows from a single quiver call.  With more than two
+flows the rates are projected:
+
+    flows   one panel per pair of flows
+    cc      flows summed per congestion control, one panel per pair of
+            algorithms (default with more than two flows)
+
+For a panel of x and y made of n_x and n_y flows out of N, the fairness
+line is y = (n_y / n_x) x and the efficiency line x + y = bw_net (n_x +
+n_y) / N, the part of the bottleneck the two would get together.  The
+bottleneck rate is --bw-net, else the one in the run's config.json.
+
+    python3 phaseplot.py competition_results/scenario1_reno_vs_bbr
+    python3 phaseplot.py sweeps/<key> --mode flows --dt 0.1 -o phase.png
+'''
+
+import argparse
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
+
+from fairness import flow_logs, load_rates, windowed
+
+MAX_PANELS = 12
+
+
+def run_config(d):
+    try:
+        with open(os.path.join(d, 'config.json')) as f:
+            return json.load(f).get('args', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def flow_ccs(names, scenario_name=None):
+    """Congestion control of each flow: from the scenario when known,
+    else the last '_' part of the flow name (h1_reno, h2_Cubic)."""
+    ccs = dict((n, n.rsplit('_', 1)[-1].lower()) for n in names)
+    if scenario_name:
+        try:
+            import scenario
+            for flow in scenario.load(scenario_name).flows:
+                ccs[flow.name] = flow.cc
+        except (OSError, ValueError, KeyError):
+            pass
+    return [ccs[n] for n in names]
+
+
+def series(rates, names, ccs, mode):
+    """[(label, number of flows, rates)] to project."""
+    if mode == 'flows':
+        return [('%s (%s)' % (n, c), 1, r) for n, c, r in zip(names, ccs, rates)]
+    out = []
+    for cc in sorted(set(ccs), key=ccs.index):
+        rows = rates[[i for i, c in enumerate(ccs) if c == cc]]
+        # NaN only when no flow of the group is running
+        total = np.where(np.isnan(rows).all(axis=0), np.nan, np.nansum(rows, axis=0))
+        out.append(('%s x%d' % (cc, len(rows)), len(rows), total))
+    return out
+
+
+def draw_panel(ax, t, x, y, nx, ny, nflows, bw_net, labels, arrows=30,
+               norm=None):
+    from matplotlib.collections import LineCollection
+    ok = ~(np.isnan(x) | np.isnan(y))
+    t, x, y = t[ok], x[ok], y[ok]
+    lim = bw_net * (nx + ny) / nflows if bw_net else 1.0
+    top = max(lim, x.max() if len(x) else 0, y.max() if len(y) else 0) * 1.05
+    if len(x) > 1:
+        points = np.column_stack([x, y])
+        segs = np.stack([points[:-1], points[1:]], axis=1)
+        lc = LineCollection(segs, cmap='viridis', norm=norm, linewidths=1.5)
+        lc.set_array(t[:-1])
+        ax.add_collection(lc)
+        step = max(1, (len(x) - 1) // max(arrows, 1))
+        i = np.arange(0, len(x) - 1, step)
+        ax.quiver(x[i], y[i], x[i + 1] - x[i], y[i + 1] - y[i], t[i], cmap='viridis',
+                  norm=norm, angles='xy', scale_units='xy', scale=1, width=0.004)
+    else:
+        lc = None
+    if bw_net:
+        ax.plot([0, lim], [lim, 0], '--', color='black', label='Efficiency line')
+    # y = (ny / nx) x: same rate for every flow
+    end = min(top, top * nx / ny)
+    ax.plot([0, end], [0, end * ny / nx], ':', color='black', label='Fairness line')
+    ax.set_xlim(0, top)
+    ax.set_ylim(0, top)
+    ax.set_aspect('equal')
+    ax.set_xlabel('%s throughput (Mb/s)' % labels[0])
+    ax.set_ylabel('%s throughput (Mb/s)' % labels[1])
+    ax.grid(True)
+    return lc
+
+
+def plot_phase(files, out=None, names=None, ccs=None, bw_net=None, mode='auto',
+               dt=0.5, window=1, arrows=30):
+    """Phase plot of the given iperf logs; returns the figure."""
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import Normalize
+    names = names or [os.path.basename(f)[len('iperf_'):].rsplit('.', 1)[0]
+                      for f in files]
+    ccs = ccs or flow_ccs(names)
+    t, rates = load_rates(files, dt)
+    if window > 1:
+        rates = windowed(rates, window)
+    if mode == 'auto':
+        mode = 'flows' if len(files) <= 2 else 'cc'
+    if bw_net is None:
+        total = np.nansum(rates, axis=0)
+        bw_net = float(np.nanmax(total)) if total.size else None
+        print('No --bw-net: efficiency line at the peak total rate, %.1f Mb/s'
+              % bw_net, file=sys.stderr)
+    s = series(rates, names, ccs, mode)
+    pairs = list(itertools.combinations(range(len(s)), 2))[:MAX_PANELS]
+    if not pairs:
+        raise ValueError('need two flows (or two algorithms with --mode cc)')
+    cols = min(len(pairs), 3)
+    rows = (len(pairs) + cols - 1) // cols
+    fig, axes = plt.subplots(rows, cols, figsize=(6 * cols + 1, 6 * rows),
+                             squeeze=False)
+    # Colors over the time the trajectories exist (two series running)
+    running = t[(~np.isnan([r for _, _, r in s])).sum(axis=0) >= 2]
+    norm = Normalize(running[0], running[-1]) if len(running) else None
+    lc = None
+    for ax, (i, j) in zip(axes.flat, pairs):
+        lc = draw_panel(ax, t, s[i][2], s[j][2], s[i][1], s[j][1], len(files),
+                        bw_net, (s[i][0], s[j][0]), arrows, norm) or lc
+    for ax in axes.flat[len(pairs):]:
+        ax.set_visible(False)
+    axes.flat[0].legend(loc='upper right')
+    if lc is not None:
+        fig.colorbar(lc, ax=list(axes.flat[:len(pairs)]), label='Seconds')
+    if out:
+        print('saving to', out)
+        fig.savefig(out)
+        plt.close(fig)
+    return fig
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput phase plot")
+    parser.add_argument('dir', help="Competition result directory")
+    parser.add_argument('--bw-net', '-b', type=float,
+                        help="Bottleneck rate in Mb/s (default: config.json)")
+    parser.add_argument('--mode', choices=['auto', 'flows', 'cc'], default='auto',
+                        help="Projection for more than two flows")
+    parser.add_argument('--dt', type=float, default=0.5,
+                        help="Grid step in seconds")
+    parser.add_argument('--window', type=int, default=1,
+                        help="Moving average over this many grid cells")
+    parser.add_argument('--arrows', type=int, default=30,
+                        help="Direction arrows per trajectory")
+    parser.add_argument('--out', '-o',
+                        help="Output file (default <dir>/throughput_plot.svg)")
+    parser.add_argument('--show', action='store_true', help="Open a window")
+    args = parser.parse_args()
+
+    if not args.show:
+        import matplotlib
+        matplotlib.use('Agg')
+    logs = flow_logs(args.dir)
+    if not logs:
+        sys.exit('%s: no iperf_<flow>.txt logs' % args.dir)
+    config = run_config(args.dir)
+    names = [n for n, _ in logs]
+    bw_net = args.bw_net or config.get('bw_net')
+    out = args.out or (None if args.show else
+                       os.path.join(args.dir, 'throughput_plot.svg'))
+    plot_phase([p for _, p in logs], out, names,
+               flow_ccs(names, config.get('scenario')), bw_net, args.mode,
+               args.dt, args.window, args.arrows)
+    if args.show:
+        import matplotlib.pyplot as plt
+        plt.show()
+
+
+if __name__ == '__main__':
+    main()
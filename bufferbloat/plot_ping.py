@@ -1,64 +1,59 @@
 '''
 Plot ping RTTs over time
 '''
-from helper import *
+from helper_np import *
+from parsers import load
 import plot_defaults
 
 from matplotlib.ticker import MaxNLocator
 from pylab import figure
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--files', '-f',
-                    help="Ping output files to plot",
-                    required=True,
-                    action="store",
-                    nargs='+')
 
-parser.add_argument('--freq',
-                    help="Frequency of pings (per second)",
-                    type=int,
-                    default=10)
+def plot_ping(files, out=None, freq=10):
+    m.rc('figure', figsize=(16, 6))
+    fig = figure()
+    ax = fig.add_subplot(111)
+    for i, f in enumerate(files):
+        # rttprobe.py output carries send times and NaN rtts for losses; for
+        # plain ping output time comes from icmp_seq and lost probes are
+        # filled in as NaN, so both show up as gaps
+        data = load(f, 'ping', interval=1.0 / freq)
+        xaxis = data['time'] - data['time'][0]
+        qlens = data['rtt']
 
-parser.add_argument('--out', '-o',
-                    help="Output png file for the plot.",
-                    default=None) # Will show the plot
+        ax.plot(xaxis, qlens, lw=2)
+        ax.xaxis.set_major_locator(MaxNLocator(4))
 
-args = parser.parse_args()
+    plt.ylabel("RTT (ms)")
+    plt.grid(True)
 
-def parse_ping(fname):
-    ret = []
-    lines = open(fname).readlines()
-    num = 0
-    for line in lines:
-        if 'bytes from' not in line:
-            continue
-        try:
-            rtt = line.split(' ')[-2]
-            rtt = rtt.split('=')[1]
-            rtt = float(rtt)
-            ret.append([num, rtt])
-            num += 1
-        except:
-            break
-    return ret
+    if out:
+        plt.savefig(out)
+        plt.close(fig)
+    else:
+        plt.show()
 
-m.rc('figure', figsize=(16, 6))
-fig = figure()
-ax = fig.add_subplot(111)
-for i, f in enumerate(args.files):
-    data = parse_ping(f)
-    xaxis = list(map(float, list(col(0, data))))
-    start_time = xaxis[0]
-    xaxis = list(map(lambda x: (x - start_time) / args.freq, xaxis))
-    qlens = list(map(float, col(1, data)))
 
-    ax.plot(xaxis, qlens, lw=2)
-    ax.xaxis.set_major_locator(MaxNLocator(4))
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', '-f',
+                        help="Ping output files to plot",
+                        required=True,
+                        action="store",
+                        nargs='+')
 
-plt.ylabel("RTT (ms)")
-plt.grid(True)
+    parser.add_argument('--freq',
+                        help="Frequency of pings (per second)",
+                        type=int,
+                        default=10)
 
-if args.out:
-    plt.savefig(args.out)
-else:
-    plt.show()
+    parser.add_argument('--out', '-o',
+                        help="Output png file for the plot.",
+                        default=None) # Will show the plot
+
+    args = parser.parse_args()
+    plot_ping(args.files, args.out, args.freq)
+
+
+if __name__ == '__main__':
+    main()
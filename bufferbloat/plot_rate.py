@@ -0,0 +1,83 @@
+'''
+Plot link rate (and bottleneck utilization) over time
+'''
+from helper_np import *
+from tsfile import is_binary, read_series
+import plot_defaults
+
+from matplotlib.ticker import MaxNLocator
+from pylab import figure
+
+
+def plot_rate(files, out=None, legend=None, bw_net=None, use_ewma=False):
+    if legend is None:
+        legend = list(files)
+
+    m.rc('figure', figsize=(16, 6))
+    fig = figure()
+    ax = fig.add_subplot(111)
+    column = 'tx_bps_ewma' if use_ewma else 'tx_bps'
+    for i, f in enumerate(files):
+        if is_binary(f):
+            header, data = read_series(f)
+            xaxis = data['time'] - data['time'][0]
+            rate = data[column]
+        else:
+            data = read_list(f)
+            xaxis = col(0, data) - data[0, 0]
+            rate = col(7 if use_ewma else 1, data)
+        if bw_net:
+            rate = 100.0 * rate / (bw_net * 1e6)
+        else:
+            rate = rate / 1e6
+        ax.plot(xaxis, rate, label=legend[i], lw=2)
+        ax.xaxis.set_major_locator(MaxNLocator(4))
+
+    plt.ylabel("Utilization (%)" if bw_net else "Mb/s")
+    plt.grid(True)
+    plt.xlabel("Seconds")
+    if len(files) > 1:
+        plt.legend()
+
+    if out:
+        print('saving to', out)
+        plt.savefig(out)
+        plt.close(fig)
+    else:
+        plt.show()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', '-f',
+                        help="rate_<iface> files written by the link-rate sampler",
+                        required=True,
+                        action="store",
+                        nargs='+')
+
+    parser.add_argument('--legend', '-l',
+                        help="Legend to use if there are multiple plots.  File names used as default.",
+                        action="store",
+                        nargs="+",
+                        default=None)
+
+    parser.add_argument('--bw-net', '-b',
+                        type=float,
+                        help="Bottleneck bandwidth (Mb/s); plots utilization instead of rate",
+                        default=None)
+
+    parser.add_argument('--ewma',
+                        help="Plot the smoothed rate instead of the instantaneous one",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument('--out', '-o',
+                        help="Output png file for the plot.",
+                        default=None) # Will show the plot
+
+    args = parser.parse_args()
+    plot_rate(args.files, args.out, args.legend, args.bw_net, args.ewma)
+
+
+if __name__ == '__main__':
+    main()
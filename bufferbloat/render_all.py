@@ -0,0 +1,247 @@
+'''
+Renders every plot of every result directory in one command.
+
+Result directories are discovered by glob (reno-q*, bbr-q*,
+competition_results/*, resultados, sweeps/* by default) and each gets its
+queue, RTT and bottleneck utilization plots (and the throughput phase plot of
+competition runs, phaseplot.py), named like run.sh does for <cong>-q<N>
+directories (reno-buffer-q20.png, reno-rtt-q20.png) and buffer.png,
+rtt.png, rate.png otherwise.  Plots are rendered by a process pool whose
+workers import matplotlib and the plot modules once; a plot is skipped
+when the hash of its inputs, options and plotting code matches the one
+recorded in <dir>/.render.json and the image exists.
+
+    python3 render_all.py
+    python3 render_all.py reno-q20 competition_results/scenario1_reno_vs_bbr -j 4
+'''
+
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+from time import time
+
+from fairness import flow_logs
+from phaseplot import run_config
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DIRS = ['reno-q*', 'bbr-q*', 'competition_results/*', 'resultados',
+                'sweeps/*']
+CACHE = '.render.json'
+
+# kind: (module, function, output stem)
+PLOTS = {
+    'queue': ('plot_queue', 'plot_queue', 'buffer'),
+    'rtt': ('plot_ping', 'plot_ping', 'rtt'),
+    'rate': ('plot_rate', 'plot_rate', 'rate'),
+    'phase': ('phaseplot', 'plot_phase', 'phase'),
+}
+# Shared by every plot type
+STYLE_SOURCES = ['helper_np.py', 'parsers.py', 'tsfile.py', 'plot_defaults.py',
+                 'fairness.py']
+
+
+def first(d, *names):
+    for name in names:
+        path = os.path.join(d, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def output_path(d, kind):
+    stem = PLOTS[kind][2]
+    m = re.match(r'(\w+)-q(\d+)$', os.path.basename(os.path.normpath(d)))
+    if m and kind != 'rate':
+        return os.path.join(d, '%s-%s-q%s.png' % (m.group(1), stem, m.group(2)))
+    return os.path.join(d, stem + '.png')
+
+
+def run_params(d):
+    # Written by sweep.py
+    try:
+        with open(os.path.join(d, 'params.json')) as f:
+            return json.load(f).get('params', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def bottleneck_rate(d):
+    """Rate log of the bottleneck port: the iface of qdisc.json (aqm.py),
+    else the last port of s0, where both BBTopo (s0-eth2 towards h2) and
+    CompTopo (towards s1) add the bottleneck link."""
+    try:
+        with open(os.path.join(d, 'qdisc.json')) as f:
+            iface = json.load(f)['iface']
+        path = first(d, 'rate_%s.bts' % iface, 'rate_%s.txt' % iface)
+        if path:
+            return path
+    except (OSError, ValueError, KeyError):
+        pass
+    ports = glob.glob(os.path.join(d, 'rate_s0-eth*.*'))
+    port = lambda p: int(re.search(r'-eth(\d+)\.', os.path.basename(p)).group(1))
+    return max(ports, key=port) if ports else None
+
+
+def jobs_for(d):
+    """(kind, inputs, output, kwargs) of every plot the directory supports."""
+    jobs = []
+    buffer = first(d, 'buffer.bts', 'buffer.txt')
+    if buffer:
+        jobs.append(('queue', [buffer], output_path(d, 'queue'), {}))
+    ping = first(d, 'ping.bts', 'ping.txt', 'ping_competition.txt')
+    if ping:
+        jobs.append(('rtt', [ping], output_path(d, 'rtt'), {}))
+    rate = bottleneck_rate(d)
+    if rate:
+        legend = [os.path.basename(rate)[5:].rsplit('.', 1)[0]]
+        jobs.append(('rate', [rate], output_path(d, 'rate'),
+                     {'legend': legend, 'bw_net': run_params(d).get('bw-net') or
+                      run_config(d).get('bw_net')}))
+    logs = flow_logs(d)
+    if len(logs) >= 2:
+        jobs.append(('phase', [p for _, p in logs], output_path(d, 'phase'),
+                     {'names': [n for n, _ in logs],
+                      'bw_net': run_params(d).get('bw-net') or
+                      run_config(d).get('bw_net')}))
+    return jobs
+
+
+def file_digest(path, h):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+
+
+_code_digests = {}
+
+
+def code_digest(kind):
+    if kind not in _code_digests:
+        h = hashlib.sha1()
+        for name in [PLOTS[kind][0] + '.py'] + STYLE_SOURCES:
+            file_digest(os.path.join(HERE, name), h)
+        _code_digests[kind] = h.hexdigest()
+    return _code_digests[kind]
+
+
+def job_digest(job):
+    kind, inputs, out, kwargs = job
+    h = hashlib.sha1(json.dumps([kind, [os.path.basename(i) for i in inputs],
+                                 kwargs], sort_keys=True).encode())
+    h.update(code_digest(kind).encode())
+    for path in inputs:
+        file_digest(path, h)
+    return h.hexdigest()
+
+
+def init_worker():
+    # Pay for matplotlib, the rc setup and the plot modules once per worker
+    import matplotlib
+    matplotlib.use('Agg')
+    for module, _, _ in PLOTS.values():
+        __import__(module)
+
+
+def render(job):
+    kind, inputs, out, kwargs = job
+    module, func, _ = PLOTS[kind]
+    start = time()
+    try:
+        with redirect_stdout(io.StringIO()):
+            getattr(sys.modules[module], func)(inputs, out, **kwargs)
+    except Exception as e:
+        return out, '%s: %s' % (type(e).__name__, e), time() - start
+    return out, None, time() - start
+
+
+def load_cache(d):
+    try:
+        with open(os.path.join(d, CACHE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(d, cache):
+    with open(os.path.join(d, CACHE), 'w') as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+
+
+def discover(patterns):
+    dirs = []
+    for pattern in patterns:
+        for d in sorted(glob.glob(pattern)):
+            if os.path.isdir(d) and d not in dirs and jobs_for(d):
+                dirs.append(d)
+    return dirs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render all result plots")
+    parser.add_argument('dirs', nargs='*', default=DEFAULT_DIRS,
+                        help="Result directories or globs")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(),
+                        help="Worker processes")
+    parser.add_argument('--force', action='store_true',
+                        help="Render even if the inputs did not change")
+    parser.add_argument('--dry-run', '-n', action='store_true',
+                        help="Only list the plots that would be rendered")
+    args = parser.parse_args()
+
+    start = time()
+    caches = {}
+    todo = []
+    fresh = 0
+    for d in discover(args.dirs):
+        caches[d] = load_cache(d)
+        for job in jobs_for(d):
+            digest = job_digest(job)
+            out = os.path.basename(job[2])
+            if not args.force and caches[d].get(out) == digest \
+                    and os.path.exists(job[2]):
+                fresh += 1
+                continue
+            todo.append((job, digest))
+    if args.dry_run:
+        for job, _ in todo:
+            print(job[2])
+        print('%d to render, %d up to date' % (len(todo), fresh))
+        return
+
+    digests = dict((job[2], digest) for job, digest in todo)
+    failed = 0
+    if todo:
+        jobs = [job for job, _ in todo]
+        if args.jobs <= 1 or len(jobs) == 1:
+            init_worker()
+            results = map(render, jobs)
+            pool = None
+        else:
+            pool = Pool(min(args.jobs, len(jobs)), initializer=init_worker)
+            results = pool.imap_unordered(render, jobs)
+        for out, error, seconds in results:
+            d = os.path.dirname(out)
+            if error:
+                failed += 1
+                print('FAILED %s: %s' % (out, error))
+                continue
+            print('%-60s %.2fs' % (out, seconds))
+            caches[d][os.path.basename(out)] = digests[out]
+            save_cache(d, caches[d])
+        if pool is not None:
+            pool.close()
+            pool.join()
+    print('%d rendered, %d up to date, %d failed in %.1fs'
+          % (len(todo) - failed, fresh, failed, time() - start))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
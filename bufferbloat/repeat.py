@@ -0,0 +1,224 @@
+'''
+Repeats experiment configurations until the bootstrap confidence interval
+of a metric is narrow enough, or the trial budget runs out.
+
+Each trial is one sweep.py point with its own --trial number, so trials
+are cached and an interrupted repetition resumes where it stopped.  After
+--min-trials, the per-trial values of the metric are resampled with
+replacement (--resamples at once, as one NumPy index array) and the
+percentile interval of their mean is computed; a configuration stops when
+the interval is narrower than --rel-width of the mean (or --width in
+metric units).  With several configurations (--grid), trials go round
+robin and --until-separated also stops all of them as soon as every
+pair of intervals is disjoint: q=20 vs q=100 needs few trials when the
+difference is large, and trials go where the variance is.
+
+Metrics, one value per trial:
+
+    fetch-mean   mean page fetch time (s), fetch.txt
+    fetch-p99    99th percentile of the page fetch time (s)
+    rtt-p99      99th percentile of the RTT (ms), ping.txt
+    jain         mean Jain index over time, fairness.json
+
+    sudo python3 repeat.py --fixed bw-net=1.5 delay=5 time=60 \\
+        --grid maxq=20,100 --metric fetch-mean --until-separated
+    sudo python3 repeat.py --script bufferbloat_competition.py \\
+        --fixed competition=true scenario=reno_vs_bbr --metric jain --max-trials 20
+'''
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+import sweep
+from parsers import load, parse_series
+from tsfile import fetch_ok, FETCH_FIELDS
+
+
+def fetch_times(run_dir):
+    """Seconds of the successful (2xx) fetches of fetch.txt."""
+    path = os.path.join(run_dir, 'fetch.txt')
+    if not os.path.exists(path):
+        return np.zeros(0)
+    f = parse_series(path, [n for n, _ in FETCH_FIELDS])
+    return f['total_ns'][fetch_ok(f['status'])] / 1e9
+
+
+def rtts(run_dir):
+    for name in ('ping.txt', 'ping_competition.txt'):
+        path = os.path.join(run_dir, name)
+        if os.path.exists(path):
+            rtt = load(path, 'ping')['rtt']
+            return rtt[~np.isnan(rtt)]
+    return np.zeros(0)
+
+
+def nan_if_empty(f, x):
+    return float(f(x)) if len(x) else np.nan
+
+
+def jain(run_dir):
+    try:
+        with open(os.path.join(run_dir, 'fairness.json')) as f:
+            return json.load(f).get('jain_mean', np.nan)
+    except (OSError, ValueError):
+        return np.nan
+
+
+METRICS = {
+    'fetch-mean': lambda d: nan_if_empty(np.mean, fetch_times(d)),
+    'fetch-p99': lambda d: nan_if_empty(lambda x: np.percentile(x, 99), fetch_times(d)),
+    'rtt-p99': lambda d: nan_if_empty(lambda x: np.percentile(x, 99), rtts(d)),
+    'jain': jain,
+}
+
+# Metrics each experiment script produces: competition runs have no page
+# fetches, bufferbloat.py runs no fairness analysis
+SCRIPT_METRICS = {
+    'bufferbloat.py': ['fetch-mean', 'fetch-p99', 'rtt-p99'],
+    'bufferbloat_competition.py': ['rtt-p99', 'jain'],
+}
+
+
+def bootstrap_ci(values, resamples=10000, confidence=0.95, rng=None):
+    """Percentile bootstrap interval of the mean of values."""
+    x = np.asarray(values, dtype=float)
+    rng = rng or np.random.default_rng()
+    idx = rng.integers(0, len(x), size=(resamples, len(x)))
+    means = x[idx].mean(axis=1)
+    alpha = (1 - confidence) / 2
+    lo, hi = np.percentile(means, [100 * alpha, 100 * (1 - alpha)])
+    return float(lo), float(hi)
+
+
+def narrow(ci, mean, width=None, rel_width=None):
+    w = ci[1] - ci[0]
+    if width is not None and w <= width:
+        return True
+    return rel_width is not None and w <= rel_width * abs(mean)
+
+
+def separated(cis):
+    """True if no two intervals overlap."""
+    ordered = sorted(cis)
+    return all(a[1] < b[0] for a, b in zip(ordered, ordered[1:]))
+
+
+class Config(object):
+    def __init__(self, params):
+        self.params = params
+        self.values = []
+        self.runs = []
+        self.ci = None
+        self.stopped = None
+
+    @property
+    def mean(self):
+        return float(np.mean(self.values)) if self.values else np.nan
+
+    def label(self, varying):
+        return ' '.join('%s=%s' % (k, self.params[k]) for k in varying) or 'run'
+
+
+def repeat(configs, trial, metric, min_trials=3, max_trials=10, width=None,
+           rel_width=0.05, until_separated=False, resamples=10000,
+           confidence=0.95, rng=None):
+    """Runs trials round robin until every configuration stopped.
+    trial(params, n) runs trial n and returns its directory."""
+    rng = rng or np.random.default_rng()
+    while True:
+        active = [c for c in configs if c.stopped is None]
+        if not active:
+            return configs
+        for c in active:
+            n = len(c.runs)
+            run_dir = trial(c.params, n)
+            c.runs.append(run_dir)
+            value = METRICS[metric](run_dir) if run_dir else np.nan
+            if not np.isnan(value):
+                c.values.append(value)
+            if len(c.values) >= min(min_trials, max_trials):
+                c.ci = bootstrap_ci(c.values, resamples, confidence, rng)
+                if narrow(c.ci, c.mean, width, rel_width):
+                    c.stopped = 'narrow'
+            if c.stopped is None and len(c.runs) >= max_trials:
+                c.stopped = 'budget'
+        if until_separated and len(configs) > 1 and \
+                all(c.ci is not None for c in configs) and \
+                separated([c.ci for c in configs]):
+            for c in configs:
+                c.stopped = c.stopped or 'separated'
+
+
+def report(configs, metric, varying):
+    print('%-30s %6s %12s %25s %10s' % ('configuration', 'trials', metric,
+                                        'CI', 'stopped'))
+    for c in configs:
+        ci = '[%.4f, %.4f]' % c.ci if c.ci else '-'
+        print('%-30s %6d %12.4f %25s %10s' % (c.label(varying)[:30], len(c.runs),
+                                              c.mean, ci, c.stopped))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adaptive trial repetition")
+    parser.add_argument('--script', default='bufferbloat.py')
+    parser.add_argument('--fixed', nargs='+', metavar='NAME=VALUE',
+                        help="Parameters shared by every configuration")
+    parser.add_argument('--grid', nargs='+', metavar='NAME=V1,V2',
+                        help="Configurations to compare")
+    parser.add_argument('--metric', choices=sorted(METRICS), default='fetch-mean')
+    parser.add_argument('--min-trials', type=int, default=3)
+    parser.add_argument('--max-trials', type=int, default=10,
+                        help="Trial budget per configuration")
+    parser.add_argument('--rel-width', type=float, default=0.05,
+                        help="Target CI width relative to the mean")
+    parser.add_argument('--width', type=float,
+                        help="Target CI width in metric units")
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--resamples', type=int, default=10000)
+    parser.add_argument('--until-separated', action='store_true',
+                        help="Stop when the intervals of all configurations are disjoint")
+    parser.add_argument('--seed', type=int, help="Bootstrap RNG seed")
+    parser.add_argument('--root', default='sweeps')
+    parser.add_argument('--cleanup', choices=['on-failure', 'always', 'never'],
+                        default='on-failure')
+    parser.add_argument('--out', '-o', help="JSON report")
+    args = parser.parse_args()
+    known = SCRIPT_METRICS.get(os.path.basename(args.script))
+    if known is not None and args.metric not in known:
+        parser.error('%s does not produce %s (use %s)' % (
+            args.script, args.metric, ', '.join(known)))
+
+    fixed = sweep.parse_assignments(args.fixed, multi=False)
+    grid = sweep.parse_assignments(args.grid, multi=True)
+    varying = sorted(grid)
+    configs = [Config(p) for p in sweep.expand(fixed, grid)]
+    code = sweep.code_version(args.script)
+
+    def trial(params, n):
+        key, status = sweep.run_point(args.script, dict(params, trial=n),
+                                      args.root, code, args.cleanup)
+        print('%s trial %d: %s/%s %s' % (' '.join('%s=%s' % (k, params[k])
+                                                  for k in varying),
+                                         n, args.root, key, status))
+        if status not in ('done', 'cached'):
+            return None
+        return os.path.join(args.root, key)
+
+    repeat(configs, trial, args.metric, args.min_trials, args.max_trials,
+           args.width, args.rel_width, args.until_separated, args.resamples,
+           args.confidence, np.random.default_rng(args.seed))
+    report(configs, args.metric, varying)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'metric': args.metric, 'confidence': args.confidence,
+                       'configs': [{'params': c.params, 'values': c.values,
+                                    'mean': c.mean, 'ci': c.ci,
+                                    'stopped': c.stopped, 'runs': c.runs}
+                                   for c in configs]}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
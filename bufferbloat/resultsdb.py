@@ -0,0 +1,431 @@
+'''
+Indexed SQLite store of experiment results.
+
+One row per run in `runs`, with the full argparse configuration and the
+environment of the run (config.json, written by bufferbloat.py and
+bufferbloat_competition.py, or sweep.py's params.json), plus the columns
+the usual questions filter on (cc, maxq, bw_net, delay, aqm, scenario).
+Runs older than config.json get those inferred from the directory and
+file names (reno-q20, competition_results/scenario1_reno_vs_bbr, ...);
+runs are keyed by their real path, so two directories describing the
+same scenario stay two runs.  The samples go to one table per kind, all
+indexed on (run_id, time):
+
+    queue       buffer.txt                    time, qlen, backlog, drops
+    rtt         ping.txt, ping_competition    time, seq, rtt (NULL = loss)
+    throughput  iperf_<flow>.txt, rate_*.txt  source, time, bps
+    fetch       fetch.txt                     time, connect_ns, ttfb_ns,
+                                              total_ns, bytes, status
+
+Files are read with parsers.py (text or .bts) and inserted with one
+executemany per file inside a single transaction per run; importing a
+directory again replaces its run.  Queries return NumPy structured
+arrays:
+
+    db = ResultsDB('results.db')
+    reno = db.runs(cc='reno')
+    maxq, p99 = reno['maxq'], db.stat('rtt', 'rtt', 99, ids=reno['id'])
+    samples = db.samples('queue', reno['id'][0])
+
+    python3 resultsdb.py import reno-q20 reno-q100 competition_results sweeps
+    python3 resultsdb.py runs --cc reno
+    python3 resultsdb.py stat rtt rtt --pct 99 --by maxq --cc reno
+'''
+
+import argparse
+import glob
+import json
+import os
+import platform
+import re
+import socket
+import sqlite3
+import subprocess
+import sys
+from itertools import repeat
+from time import time
+
+import numpy as np
+
+from parsers import load, parse_iperf, parse_series
+from tsfile import get_epoch, FETCH_FIELDS
+
+DEFAULT_DB = 'results.db'
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+RUN_COLUMNS = [('id', 'INTEGER PRIMARY KEY'), ('path', 'TEXT UNIQUE NOT NULL'),
+               ('name', 'TEXT'), ('script', 'TEXT'), ('cc', 'TEXT'),
+               ('flows', 'TEXT'), ('maxq', 'INTEGER'), ('bw_net', 'REAL'),
+               ('delay', 'REAL'), ('aqm', 'TEXT'), ('scenario', 'TEXT'),
+               ('started', 'REAL'), ('verdict', 'TEXT'), ('inferred', 'INTEGER'),
+               ('imported', 'REAL'), ('config', 'TEXT'), ('env', 'TEXT')]
+SAMPLE_COLUMNS = {
+    'queue': [('time', 'REAL'), ('qlen', 'INTEGER'), ('backlog', 'INTEGER'),
+              ('drops', 'INTEGER')],
+    'rtt': [('time', 'REAL'), ('seq', 'INTEGER'), ('rtt', 'REAL')],
+    'throughput': [('source', 'TEXT'), ('time', 'REAL'), ('bps', 'REAL')],
+    'fetch': [(n, 'REAL' if t == 'f8' else 'INTEGER') for n, t in FETCH_FIELDS],
+}
+# Columns of runs that runs()/stat() filter on
+FILTERS = ['cc', 'flows', 'maxq', 'bw_net', 'delay', 'aqm', 'scenario',
+           'script', 'name', 'verdict']
+
+
+def environment():
+    """What config.json records about the machine running the experiment."""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=HERE,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    try:
+        cc = open('/proc/sys/net/ipv4/tcp_available_congestion_control').read().split()
+    except OSError:
+        cc = None
+    return {'hostname': socket.gethostname(), 'kernel': platform.release(),
+            'python': platform.python_version(), 'cpus': os.cpu_count(),
+            'commit': commit, 'available_cc': cc, 'argv': sys.argv}
+
+
+def write_config(outdir, args, script):
+    """config.json of a run: its argparse namespace, environment and the
+    (wall, monotonic) epoch of the experiment clock."""
+    with open(os.path.join(outdir, 'config.json'), 'w') as f:
+        json.dump({'script': os.path.basename(script), 'args': vars(args),
+                   'env': environment(), 'started': time(),
+                   'epoch': get_epoch()}, f, indent=1, default=str)
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def find(run_dir, pattern):
+    """Files of a run matching pattern, as text or .bts."""
+    return sorted(glob.glob(os.path.join(run_dir, pattern + '.txt')) +
+                  glob.glob(os.path.join(run_dir, pattern + '.bts')))
+
+
+def stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def iperf_flows(run_dir):
+    """Flow names of the iperf_<flow> logs of a run."""
+    return [stem(p)[len('iperf_'):] for p in find(run_dir, 'iperf_*')]
+
+
+def describe(run_dir):
+    """Row of runs for a result directory (everything but id/imported)."""
+    path = os.path.realpath(run_dir)
+    name = os.path.basename(path)
+    config = read_json(os.path.join(path, 'config.json'))
+    inferred = config is None
+    if config is None:
+        params = read_json(os.path.join(path, 'params.json'))
+        if params is not None:
+            config = {'script': params.get('script'),
+                      'args': dict((k.replace('-', '_'), v)
+                                   for k, v in params['params'].items())}
+    if config is None:
+        config = {'script': None, 'args': {}}
+    args = dict(config.get('args') or {})
+
+    flows = iperf_flows(path)
+    # Legacy result trees: <cc>-q<maxq>, scenario<N>_<scenario> and
+    # iperf_<host>_<cc> logs
+    m = re.match(r'([a-z]+)-q(\d+)$', name)
+    if inferred and m:
+        args.setdefault('cong', m.group(1))
+        args.setdefault('maxq', int(m.group(2)))
+    m = re.match(r'scenario\d+_(.+)$', name)
+    if inferred and m:
+        args.setdefault('scenario', m.group(1))
+    ccs = [f.rsplit('_', 1)[-1].lower() for f in flows if '_' in f]
+    if args.get('competition') or args.get('scenario') or (inferred and flows):
+        cc = ccs[0] if ccs and len(set(ccs)) == 1 else None
+    else:
+        cc = args.get('cong')
+
+    fidelity = read_json(os.path.join(path, 'fidelity.json')) or {}
+    started = config.get('started')
+    if started is None:
+        done = read_json(os.path.join(path, 'done.json')) or {}
+        if 'finished' in done and 'seconds' in done:
+            started = done['finished'] - done['seconds']
+    return {'path': path, 'name': name, 'script': config.get('script'),
+            'cc': cc, 'flows': ','.join(ccs) or None,
+            'maxq': args.get('maxq'), 'bw_net': args.get('bw_net'),
+            'delay': args.get('delay'), 'aqm': args.get('aqm'),
+            'scenario': args.get('scenario'), 'started': started,
+            'verdict': fidelity.get('verdict'), 'inferred': int(inferred),
+            'config': json.dumps(args, default=str),
+            'env': json.dumps(config.get('env'))}
+
+
+def columns(recs, names, n):
+    """Python lists of the named fields, None where recs lack one."""
+    return [recs[c].tolist() if c in recs.dtype.names else [None] * n
+            for c in names]
+
+
+def read_samples(run_dir):
+    """(table, rows) pairs of a run, rows without run_id."""
+    for path in find(run_dir, 'buffer'):
+        q = load(path, 'buffer')
+        yield 'queue', zip(*columns(q, ['time', 'qlen', 'backlog', 'drops'], len(q)))
+    for path in find(run_dir, 'ping') + find(run_dir, 'ping_competition'):
+        p = load(path, 'ping')
+        yield 'rtt', zip(*columns(p, ['time', 'seq', 'rtt'], len(p)))
+    for path in find(run_dir, 'iperf_*'):
+        intervals, _ = parse_iperf(path)
+        # Epoch of the report for CSV logs, else the end of the interval
+        # in seconds since the start of the flow
+        t = np.where(np.isnan(intervals['time']), intervals['end'], intervals['time'])
+        yield 'throughput', zip(repeat(stem(path)[len('iperf_'):]), t.tolist(),
+                                intervals['bps'].tolist())
+    for path in find(run_dir, 'rate_*'):
+        r = load(path, 'rate')
+        yield 'throughput', zip(repeat(stem(path)), r['time'].tolist(),
+                                r['tx_bps'].tolist())
+    for path in find(run_dir, 'fetch'):
+        f = load(path, 'fetch') if path.endswith('.bts') else \
+            parse_series(path, [n for n, _ in FETCH_FIELDS])
+        names = [n for n, _ in SAMPLE_COLUMNS['fetch']]
+        yield 'fetch', zip(*columns(f, names, len(f)))
+
+
+def is_run(path):
+    return any(os.path.exists(os.path.join(path, f)) for f in
+               ('config.json', 'done.json', 'buffer.txt', 'buffer.bts'))
+
+
+def run_dirs(roots):
+    """Result directories under the given roots."""
+    for root in roots:
+        for path, dirs, _ in os.walk(root):
+            dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+            if is_run(path):
+                yield path
+
+
+def to_array(cursor):
+    """Rows of a cursor as a structured array: integer columns as i8,
+    numeric ones as f8 (NULL = NaN), the rest as strings."""
+    names = [d[0] for d in cursor.description]
+    rows = cursor.fetchall()
+    cols = list(zip(*rows)) if rows else [()] * len(names)
+    arrays = []
+    for col in cols:
+        if all(isinstance(v, int) for v in col):
+            arrays.append(np.array(col, dtype='i8'))
+        elif all(v is None or isinstance(v, (int, float)) for v in col):
+            arrays.append(np.array(col, dtype='f8'))
+        else:
+            arrays.append(np.array(['' if v is None else str(v) for v in col]))
+    out = np.empty(len(rows), dtype=[(n, a.dtype) for n, a in zip(names, arrays)])
+    for n, a in zip(names, arrays):
+        out[n] = a
+    return out
+
+
+def sample_columns(table, columns=None):
+    """Checked column names of a sample table (all with None); they go
+    into SQL text, so anything else raises ValueError."""
+    if table not in SAMPLE_COLUMNS:
+        raise ValueError('unknown table %r' % table)
+    known = [n for n, _ in SAMPLE_COLUMNS[table]]
+    for c in columns or []:
+        if c not in known:
+            raise ValueError('unknown %s column %r (have %s)' %
+                             (table, c, ', '.join(known)))
+    return list(columns or known)
+
+
+class ResultsDB(object):
+    def __init__(self, path=DEFAULT_DB):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.create()
+
+    def close(self):
+        self.conn.close()
+
+    def create(self):
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS runs (%s)' %
+                              ', '.join('%s %s' % c for c in RUN_COLUMNS))
+            for col in ('cc', 'maxq', 'scenario'):
+                self.conn.execute('CREATE INDEX IF NOT EXISTS runs_%s ON runs (%s)'
+                                  % (col, col))
+            for table, cols in SAMPLE_COLUMNS.items():
+                self.conn.execute('CREATE TABLE IF NOT EXISTS %s (run_id INTEGER '
+                                  'NOT NULL REFERENCES runs(id), %s)' %
+                                  (table, ', '.join('%s %s' % c for c in cols)))
+                self.conn.execute('CREATE INDEX IF NOT EXISTS %s_run ON %s '
+                                  '(run_id, time)' % (table, table))
+
+    def import_run(self, run_dir):
+        """Imports (or re-imports) a result directory.  Returns the run id
+        and the number of samples."""
+        row = describe(run_dir)
+        row['imported'] = time()
+        count = 0
+        with self.conn:
+            old = self.conn.execute('SELECT id FROM runs WHERE path = ?',
+                                    (row['path'],)).fetchone()
+            if old:
+                self.delete(old[0])
+            names = list(row)
+            cur = self.conn.execute('INSERT INTO runs (%s) VALUES (%s)' %
+                                    (', '.join(names), ', '.join('?' * len(names))),
+                                    [row[n] for n in names])
+            run_id = cur.lastrowid
+            for table, rows in read_samples(run_dir):
+                cols = ['run_id'] + [n for n, _ in SAMPLE_COLUMNS[table]]
+                cur = self.conn.executemany(
+                    'INSERT INTO %s (%s) VALUES (%s)' %
+                    (table, ', '.join(cols), ', '.join('?' * len(cols))),
+                    (((run_id,) + tuple(r)) for r in rows))
+                count += cur.rowcount
+        return run_id, count
+
+    def delete(self, run_id):
+        for table in SAMPLE_COLUMNS:
+            self.conn.execute('DELETE FROM %s WHERE run_id = ?' % table, (run_id,))
+        self.conn.execute('DELETE FROM runs WHERE id = ?', (run_id,))
+
+    def query(self, sql, *params):
+        """Any SELECT, as a structured array."""
+        return to_array(self.conn.execute(sql, params))
+
+    def where(self, ids=None, **filters):
+        """WHERE clause on runs: equality (or IN for lists) per column."""
+        terms, params = [], []
+        if ids is not None:
+            filters['id'] = ids
+        for col, value in sorted(filters.items()):
+            if value is None:
+                continue
+            if col not in FILTERS + ['id']:
+                raise ValueError('unknown run column %r' % col)
+            if np.ndim(value):
+                value = np.asarray(value).tolist()
+                terms.append('%s IN (%s)' % (col, ', '.join('?' * len(value))))
+                params.extend(value)
+            else:
+                terms.append('%s = ?' % col)
+                params.append(value.item() if hasattr(value, 'item') else value)
+        return (' WHERE ' + ' AND '.join(terms)) if terms else '', params
+
+    def runs(self, ids=None, **filters):
+        """Matching runs (without config/env), ordered by id."""
+        clause, params = self.where(ids, **filters)
+        cols = [n for n, _ in RUN_COLUMNS if n not in ('config', 'env')]
+        return self.query('SELECT %s FROM runs%s ORDER BY id' %
+                          (', '.join(cols), clause), *params)
+
+    def config(self, run_id):
+        """(args, env) dicts of a run."""
+        row = self.conn.execute('SELECT config, env FROM runs WHERE id = ?',
+                                (int(run_id),)).fetchone()
+        return json.loads(row[0]), json.loads(row[1])
+
+    def samples(self, table, run_ids, columns=None):
+        """Samples of one or more runs, ordered by run and time."""
+        names = sample_columns(table, columns)
+        ids = np.atleast_1d(run_ids).tolist()
+        cols = ['run_id'] + names
+        return self.query('SELECT %s FROM %s WHERE run_id IN (%s) ORDER BY '
+                          'run_id, time' % (', '.join(cols), table,
+                                            ', '.join('?' * len(ids))), *ids)
+
+    def stat(self, table, column, pct=50, ids=None, **filters):
+        """Percentile of a sample column per run, in the order of
+        runs(ids, **filters); NaN for runs without samples.  NULLs (ping
+        losses) are left out."""
+        sample_columns(table, [column])
+        ids = self.runs(ids, **filters)['id']
+        out = np.full(len(ids), np.nan)
+        if not len(ids):
+            return out
+        s = self.query('SELECT run_id, %s FROM %s WHERE run_id IN (%s) AND %s '
+                       'IS NOT NULL ORDER BY run_id' %
+                       (column, table, ', '.join('?' * len(ids)), column),
+                       *ids.tolist())
+        if not len(s):
+            return out
+        starts = np.flatnonzero(np.diff(s['run_id'])) + 1
+        for start, group in zip(np.concatenate([[0], starts]),
+                                np.split(s[column], starts)):
+            out[np.searchsorted(ids, s['run_id'][start])] = np.percentile(group, pct)
+        return out
+
+
+def text(value):
+    if isinstance(value, float):
+        return '' if np.isnan(value) else '%g' % value
+    return str(value)
+
+
+def add_filters(parser):
+    for col in FILTERS:
+        kind = {'maxq': int, 'bw_net': float, 'delay': float}.get(col, str)
+        parser.add_argument('--' + col.replace('_', '-'), type=kind)
+
+
+def filters(args):
+    return dict((col, getattr(args, col)) for col in FILTERS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite results store")
+    parser.add_argument('--db', default=DEFAULT_DB)
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('import', help="Import result directories (recursively)")
+    p.add_argument('roots', nargs='+')
+    p = sub.add_parser('runs', help="List runs")
+    add_filters(p)
+    p = sub.add_parser('stat', help="Percentile of a sample column per run")
+    p.add_argument('table', choices=sorted(SAMPLE_COLUMNS))
+    p.add_argument('column')
+    p.add_argument('--pct', type=float, default=50)
+    p.add_argument('--by', default='id', help="Run column to sort by")
+    add_filters(p)
+    args = parser.parse_args()
+
+    db = ResultsDB(args.db)
+    if args.cmd == 'import':
+        for path in run_dirs(args.roots):
+            start = time()
+            run_id, count = db.import_run(path)
+            print('%4d %-50s %9d samples %6.2fs' % (run_id, path, count, time() - start))
+    elif args.cmd == 'runs':
+        runs = db.runs(**filters(args))
+        cols = ['id', 'name', 'cc', 'flows', 'maxq', 'bw_net', 'delay', 'aqm',
+                'scenario', 'verdict']
+        fmt = '%4s %-32s %-6s %-16s %5s %6s %5s %-8s %-22s %s'
+        print(fmt % tuple(cols))
+        for r in runs:
+            print(fmt % tuple(text(r[c])[:32] for c in cols))
+    else:
+        runs = db.runs(**filters(args))
+        try:
+            values = db.stat(args.table, args.column, args.pct, ids=runs['id'])
+        except ValueError as e:
+            parser.error(str(e))
+        order = np.argsort(runs[args.by], kind='stable')
+        print('%-36s %8s %12s' % ('run', args.by, 'p%g %s' % (args.pct, args.column)))
+        for i in order:
+            print('%-36s %8s %12.3f' % (runs['name'][i][:36], text(runs[args.by][i]),
+                                        values[i]))
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
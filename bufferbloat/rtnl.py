@@ -0,0 +1,288 @@
+'''
+Minimal rtnetlink client used to read qdisc statistics without forking tc.
+
+The decoder functions work on raw bytes so they can be checked against
+netlink messages captured from a live kernel (e.g. with QdiscSampler.raw).
+Sockets can be opened in the network namespace of another process (a
+Mininet host) by pid.
+'''
+
+import ctypes
+import ctypes.util
+import os
+import socket
+import struct
+from collections import namedtuple
+from contextlib import contextmanager
+
+NETLINK_ROUTE = 0
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWQDISC = 36
+RTM_GETQDISC = 38
+RTM_NEWTCLASS = 40
+RTM_GETTCLASS = 42
+
+NLM_F_REQUEST = 0x1
+NLM_F_MULTI = 0x2
+NLM_F_DUMP = 0x300
+
+TCA_KIND = 1
+TCA_OPTIONS = 2
+TCA_STATS = 3
+TCA_XSTATS = 4
+TCA_STATS2 = 7
+
+TCA_STATS_BASIC = 1
+TCA_STATS_APP = 4
+TCA_STATS_QUEUE = 3
+
+TC_H_ROOT = 0xFFFFFFFF
+TC_H_INGRESS = 0xFFFFFFF1
+
+CLONE_NEWNET = 0x40000000
+
+# netem options: struct tc_netem_qopt, then rtattrs (TCA_NETEM_LATENCY64
+# in ns since Linux 4.15; before, latency in psched ticks of 64 ns)
+NETEM_QOPT = struct.Struct('=IIIIII')
+TCA_NETEM_LATENCY64 = 10
+PSCHED_SHIFT = 6
+# htb class options: TCA_HTB_PARMS (struct tc_htb_opt, starting with the
+# rate tc_ratespec whose last field is the rate in bytes/s) and
+# TCA_HTB_RATE64 for rates that do not fit in 32 bits
+TCA_HTB_PARMS = 1
+TCA_HTB_RATE64 = 6
+HTB_RATESPEC = struct.Struct('=BBHhHI')
+U64 = struct.Struct('=Q')
+
+NLMSGHDR = struct.Struct('=IHHII')
+TCMSG = struct.Struct('=BBHiIII')
+RTATTR = struct.Struct('=HH')
+NLMSGERR = struct.Struct('=i')
+# struct gnet_stats_basic / gnet_stats_queue (include/uapi/linux/gen_stats.h)
+GNET_STATS_BASIC = struct.Struct('=QI')
+GNET_STATS_QUEUE = struct.Struct('=IIIII')
+# Legacy struct tc_stats, only used when TCA_STATS2 is missing
+TC_STATS = struct.Struct('=QIIIIIII')
+
+Qdisc = namedtuple('Qdisc', ['ifindex', 'handle', 'parent', 'kind',
+                             'bytes', 'packets', 'qlen', 'backlog',
+                             'drops', 'requeues', 'overlimits',
+                             'options', 'xstats'])
+
+
+def align(n):
+    return (n + 3) & ~3
+
+
+def parse_handle(s):
+    """'10:' => 0x000a0000, '5:1' => 0x00050001, 'root' => TC_H_ROOT"""
+    if s == 'root':
+        return TC_H_ROOT
+    major, _, minor = s.partition(':')
+    return (int(major or '0', 16) << 16) | int(minor or '0', 16)
+
+
+def format_handle(h):
+    if h == TC_H_ROOT:
+        return 'root'
+    return '%x:%x' % (h >> 16, h & 0xFFFF) if h & 0xFFFF else '%x:' % (h >> 16)
+
+
+def parse_attrs(buf, offset=0, end=None):
+    """Returns {type: bytes} for the rtattrs in buf[offset:end]."""
+    if end is None:
+        end = len(buf)
+    attrs = {}
+    while offset + RTATTR.size <= end:
+        length, kind = RTATTR.unpack_from(buf, offset)
+        if length < RTATTR.size:
+            break
+        # Strip NLA_F_NESTED / NLA_F_NET_BYTEORDER
+        attrs[kind & 0x3FFF] = bytes(buf[offset + RTATTR.size:offset + length])
+        offset += align(length)
+    return attrs
+
+
+def iter_messages(buf, length=None):
+    """Yields (type, flags, seq, payload) for each nlmsghdr in buf."""
+    if length is None:
+        length = len(buf)
+    offset = 0
+    while offset + NLMSGHDR.size <= length:
+        msg_len, msg_type, flags, seq, pid = NLMSGHDR.unpack_from(buf, offset)
+        if msg_len < NLMSGHDR.size or offset + msg_len > length:
+            break
+        yield msg_type, flags, seq, buf[offset + NLMSGHDR.size:offset + msg_len]
+        offset += align(msg_len)
+
+
+def decode_qdisc(payload):
+    """Decodes the payload of one RTM_NEWQDISC message."""
+    family, _, _, ifindex, handle, parent, info = TCMSG.unpack_from(payload, 0)
+    attrs = parse_attrs(payload, TCMSG.size)
+    kind = attrs.get(TCA_KIND, b'').rstrip(b'\0').decode('ascii', 'replace')
+    nbytes = packets = qlen = backlog = drops = requeues = overlimits = 0
+    xstats = attrs.get(TCA_XSTATS)
+    if TCA_STATS2 in attrs:
+        stats = parse_attrs(attrs[TCA_STATS2])
+        # Nested application stats (CAKE) only come inside TCA_STATS2
+        xstats = xstats or stats.get(TCA_STATS_APP)
+        if TCA_STATS_BASIC in stats:
+            nbytes, packets = GNET_STATS_BASIC.unpack_from(stats[TCA_STATS_BASIC])
+        if TCA_STATS_QUEUE in stats:
+            qlen, backlog, drops, requeues, overlimits = \
+                GNET_STATS_QUEUE.unpack_from(stats[TCA_STATS_QUEUE])
+    elif TCA_STATS in attrs:
+        nbytes, packets, drops, overlimits, _, _, qlen, backlog = \
+            TC_STATS.unpack_from(attrs[TCA_STATS])
+    return Qdisc(ifindex, handle, parent, kind, nbytes, packets, qlen,
+                 backlog, drops, requeues, overlimits,
+                 attrs.get(TCA_OPTIONS), xstats)
+
+
+def netem_options(options):
+    """(delay in seconds, limit in packets) of a netem TCA_OPTIONS."""
+    latency, limit = NETEM_QOPT.unpack_from(options, 0)[:2]
+    attrs = parse_attrs(options, NETEM_QOPT.size)
+    if TCA_NETEM_LATENCY64 in attrs:
+        return U64.unpack_from(attrs[TCA_NETEM_LATENCY64])[0] / 1e9, limit
+    return (latency << PSCHED_SHIFT) / 1e9, limit
+
+
+def htb_rate(options):
+    """Rate in bits/s of an htb class TCA_OPTIONS."""
+    attrs = parse_attrs(options)
+    if TCA_HTB_RATE64 in attrs:
+        return U64.unpack_from(attrs[TCA_HTB_RATE64])[0] * 8
+    return HTB_RATESPEC.unpack_from(attrs[TCA_HTB_PARMS])[-1] * 8
+
+
+def decode_dump(buf, length=None):
+    """Decodes one recv() worth of a qdisc (or traffic class) dump.
+
+    Returns (qdiscs, done).  Raises OSError if the kernel answered with an
+    error message."""
+    ret = []
+    done = False
+    for msg_type, flags, seq, payload in iter_messages(buf, length):
+        if msg_type == NLMSG_DONE:
+            done = True
+        elif msg_type == NLMSG_ERROR:
+            err, = NLMSGERR.unpack_from(payload, 0)
+            if err:
+                raise OSError(-err, os.strerror(-err))
+            done = True
+        elif msg_type in (RTM_NEWQDISC, RTM_NEWTCLASS):
+            ret.append(decode_qdisc(payload))
+    return ret, done
+
+
+def pick_qdisc(qdiscs, handle=None):
+    """Chooses the qdisc that holds the queue we care about.
+
+    With an explicit handle that one is returned.  Otherwise the first
+    non-root qdisc wins: on a TCLink that is the netem child of the htb
+    root, where max_queue_size is enforced.  Falls back to the root."""
+    if handle is not None:
+        for q in qdiscs:
+            if q.handle == handle:
+                return q
+        return None
+    for q in qdiscs:
+        if q.parent not in (TC_H_ROOT, TC_H_INGRESS):
+            return q
+    return qdiscs[0] if qdiscs else None
+
+
+_libc = None
+
+
+def setns(fd, nstype):
+    if hasattr(os, 'setns'):
+        return os.setns(fd, nstype)
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    if _libc.setns(fd, nstype) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+
+@contextmanager
+def netns(pid=None):
+    """Runs the block in the network namespace of pid (ours if None);
+    sockets created inside stay in that namespace."""
+    if pid is None:
+        yield
+        return
+    own = os.open('/proc/self/ns/net', os.O_RDONLY)
+    target = os.open('/proc/%d/ns/net' % pid, os.O_RDONLY)
+    try:
+        setns(target, CLONE_NEWNET)
+        try:
+            yield
+        finally:
+            setns(own, CLONE_NEWNET)
+    finally:
+        os.close(own)
+        os.close(target)
+
+
+def netlink_socket(proto, pid=None):
+    """Netlink socket in the network namespace of pid (ours if None)."""
+    with netns(pid):
+        return socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, proto)
+
+
+class QdiscSampler(object):
+    """Keeps one rtnetlink socket open and dumps the qdiscs of an iface
+    (of the network namespace of pid, if given)."""
+
+    def __init__(self, iface, bufsize=65536, pid=None):
+        self.iface = iface
+        with netns(pid):
+            self.ifindex = socket.if_nametoindex(iface)
+            self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                      NETLINK_ROUTE)
+        self.sock.bind((0, 0))
+        self.buf = bytearray(bufsize)
+        self.seq = 0
+
+    def raw(self, msg_type=RTM_GETQDISC):
+        """Sends one dump request and returns the raw reply chunks."""
+        self._request(msg_type)
+        chunks = []
+        while True:
+            n = self.sock.recv_into(self.buf)
+            chunks.append(bytes(self.buf[:n]))
+            if decode_dump(self.buf, n)[1]:
+                return chunks
+
+    def dump(self, msg_type=RTM_GETQDISC):
+        self._request(msg_type)
+        ret = []
+        while True:
+            n = self.sock.recv_into(self.buf)
+            qdiscs, done = decode_dump(self.buf, n)
+            ret.extend(q for q in qdiscs if q.ifindex == self.ifindex)
+            if done:
+                return ret
+
+    def sample(self, handle=None):
+        return pick_qdisc(self.dump(), handle)
+
+    def classes(self):
+        """Traffic classes of the iface, as Qdisc tuples."""
+        return self.dump(RTM_GETTCLASS)
+
+    def close(self):
+        self.sock.close()
+
+    def _request(self, msg_type=RTM_GETQDISC):
+        self.seq += 1
+        tcm = TCMSG.pack(socket.AF_UNSPEC, 0, 0, self.ifindex, 0, 0, 0)
+        hdr = NLMSGHDR.pack(NLMSGHDR.size + len(tcm), msg_type,
+                            NLM_F_REQUEST | NLM_F_DUMP, self.seq, 0)
+        self.sock.send(hdr + tcm)
@@ -0,0 +1,275 @@
+'''
+Timestamped asyncio RTT prober, used instead of `ping -i 0.1 > ping.txt`.
+
+Probes are sent on absolute deadlines and many can be in flight at once,
+so intervals down to 1 ms work.  Every probe produces one record with its
+send time, receive time and RTT; a probe without an answer after
+--timeout is written as a loss (NaN rtt / recv_time) instead of being
+silently skipped.  The RTT comes from the wall clock send time and the
+kernel receive timestamp, the record times are on the experiment clock
+(tsfile.clock()).  Records are written in sequence order through
+tsfile.open_series, so the output is either a commented CSV or a .bts file.
+
+Socket types are tried in order: unprivileged ICMP datagram socket, raw
+ICMP socket (needs root, which Mininet hosts have), then UDP towards an
+echo server started with --echo-server.  Over loopback:
+
+    python3 rttprobe.py --echo-server --port 7007 &
+    python3 rttprobe.py 127.0.0.1 -i 0.001 -c 1000 -o /tmp/rtt.txt
+'''
+
+import argparse
+import asyncio
+import math
+import os
+import signal
+import socket
+import struct
+from collections import deque
+from time import time_ns
+
+from tsfile import clock, open_series, RTT_FIELDS
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+ICMP_HDR = struct.Struct('!BBHHH')
+# 32-bit sequence number in the payload: the 16-bit ICMP one wraps after
+# ~65 s at 1 ms intervals
+PAYLOAD = struct.Struct('!I')
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35)
+TIMESPEC = struct.Struct('=qq')
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    s = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    s = (s >> 16) + (s & 0xFFFF)
+    s += s >> 16
+    return ~s & 0xFFFF
+
+
+def icmp_echo(ident, seq, payload):
+    hdr = ICMP_HDR.pack(ICMP_ECHO_REQUEST, 0, 0, ident, seq & 0xFFFF)
+    return ICMP_HDR.pack(ICMP_ECHO_REQUEST, 0, checksum(hdr + payload), ident,
+                         seq & 0xFFFF) + payload
+
+
+def open_socket(mode, dest, port):
+    """Returns (sock, mode) for the first socket type that can be opened."""
+    modes = ['icmp', 'raw', 'udp'] if mode == 'auto' else [mode]
+    for m in modes:
+        try:
+            if m == 'icmp':
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+                                     socket.IPPROTO_ICMP)
+            elif m == 'raw':
+                sock = socket.socket(socket.AF_INET, socket.SOCK_RAW,
+                                     socket.IPPROTO_ICMP)
+            else:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.connect((dest, port))
+        except PermissionError:
+            continue
+        sock.setblocking(False)
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        return sock, m
+    raise PermissionError('no usable socket type among %s' % ', '.join(modes))
+
+
+def parse_reply(data, mode, ident):
+    """Returns the 32-bit probe sequence number carried by a reply, or None
+    if the datagram is not an answer to one of our probes."""
+    if mode == 'udp':
+        off = 0
+    else:
+        off = (data[0] & 0x0F) * 4 if mode == 'raw' else 0
+        if len(data) < off + ICMP_HDR.size + PAYLOAD.size:
+            return None
+        kind, code, _, rid, _ = ICMP_HDR.unpack_from(data, off)
+        # Datagram ICMP sockets get their id rewritten and filtered by the
+        # kernel; raw sockets see every ICMP packet on the host
+        if kind != ICMP_ECHO_REPLY or (mode == 'raw' and rid != ident):
+            return None
+        off += ICMP_HDR.size
+    if len(data) < off + PAYLOAD.size:
+        return None
+    return PAYLOAD.unpack_from(data, off)[0]
+
+
+def rx_timestamp(ancdata):
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS:
+            sec, nsec = TIMESPEC.unpack_from(data)
+            return sec * 1000000000 + nsec
+    return time_ns()
+
+
+class Prober(object):
+    def __init__(self, dest, out, interval=0.1, count=None, deadline=None,
+                 timeout=2.0, size=56, mode='auto', port=7007):
+        self.dest = dest
+        self.out = out
+        self.interval = interval
+        self.count = count
+        self.deadline = deadline
+        self.timeout_ns = int(timeout * 1e9)
+        self.size = max(size, PAYLOAD.size)
+        self.port = port
+        self.sock, self.mode = open_socket(mode, dest, port)
+        self.ident = os.getpid() & 0xFFFF
+        self.seq = 0
+        # Probes in sequence order: [seq, send_ns, recv_ns or None, stamp]
+        self.inflight = deque()
+        self.pending = {}
+        self.sent = self.received = self.lost = 0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.done = loop.create_future()
+        loop.add_reader(self.sock.fileno(), self._on_readable)
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            loop.add_signal_handler(sig, self._stop)
+        start = loop.time()
+        if self.deadline is not None:
+            loop.call_at(start + self.deadline, self._stop)
+        self._send(loop, start)
+        try:
+            await self.done
+        finally:
+            loop.remove_reader(self.sock.fileno())
+            self._drain(force=True)
+            self.out.close()
+            self.sock.close()
+
+    def _stop(self):
+        if not self.done.done():
+            self.done.set_result(None)
+
+    def _send(self, loop, slot):
+        if self.count is not None and self.seq >= self.count:
+            # Give the last probes a chance to come back
+            loop.call_later(self.timeout_ns / 1e9, self._stop)
+            return
+        payload = PAYLOAD.pack(self.seq).ljust(self.size, b'\0')
+        if self.mode == 'udp':
+            packet = payload
+        else:
+            packet = icmp_echo(self.ident, self.seq, payload)
+        now = time_ns()
+        stamp = clock()
+        try:
+            if self.mode == 'udp':
+                self.sock.send(packet)
+            else:
+                self.sock.sendto(packet, (self.dest, 0))
+        except (BlockingIOError, OSError):
+            # Counts as lost: it simply never gets an answer
+            pass
+        entry = [self.seq, now, None, stamp]
+        self.inflight.append(entry)
+        self.pending[self.seq] = entry
+        self.seq += 1
+        self.sent += 1
+        self._drain()
+        slot += self.interval
+        late = loop.time() - slot
+        if late > 0:
+            # Skip slots we can no longer meet instead of bursting
+            slot += math.ceil(late / self.interval) * self.interval
+        loop.call_at(slot, self._send, loop, slot)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data, ancdata, flags, addr = self.sock.recvmsg(2048, 64)
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionRefusedError:
+                # No echo server (yet): the probe is lost
+                continue
+            seq = parse_reply(data, self.mode, self.ident)
+            entry = self.pending.pop(seq, None)
+            if entry is not None:
+                entry[2] = rx_timestamp(ancdata)
+                self.received += 1
+        self._drain()
+
+    def _drain(self, force=False):
+        """Writes completed (answered or timed out) probes, in order."""
+        now = time_ns()
+        while self.inflight:
+            seq, sent, recv, stamp = self.inflight[0]
+            if recv is None and not force and now - sent < self.timeout_ns:
+                break
+            self.inflight.popleft()
+            if recv is None:
+                self.pending.pop(seq, None)
+                self.lost += 1
+                self.out.append(stamp, seq, float('nan'), float('nan'))
+            else:
+                self.out.append(stamp, seq, (recv - sent) / 1e6,
+                                stamp + (recv - sent) / 1e9)
+
+
+async def echo_server(port):
+    loop = asyncio.get_running_loop()
+
+    class Echo(asyncio.DatagramProtocol):
+        def connection_made(self, transport):
+            self.transport = transport
+
+        def datagram_received(self, data, addr):
+            self.transport.sendto(data, addr)
+
+    transport, _ = await loop.create_datagram_endpoint(
+        Echo, local_addr=('0.0.0.0', port))
+    stop = loop.create_future()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set_result, None)
+    try:
+        await stop
+    finally:
+        transport.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asyncio RTT prober")
+    parser.add_argument('dest', nargs='?',
+                        help="Address to probe")
+    parser.add_argument('--interval', '-i', type=float, default=0.1,
+                        help="Seconds between probes (default 0.1)")
+    parser.add_argument('--count', '-c', type=int, default=None,
+                        help="Stop after this many probes")
+    parser.add_argument('--deadline', '-w', type=float, default=None,
+                        help="Stop after this many seconds")
+    parser.add_argument('--timeout', '-W', type=float, default=2.0,
+                        help="Seconds before an unanswered probe is a loss")
+    parser.add_argument('--size', '-s', type=int, default=56,
+                        help="Payload bytes")
+    parser.add_argument('--mode', choices=['auto', 'icmp', 'raw', 'udp'],
+                        default='auto')
+    parser.add_argument('--port', type=int, default=7007,
+                        help="UDP echo port (udp mode and --echo-server)")
+    parser.add_argument('--echo-server', action='store_true',
+                        help="Run a UDP echo server instead of probing")
+    parser.add_argument('--out', '-o', default='rtt.txt',
+                        help="Output file (.bts for the binary format)")
+    args = parser.parse_args()
+
+    if args.echo_server:
+        asyncio.run(echo_server(args.port))
+        return
+    if args.dest is None:
+        parser.error('dest is required unless --echo-server is given')
+    out = open_series(args.out, RTT_FIELDS, capacity=256, header=True,
+                      dest=args.dest, interval=args.interval)
+    prober = Prober(args.dest, out, args.interval, args.count, args.deadline,
+                    args.timeout, args.size, args.mode, args.port)
+    asyncio.run(prober.run())
+    print('%s (%s): %d sent, %d received, %d lost' %
+          (args.dest, prober.mode, prober.sent, prober.received, prober.lost))
+
+
+if __name__ == '__main__':
+    main()
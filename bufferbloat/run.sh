@@ -20,9 +20,14 @@ for qsize in 20 100; do
     # python3 ...
     python3 bufferbloat.py -B $bwhost -b $bwnet --delay $delay -d $dir --time $time --maxq $qsize
 
-    # TODO: Ensure the input file names match the ones you use in
-    # bufferbloat.py script.  Also ensure the plot file names match
-    # the required naming convention when submitting your tarball.
-    python3 plot_queue.py -f $dir/buffer.txt -o $dir/reno-buffer-q$qsize.png
-    python3 plot_ping.py -f $dir/ping.txt -o $dir/reno-rtt-q$qsize.png
 done
+
+# Same points on one warm topology (session.py): the network is built
+# once and only the bottleneck queue is changed between points, into
+# reno/maxq-20 and reno/maxq-100
+# sudo mn -c
+# python3 bufferbloat.py -B $bwhost -b $bwnet --delay $delay -d reno --time $time --session maxq=20,100
+
+# Renders $dir/reno-buffer-q$qsize.png and $dir/reno-rtt-q$qsize.png for
+# every queue size in one process pool; unchanged plots are skipped
+python3 render_all.py 'reno-q*'
@@ -0,0 +1,33 @@
+#!/bin/bash
+
+# Note: Mininet must be run as root.  So invoke this shell script
+# using sudo.
+
+# Same bottleneck and buffer for every queue discipline, so the RTT each
+# AQM removes can be compared at equal throughput (aqm.py)
+
+time=60
+bwnet=10
+bwhost=1000
+delay=5
+qsize=100
+
+for cong in reno cubic bbr; do
+    for qdisc in none fq_codel codel pie cake red; do
+        sudo mn -c
+        python3 bufferbloat.py --cong $cong -B $bwhost -b $bwnet --delay $delay \
+            -d aqm-$cong-$qdisc --time $time --maxq $qsize --aqm $qdisc
+    done
+    python3 aqm.py aqm-$cong-none aqm-$cong-fq_codel aqm-$cong-codel \
+        aqm-$cong-pie aqm-$cong-cake aqm-$cong-red
+done
+
+for scenario in reno_vs_bbr dual_reno_vs_bbr reno_vs_cubic; do
+    for qdisc in none fq_codel cake; do
+        sudo mn -c
+        python3 bufferbloat_competition.py --competition --scenario $scenario \
+            --bw-net $bwnet --delay $delay --maxq $qsize --time $time \
+            --aqm $qdisc --dir aqm-$scenario-$qdisc
+    done
+    python3 aqm.py aqm-$scenario-none aqm-$scenario-fq_codel aqm-$scenario-cake
+done
@@ -21,9 +21,8 @@ for qsize in 20 100; do
     # python3 ...
     python3 bufferbloat.py --cong $congalgo -B $bwhost -b $bwnet --delay $delay -d $dir --time $time --maxq $qsize
 
-    # TODO: Ensure the input file names match the ones you use in
-    # bufferbloat.py script.  Also ensure the plot file names match
-    # the required naming convention when submitting your tarball.
-    python3 plot_queue.py -f $dir/buffer.txt -o $dir/bbr-buffer-q$qsize.png
-    python3 plot_ping.py -f $dir/ping.txt -o $dir/bbr-rtt-q$qsize.png
 done
+
+# Renders $dir/bbr-buffer-q$qsize.png and $dir/bbr-rtt-q$qsize.png for
+# every queue size in one process pool; unchanged plots are skipped
+python3 render_all.py 'bbr-q*'
@@ -0,0 +1,249 @@
+'''
+Single-process sampling engine that runs every periodic probe on absolute
+deadlines of the monotonic clock.
+
+Each probe is a read() callable plus a series writer.  Ticks are scheduled
+with loop.call_at() on the asyncio loop clock (CLOCK_MONOTONIC), so the
+period does not drift by the time a sample takes.  When a tick fires more
+than one interval late the skipped slots are counted instead of being
+sampled in a burst; every record carries the cumulative count in its last
+column ('missed').
+
+Probes are described by picklable tuples so they can be handed to the
+sampling process:
+
+    ('qdisc', iface, interval_sec, fname)
+    ('linkrate', ifaces, interval_sec, fname_pattern)
+    ('sockstat', pid, interval_sec, fname)
+    ('tcpinfo', pid, interval_sec, fname, port)
+    ('aqm', iface, interval_sec, fname, handle)
+    ('hostcpu', pid, interval_sec, fname)
+    ('syscpu', interval_sec, fname)
+'''
+
+import asyncio
+import os
+import signal
+from multiprocessing import Process
+
+from aqm import decode_xstats
+from fidelity import HostCpuSampler, SysCpuSampler
+from linkrate import LinkRateSampler
+from rtnl import QdiscSampler, parse_handle
+from tcpinfo import TcpInfoSampler
+from tsfile import (clock, open_series, QDISC_FIELDS, RATE_FIELDS, SOCK_FIELDS,
+                    TCPINFO_FIELDS, HOSTCPU_FIELDS, SYSCPU_FIELDS, AQM_FIELDS)
+
+MISSED_FIELD = ('missed', 'i4')
+
+
+class Probe(object):
+    def __init__(self, name, interval_sec, read, fname, fields, close=None):
+        self.name = name
+        self.interval = interval_sec
+        self.read = read
+        self.out = open_series(fname, list(fields) + [MISSED_FIELD])
+        self._close = close
+        self.deadline = None
+        self.missed = 0
+
+    def emit(self, now, values):
+        self.out.append(now, *(tuple(values) + (self.missed,)))
+
+    def flush(self):
+        self.out.flush()
+
+    def close(self):
+        self.out.close()
+        if self._close is not None:
+            self._close()
+
+
+class SamplingEngine(object):
+    def __init__(self, flush_sec=1.0):
+        self.probes = []
+        self.flush_sec = flush_sec
+
+    def add(self, probe):
+        self.probes.append(probe)
+        return probe
+
+    def run(self, duration=None):
+        """Samples until SIGTERM, or for `duration` seconds if given."""
+        loop = asyncio.new_event_loop()
+        start = loop.time()
+        for p in self.probes:
+            p.deadline = start
+            loop.call_at(start, self._tick, loop, p)
+        loop.call_at(start + self.flush_sec, self._flush, loop)
+        loop.add_signal_handler(signal.SIGTERM, loop.stop)
+        if duration is not None:
+            loop.call_at(start + duration, loop.stop)
+        try:
+            loop.run_forever()
+        finally:
+            for p in self.probes:
+                p.close()
+            loop.close()
+
+    def _tick(self, loop, p):
+        late = loop.time() - p.deadline
+        if late >= p.interval:
+            skipped = int(late // p.interval)
+            p.missed += skipped
+            p.deadline += skipped * p.interval
+        now = clock()
+        values = p.read()
+        if values is not None:
+            p.emit(now, values)
+        p.deadline += p.interval
+        loop.call_at(p.deadline, self._tick, loop, p)
+
+    def _flush(self, loop):
+        for p in self.probes:
+            p.flush()
+        loop.call_at(loop.time() + self.flush_sec, self._flush, loop)
+
+
+def qdisc_probe(iface, interval_sec, fname, handle=None):
+    sampler = QdiscSampler(iface)
+
+    def read():
+        q = sampler.sample(handle)
+        if q is None:
+            return None
+        return (q.qlen, q.backlog, q.drops, q.overlimits, q.requeues)
+    return Probe('qdisc:%s' % iface, interval_sec, read, fname, QDISC_FIELDS,
+                 close=sampler.close)
+
+
+def aqm_probe(iface, interval_sec, fname, handle='20:'):
+    """Queue and drop stats of an AQM qdisc with its per-kind xstats."""
+    sampler = QdiscSampler(iface)
+    handle = parse_handle(handle)
+
+    def read():
+        q = sampler.sample(handle)
+        if q is None:
+            return None
+        return (q.qlen, q.backlog, q.drops, q.overlimits, q.requeues) + \
+            decode_xstats(q.kind, q.xstats, q.drops)
+    return Probe('aqm:%s' % iface, interval_sec, read, fname, AQM_FIELDS,
+                 close=sampler.close)
+
+
+class LinkRateProbe(Probe):
+    """Samples all interfaces in one pass; one output file per interface,
+    named by substituting the interface into fname_pattern."""
+
+    def __init__(self, ifaces, interval_sec, fname_pattern, alpha=0.9):
+        self.sampler = LinkRateSampler(ifaces, alpha)
+        self.interval = interval_sec
+        self.name = 'linkrate'
+        self.outs = [open_series(fname_pattern % name,
+                                 RATE_FIELDS + [MISSED_FIELD])
+                     for name in self.sampler.names]
+        self.deadline = None
+        self.missed = 0
+
+    def read(self):
+        return self.sampler.sample()
+
+    def emit(self, now, values):
+        rate, ewma = values
+        for out, r, e in zip(self.outs, rate.tolist(), ewma.tolist()):
+            out.append(now, *(r + e[:2] + [self.missed]))
+
+    def flush(self):
+        for out in self.outs:
+            out.flush()
+
+    def close(self):
+        for out in self.outs:
+            out.close()
+        self.sampler.close()
+
+
+def parse_sockstat(sockstat, snmp):
+    """Extracts (tcp_inuse, tcp_tw, tcp_mem_pages, in_segs, out_segs,
+    retrans_segs) from /proc/<pid>/net/{sockstat,snmp} contents."""
+    inuse = tw = mem = 0
+    for line in sockstat.split(b'\n'):
+        if line.startswith(b'TCP:'):
+            f = line.split()
+            kv = dict(zip(f[1::2], f[2::2]))
+            inuse, tw, mem = int(kv[b'inuse']), int(kv[b'tw']), int(kv[b'mem'])
+            break
+    tcp = [l.split()[1:] for l in snmp.split(b'\n') if l.startswith(b'Tcp:')]
+    kv = dict(zip(tcp[0], tcp[1])) if len(tcp) >= 2 else {}
+    return (inuse, tw, mem, int(kv.get(b'InSegs', 0)),
+            int(kv.get(b'OutSegs', 0)), int(kv.get(b'RetransSegs', 0)))
+
+
+def sockstat_probe(pid, interval_sec, fname):
+    """Per-host TCP socket stats, read from the network namespace of pid."""
+    fd_sock = os.open('/proc/%d/net/sockstat' % pid, os.O_RDONLY)
+    fd_snmp = os.open('/proc/%d/net/snmp' % pid, os.O_RDONLY)
+
+    def read():
+        return parse_sockstat(os.pread(fd_sock, 4096, 0),
+                              os.pread(fd_snmp, 8192, 0))
+
+    def close():
+        os.close(fd_sock)
+        os.close(fd_snmp)
+    return Probe('sockstat:%d' % pid, interval_sec, read, fname, SOCK_FIELDS,
+                 close=close)
+
+
+class TcpInfoProbe(Probe):
+    """tcp_info of the flows of a host towards port, one record per flow."""
+
+    def __init__(self, pid, interval_sec, fname, port=None):
+        self.sampler = TcpInfoSampler(pid, port)
+        Probe.__init__(self, 'tcpinfo:%d' % pid, interval_sec,
+                       self.sampler.sample, fname, TCPINFO_FIELDS,
+                       close=self.sampler.close)
+
+    def emit(self, now, values):
+        for rec in values:
+            self.out.append(now, *(rec + (self.missed,)))
+
+
+def hostcpu_probe(pid, interval_sec, fname):
+    """CPU usage of the cgroup of a Mininet host (see fidelity.py)."""
+    sampler = HostCpuSampler(pid)
+    return Probe('hostcpu:%d' % pid, interval_sec, sampler.sample, fname,
+                 HOSTCPU_FIELDS, close=sampler.close)
+
+
+def syscpu_probe(interval_sec, fname):
+    """Per-core load of the machine (see fidelity.py)."""
+    sampler = SysCpuSampler()
+    return Probe('syscpu', interval_sec, sampler.sample, fname, SYSCPU_FIELDS,
+                 close=sampler.close)
+
+
+PROBES = {
+    'qdisc': qdisc_probe,
+    'aqm': aqm_probe,
+    'linkrate': LinkRateProbe,
+    'sockstat': sockstat_probe,
+    'tcpinfo': TcpInfoProbe,
+    'hostcpu': hostcpu_probe,
+    'syscpu': syscpu_probe,
+}
+
+
+def run_probes(specs, duration=None):
+    engine = SamplingEngine()
+    for spec in specs:
+        engine.add(PROBES[spec[0]](*spec[1:]))
+    engine.run(duration)
+
+
+def start_sampler(specs, duration=None):
+    """Runs all probes in one child process; terminate() it to stop."""
+    proc = Process(target=run_probes, args=(list(specs), duration))
+    proc.start()
+    return proc
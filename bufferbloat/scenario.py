@@ -0,0 +1,186 @@
+'''
+Competition scenarios described as data.
+
+A scenario file (scenarios/<name>.json, or .yaml with PyYAML installed)
+lists the flows; everything else - the hosts of CompTopo, the iperf
+clients, the RTT prober and the file names - is derived from it:
+
+    {
+      "description": "2 Reno vs 1 BBR",
+      "stagger": 0.5,
+      "flows": [
+        {"cc": "reno", "count": 2},
+        {"cc": "bbr", "rtt": 120, "start": 5, "stop": 50}
+      ]
+    }
+
+Flow entries:
+
+    cc      congestion control (iperf -Z)
+    count   number of identical flows (default 1)
+    host    host to run them on; flows naming the same host share it.
+            Without it every flow gets a host of its own, unless
+    hosts   spreads the `count` flows round robin over that many new hosts
+    start   seconds after the first flow (default: index * stagger)
+    stop    seconds after the first flow (default: end of the run)
+    rtt     propagation RTT in ms, made by lengthening the host's access
+            link; flows sharing a host must agree on it
+
+Hosts without a name are h1, h2, ... in order of appearance and the
+server comes after them, as in the original hard-coded scenarios, so
+logs keep their iperf_h<N>_<cc>.txt names.  "server" and "ping" (the host
+running the RTT prober, default the first flow's) can be set at the top
+level.
+
+    python3 scenario.py                      lists the scenarios
+    python3 scenario.py many_flows_200       prints one expanded
+'''
+
+import json
+import os
+import sys
+from collections import namedtuple, OrderedDict
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+SCENARIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenarios')
+EXTENSIONS = ['.json', '.yaml', '.yml']
+
+Flow = namedtuple('Flow', 'name host cc start stop rtt')
+Scenario = namedtuple('Scenario', 'name description flows hosts server ping host_rtt')
+
+
+def available():
+    """Names of the scenarios in SCENARIO_DIR."""
+    if not os.path.isdir(SCENARIO_DIR):
+        return []
+    return sorted(os.path.splitext(f)[0] for f in os.listdir(SCENARIO_DIR)
+                  if os.path.splitext(f)[1] in EXTENSIONS)
+
+
+def find(name):
+    """Path of a scenario given by name or by path."""
+    if os.path.exists(name):
+        return name
+    for ext in EXTENSIONS:
+        path = os.path.join(SCENARIO_DIR, name + ext)
+        if os.path.exists(path):
+            return path
+    raise ValueError('unknown scenario %r (available: %s)'
+                     % (name, ', '.join(available())))
+
+
+def read_spec(path):
+    with open(path) as f:
+        if os.path.splitext(path)[1] == '.json':
+            return json.load(f)
+        if yaml is None:
+            raise ValueError('%s: reading YAML scenarios needs PyYAML' % path)
+        return yaml.safe_load(f)
+
+
+def expand(spec, name='scenario'):
+    """Scenario of a parsed spec dict."""
+    stagger = float(spec.get('stagger', 0.5))
+    entries = spec.get('flows')
+    if not entries:
+        raise ValueError('%s: no flows' % name)
+    named = set(e['host'] for e in entries if 'host' in e)
+    hosts = []
+    auto = [0]
+
+    def new_host():
+        while True:
+            auto[0] += 1
+            h = 'h%d' % auto[0]
+            if h not in named:
+                return h
+
+    placed = []
+    for e in entries:
+        if 'cc' not in e:
+            raise ValueError('%s: flow without cc: %r' % (name, e))
+        count = int(e.get('count', 1))
+        if 'host' in e:
+            group = [e['host']]
+        else:
+            group = [new_host() for _ in range(int(e.get('hosts', count)))]
+        for i in range(count):
+            placed.append((e, group[i % len(group)]))
+        for h in group:
+            if h not in hosts:
+                hosts.append(h)
+
+    host_rtt = {}
+    flows = []
+    seen = {}
+    for index, (e, host) in enumerate(placed):
+        rtt = e.get('rtt')
+        if rtt is not None:
+            rtt = float(rtt)
+            if host_rtt.setdefault(host, rtt) != rtt:
+                raise ValueError('%s: flows on %s ask for RTTs %g and %g ms'
+                                 % (name, host, host_rtt[host], rtt))
+        base = '%s_%s' % (host, e['cc'])
+        seen[base] = seen.get(base, 0) + 1
+        flow_name = base if seen[base] == 1 else '%s_%d' % (base, seen[base])
+        start = float(e.get('start', index * stagger))
+        stop = e.get('stop')
+        flows.append(Flow(flow_name, host, e['cc'], start,
+                          None if stop is None else float(stop), rtt))
+    server = spec.get('server') or new_host()
+    if server in hosts:
+        raise ValueError('%s: server %s also runs flows' % (name, server))
+    ping = spec.get('ping', flows[0].host)
+    return Scenario(name, spec.get('description', ''), flows, hosts, server,
+                    ping, host_rtt)
+
+
+def load(name):
+    """Scenario from a name in SCENARIO_DIR or a file path."""
+    path = find(name)
+    return expand(read_spec(path), os.path.splitext(os.path.basename(path))[0])
+
+
+def access_delays(scen, delay):
+    """{host: delay of its access link in ms}: every path crosses three
+    links of `delay` ms, a host with an RTT gets the difference on its own
+    link."""
+    ret = OrderedDict()
+    for h in scen.hosts:
+        rtt = scen.host_rtt.get(h)
+        d = delay if rtt is None else rtt / 2.0 - 2 * delay
+        if d < 0:
+            raise ValueError('%s: RTT %g ms of %s is below the %g ms of the '
+                             'switch links' % (scen.name, rtt, h, 4 * delay))
+        ret[h] = d
+    return ret
+
+
+def flow_rtts(scen, delay):
+    """Propagation RTT of each flow in ms."""
+    return [f.rtt if f.rtt is not None else 6 * delay for f in scen.flows]
+
+
+def main(argv):
+    if not argv:
+        for name in available():
+            scen = load(name)
+            print('%-24s %4d flows %4d hosts  %s' % (name, len(scen.flows),
+                                                    len(scen.hosts), scen.description))
+        return
+    scen = load(argv[0])
+    print('%s: %s' % (scen.name, scen.description))
+    print('hosts %s, server %s, ping from %s' % (' '.join(scen.hosts), scen.server,
+                                                 scen.ping))
+    for f in scen.flows:
+        print('  %-16s %-6s on %-4s start %6.2f stop %6s rtt %s' % (
+            f.name, f.cc, f.host, f.start, '-' if f.stop is None else '%.2f' % f.stop,
+            '-' if f.rtt is None else '%g ms' % f.rtt))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,233 @@
+'''
+Warm topology reuse: several experiment points on one running Mininet.
+
+Building the network for every point (`mn -c`, Mininet(...).start(), the
+O(n^2) pingAll, fixed sleeps for the servers) costs seconds, mostly to
+change one tc parameter.  In session mode (--session of bufferbloat.py and
+bufferbloat_competition.py) the topology is built for the first point
+only.  Between points:
+
+    drain()              waits until every qdisc of every link is empty
+    relink()             diffs the link options of the old and new Topo
+                         and changes the TCLink tc tree of both ends in
+                         place: htb class 5:1 (bw), netem 10: (delay,
+                         max_queue_size), then reads them back over
+                         rtnetlink
+    set_cc()             default congestion control of every host
+    flush_tcp_metrics()  forgets the ssthresh/RTT cached by the previous
+                         point, as a fresh namespace would
+
+Only bw, delay and max_queue_size can change; other link options, nodes
+or links raise ValueError (the network has to be rebuilt).  The qdisc
+counters are not reset by `tc change`: the analyses use differences, so
+this only shows in absolute values.  wait_listening() replaces the fixed
+sleeps after starting a server.
+'''
+
+import re
+from time import monotonic, sleep
+
+from rtnl import QdiscSampler, htb_rate, netem_options, parse_handle
+
+TUNABLE = ('bw', 'delay', 'max_queue_size')
+HTB_CLASS = parse_handle('5:1')
+NETEM = parse_handle('10:')
+# netem limit when max_queue_size is not given
+NETEM_LIMIT = 1000
+# tc(8) time units; a number without unit is in microseconds
+TIME_UNITS = {'s': 1.0, 'sec': 1.0, 'secs': 1.0, 'ms': 1e-3, 'msec': 1e-3,
+              'msecs': 1e-3, 'us': 1e-6, 'usec': 1e-6, 'usecs': 1e-6, '': 1e-6}
+TCP_LISTEN = '0A'
+
+
+def parse_delay(delay):
+    """Seconds of a delay as tc reads it ('5ms', 5.0 => 5 us)."""
+    m = re.match(r'\s*([0-9.]+)\s*([a-z]*)\s*$', str(delay))
+    if not m or m.group(2) not in TIME_UNITS:
+        raise ValueError('bad delay %r' % (delay,))
+    return float(m.group(1)) * TIME_UNITS[m.group(2)]
+
+
+def point_dir(params):
+    """Directory name of a session point: bw-net-1.5_maxq-20."""
+    return '_'.join('%s-%s' % (k, params[k]) for k in sorted(params)) or 'point'
+
+
+def assign(args, params):
+    """Sets the NAME=VALUE parameters of a point on parsed args, converted
+    to the type of the current value."""
+    for name, value in params.items():
+        dest = name.replace('-', '_')
+        if dest in ('dir', 'session') or not hasattr(args, dest):
+            raise ValueError('--%s cannot vary in a session' % name)
+        current = getattr(args, dest)
+        if current is not None and not isinstance(current, bool):
+            value = type(current)(value)
+        setattr(args, dest, value)
+
+
+def ns_pid(node):
+    return node.pid if node.inNamespace else None
+
+
+def link_options(topo):
+    """{(node1, node2, key): options} of the links of a Topo."""
+    return dict(((a, b, k), info) for a, b, k, info in
+                topo.links(sort=True, withKeys=True, withInfo=True))
+
+
+def link_intfs(net, info):
+    return (net.get(info['node1']).intfs[info['port1']],
+            net.get(info['node2']).intfs[info['port2']])
+
+
+def tc_commands(iface, opts):
+    """tc commands changing the TCLink tree of iface (htb root 5:, class
+    5:1, netem 10:) to opts, formatted as TCIntf.config() does."""
+    cmds = []
+    parent = 'root'
+    if opts.get('bw') is not None:
+        cmds.append('tc class change dev %s parent 5:0 classid 5:1 htb '
+                    'rate %fMbit burst 15k' % (iface, opts['bw']))
+        parent = 'parent 5:1'
+    netem = ''
+    if opts.get('delay') is not None:
+        netem += 'delay %s ' % opts['delay']
+    if opts.get('max_queue_size') is not None:
+        netem += 'limit %d' % opts['max_queue_size']
+    if netem:
+        cmds.append('tc qdisc change dev %s %s handle 10: netem %s' %
+                    (iface, parent, netem))
+    return cmds
+
+
+def read_back(iface, pid=None):
+    """(rate in bits/s, delay in s, limit) configured on iface."""
+    sampler = QdiscSampler(iface, pid=pid)
+    try:
+        netem = sampler.sample(NETEM)
+        htb = [c for c in sampler.classes() if c.handle == HTB_CLASS]
+    finally:
+        sampler.close()
+    rate = htb_rate(htb[0].options) if htb and htb[0].options else None
+    delay, limit = netem_options(netem.options) if netem and netem.options \
+        else (None, None)
+    return rate, delay, limit
+
+
+def verify(intf, opts):
+    """Raises RuntimeError unless the kernel has opts on intf."""
+    rate, delay, limit = read_back(intf.name, ns_pid(intf.node))
+    wrong = []
+    if opts.get('bw') is not None and \
+            (rate is None or abs(rate - opts['bw'] * 1e6) > 1e-3 * opts['bw'] * 1e6 + 8):
+        wrong.append('rate %s b/s, expected %g Mb/s' % (rate, opts['bw']))
+    if opts.get('delay') is not None and \
+            (delay is None or abs(delay - parse_delay(opts['delay'])) > 1e-6):
+        wrong.append('delay %s s, expected %s' % (delay, opts['delay']))
+    expected = opts.get('max_queue_size') or NETEM_LIMIT
+    if limit is not None and limit != expected:
+        wrong.append('limit %d, expected %d' % (limit, expected))
+    if wrong:
+        raise RuntimeError('%s: %s' % (intf.name, '; '.join(wrong)))
+
+
+def relink(net, old, new, check=True):
+    """Changes the links of net, built from Topo old, to the options of Topo
+    new.  Returns the names of the reconfigured interfaces."""
+    before, after = link_options(old), link_options(new)
+    if sorted(old.nodes()) != sorted(new.nodes()) or set(before) != set(after):
+        raise ValueError('nodes or links differ: the network must be rebuilt')
+    changed = []
+    for key, opts in sorted(after.items()):
+        prev = before[key]
+        names = set(opts) | set(prev)
+        diff = [n for n in names if opts.get(n) != prev.get(n)]
+        if not diff:
+            continue
+        fixed = [n for n in diff if n not in TUNABLE] + \
+            [n for n in TUNABLE if (opts.get(n) is None) != (prev.get(n) is None)]
+        if fixed:
+            raise ValueError('%s-%s: %s cannot change in place' %
+                             (key[0], key[1], ', '.join(sorted(set(fixed)))))
+        for intf in link_intfs(net, opts):
+            for cmd in tc_commands(intf.name, opts):
+                out = intf.node.cmd(cmd).strip()
+                if out:
+                    raise RuntimeError('%s: %s' % (cmd, out))
+            if check:
+                verify(intf, opts)
+            changed.append(intf.name)
+    return changed
+
+
+def tc_ports(net):
+    """(iface, pid) of both ends of every link, pid None in the root
+    namespace."""
+    return [(intf.name, ns_pid(intf.node)) for link in net.links
+            for intf in (link.intf1, link.intf2)]
+
+
+def drain(net, timeout=10.0, interval=0.01):
+    """Waits until every qdisc of every link is empty (the traffic of the
+    previous point stopped); returns the seconds waited."""
+    samplers = [QdiscSampler(iface, pid=pid) for iface, pid in tc_ports(net)]
+    start = monotonic()
+    try:
+        while True:
+            busy = [s.iface for s in samplers
+                    if any(q.qlen or q.backlog for q in s.dump()
+                           if q.ifindex == s.ifindex)]
+            waited = monotonic() - start
+            if not busy:
+                return waited
+            if waited > timeout:
+                raise RuntimeError('queues of %s not empty after %g s' %
+                                   (', '.join(busy), timeout))
+            sleep(interval)
+    finally:
+        for s in samplers:
+            s.close()
+
+
+def set_cc(net, cc):
+    """Default congestion control of every host, read back from /proc."""
+    for host in net.hosts:
+        host.cmd('sysctl -q -w net.ipv4.tcp_congestion_control=%s' % cc)
+        got = host.cmd('cat /proc/sys/net/ipv4/tcp_congestion_control').strip()
+        if got != cc:
+            raise RuntimeError('%s: congestion control is %r, not %r' %
+                               (host.name, got, cc))
+
+
+def flush_tcp_metrics(net):
+    for host in net.hosts:
+        host.cmd('ip tcp_metrics flush all')
+
+
+def listening(pid, port):
+    """True if a TCP socket of the namespace of pid listens on port."""
+    for name in ('tcp', 'tcp6'):
+        try:
+            with open('/proc/%d/net/%s' % (pid, name)) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    local, state = fields[1], fields[3]
+                    if state == TCP_LISTEN and int(local.rsplit(':', 1)[1], 16) == port:
+                        return True
+        except OSError:
+            pass
+    return False
+
+
+def wait_listening(host, port, timeout=5.0, interval=0.005):
+    """Waits for a server of host to listen on port; returns the seconds
+    waited."""
+    start = monotonic()
+    while not listening(host.pid, port):
+        if monotonic() - start > timeout:
+            raise RuntimeError('%s: nothing listening on port %d after %g s' %
+                               (host.name, port, timeout))
+        sleep(interval)
+    return monotonic() - start
@@ -0,0 +1,527 @@
+'''
+Mininet-free fluid model of the bufferbloat topologies.
+
+The bottleneck is a drop-tail FIFO of --maxq packets served at --bw-net,
+shared by Reno, CUBIC and BBR(v1)-style senders; host links are assumed
+never to be the bottleneck and only add propagation delay.  Every queue
+holds one fluid amount per flow, served in proportion to its share of the
+backlog, and the whole state lives in NumPy arrays of shape (points,
+flows), so thousands of (bw, delay, maxq) points advance together in one
+time loop.
+
+With a single point the outputs of the real experiments are written to
+--dir, so plot_queue.py, plot_ping.py and the iperf parsers work on them
+unchanged:
+
+    buffer.txt                     like the qdisc probe of sampler.py
+    ping.txt / ping_competition.txt  like rttprobe.py (losses are NaN)
+    iperf_h<N>_<cong>.txt          iperf -i 5 client output, or
+                                   iperf -y C -i 0.1 in competition mode
+                                   (named after the scenario's flows)
+
+    python3 simulate.py -b 1.5 --delay 5 --maxq 100 -t 200 --cong reno -d sim-reno-q100
+    python3 simulate.py --competition --scenario reno_vs_bbr -b 10 --delay 20 \\
+        --maxq 100 -t 60 -d sim-scenario1
+
+Given several values for --bw-net, --delay or --maxq it sweeps their
+cartesian product instead and writes one CSV line of metrics per point:
+
+    python3 simulate.py -b 1.5 10 --delay 5 20 --maxq 10 20 50 100 200 -t 60 -o grid.csv
+
+The options match the Mininet scripts, so sweep.py --script simulate.py
+caches simulated points like real ones.
+'''
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from tsfile import open_series, QDISC_FIELDS, RTT_FIELDS
+import scenario
+
+MSS = 1500  # bytes; max_queue_size counts packets
+INIT_CWND = 10
+
+RENO, CUBIC, BBR = range(3)
+ALGOS = {'reno': RENO, 'cubic': CUBIC, 'bbr': BBR}
+
+CUBIC_C = 0.4
+CUBIC_BETA = 0.7
+
+BBR_HIGH_GAIN = 2.885
+BBR_CYCLE = np.array([1.25, 0.75, 1, 1, 1, 1, 1, 1])
+BBR_BW_ROUNDS = 10
+BBR_RTPROP_SEC = 10.0
+BBR_PROBE_RTT_SEC = 0.2
+BBR_MIN_CWND = 4
+STARTUP, DRAIN, PROBE_BW, PROBE_RTT = range(4)
+
+BUFFER_FIELDS = QDISC_FIELDS + [('missed', 'i4')]
+
+
+def algo_codes(algos):
+    try:
+        return np.array([ALGOS[a.lower()] for a in algos])
+    except KeyError as e:
+        raise ValueError('unsupported congestion control %s' % e)
+
+
+def simulate(algos, bw_net, delay, maxq, duration, hops=2, starts=None,
+             stops=None, base_rtt=None, dt=None, sample_sec=0.1,
+             ping_sec=0.1, record=True):
+    """Runs the model for every point at once.
+
+    algos is one congestion control name per flow.  bw_net (Mb/s), delay
+    (ms per link) and maxq (packets) are scalars or arrays of P points.
+    The propagation RTT of every flow is 2 * hops * delay unless base_rtt
+    (seconds, shape (F,) or (P, F), NaN for the default) is given;
+    starts/stops are per flow times in seconds.  Returns a dict of arrays:
+
+        t          (S,) sample times
+        qlen       (P, S) bottleneck backlog in packets
+        drops      (P, S) cumulative drops in packets
+        delivered  (P, F, S) cumulative bytes delivered (record=True only)
+        bytes      (P, F) total bytes delivered
+        ping_t     (K,) probe send times
+        ping_rtt   (P, K) probe RTT in ms, NaN if the probe was dropped
+    """
+    codes = algo_codes(algos)
+    bw_net, delay, maxq = np.broadcast_arrays(np.atleast_1d(bw_net).astype(float),
+                                              np.atleast_1d(delay).astype(float),
+                                              np.atleast_1d(maxq).astype(float))
+    P, F = len(bw_net), len(codes)
+    cap = (bw_net * 1e6 / (8 * MSS))[:, None]          # packets/s
+    limit = maxq[:, None]
+    base = np.repeat((2 * hops * delay / 1e3)[:, None], F, axis=1)
+    if base_rtt is not None:
+        given = np.broadcast_to(np.asarray(base_rtt, dtype=float), (P, F))
+        base = np.where(np.isnan(given), base, given)
+    starts = np.zeros(F) if starts is None else np.asarray(starts, dtype=float)
+    stops = np.full(F, np.inf) if stops is None else np.asarray(stops, dtype=float)
+    if dt is None:
+        # A tenth of the shortest RTT, within [0.5, 5] ms
+        dt = float(np.clip(base.min() / 10, 5e-4, 5e-3))
+    steps = int(round(duration / dt))
+    every = max(1, int(round(sample_sec / dt)))
+    ping_every = max(1, int(round(ping_sec / dt)))
+
+    is_bbr = codes == BBR
+    is_cubic = codes == CUBIC
+    win_flows = ~is_bbr
+    has_bbr = bool(is_bbr.any())
+    has_cubic = bool(is_cubic.any())
+
+    # Window based senders
+    cwnd = np.full((P, F), float(INIT_CWND))
+    ssthresh = np.full((P, F), np.inf)
+    lost = np.zeros((P, F))                 # dropped packets not yet noticed
+    detect_at = np.full((P, F), np.inf)     # when the sender sees the loss
+    recover_until = np.zeros((P, F))
+    w_max = np.zeros((P, F))
+    epoch = np.zeros((P, F))
+    k_cubic = np.zeros((P, F))
+
+    # BBR
+    state = np.full((P, F), STARTUP)
+    bw_slots = np.zeros((P, F, BBR_BW_ROUNDS))
+    bw_slots[:, :, 0] = INIT_CWND / base
+    slot = np.zeros((P, F), dtype=int)
+    round_end = base.copy()
+    full_bw = np.zeros((P, F))
+    full_cnt = np.zeros((P, F), dtype=int)
+    rtprop = base.copy()
+    rtprop_stamp = np.zeros((P, F))
+    probe_rtt_end = np.zeros((P, F))
+    reached_full = np.zeros((P, F), dtype=bool)
+    phase = np.broadcast_to(2 + np.arange(F) % 6, (P, F)).copy()
+    phase_end = np.zeros((P, F))
+    pacing_gain = np.full((P, F), BBR_HIGH_GAIN)
+    cwnd_gain = np.full((P, F), BBR_HIGH_GAIN)
+    rows, cols = np.indices((P, F))
+
+    backlog = np.zeros((P, F))              # per flow share of the queue
+    total_drops = np.zeros(P)
+    delivered = np.zeros((P, F))
+
+    nsamples = (steps - 1) // every + 1
+    out_t = np.arange(nsamples) * every * dt
+    out_q = np.zeros((P, nsamples), dtype=np.float32)
+    out_drops = np.zeros((P, nsamples))
+    out_del = np.zeros((P, F, nsamples)) if record else None
+    nping = (steps - 1) // ping_every + 1
+    ping_t = np.arange(nping) * ping_every * dt
+    ping_rtt = np.zeros((P, nping))
+
+    tiny = 1e-12
+    for k in range(steps):
+        t = k * dt
+        active = (t >= starts) & (t < stops)
+        qdelay = backlog.sum(axis=1, keepdims=True) / cap
+        rtt = base + qdelay
+
+        rate = cwnd / rtt
+        if has_bbr:
+            btl_bw = bw_slots.max(axis=2)
+            bbr_cwnd = np.maximum(cwnd_gain * btl_bw * rtprop, BBR_MIN_CWND)
+            bbr_cwnd[state == PROBE_RTT] = BBR_MIN_CWND
+            rate = np.where(is_bbr, np.minimum(pacing_gain * btl_bw,
+                                               bbr_cwnd / rtt), rate)
+        rate = rate * active
+
+        # Drop-tail FIFO: serve the backlog in proportion to each flow's
+        # share, then cut whatever does not fit in maxq
+        inflow = rate * dt
+        backlog += inflow
+        queued = backlog.sum(axis=1, keepdims=True)
+        served_total = np.minimum(queued, cap * dt)
+        served = backlog * (served_total / np.maximum(queued, tiny))
+        backlog -= served
+        excess = np.maximum(queued - served_total - limit, 0)
+        overflow = excess[:, 0] > 0
+        if overflow.any():
+            arriving = inflow.sum(axis=1, keepdims=True)
+            drop = np.minimum(excess * inflow / np.maximum(arriving, tiny), backlog)
+            backlog -= drop
+            total_drops += drop.sum(axis=1)
+            lost += drop
+        delivered += served
+
+        if k % every == 0:
+            i = k // every
+            out_q[:, i] = backlog.sum(axis=1)
+            out_drops[:, i] = total_drops
+            if record:
+                out_del[:, :, i] = delivered
+        if k % ping_every == 0:
+            # The probe follows h1's path; it is lost if the queue is full
+            i = k // ping_every
+            ping_rtt[:, i] = np.where(overflow, np.nan,
+                                      (base[:, 0] + backlog.sum(axis=1) / cap[:, 0]) * 1e3)
+
+        # Loss detection, one RTT after the drop, at most once per RTT
+        noticed = (lost >= 1) & np.isinf(detect_at) & (t >= recover_until)
+        detect_at[noticed] = t + rtt[noticed]
+        lost[noticed | (t < recover_until)] = 0
+        react = (t >= detect_at) & win_flows
+        if react.any():
+            w_max[react] = cwnd[react]
+            cut = np.where(is_cubic, CUBIC_BETA, 0.5)
+            cwnd[react] = np.maximum((cwnd * cut)[react], 2)
+            ssthresh[react] = cwnd[react]
+            epoch[react] = t
+            k_cubic[react] = np.cbrt(w_max[react] * (1 - CUBIC_BETA) / CUBIC_C)
+            recover_until[react] = t + rtt[react]
+            detect_at[react] = np.inf
+        detect_at[is_bbr & ~np.isinf(detect_at)] = np.inf
+
+        # Window growth, clocked by the packets delivered in this step
+        acked = served
+        slow = cwnd < ssthresh
+        grow = np.where(slow, acked, acked / cwnd)
+        if has_cubic:
+            elapsed = t - epoch
+            target = w_max + CUBIC_C * (elapsed - k_cubic) ** 3
+            friendly = (w_max * CUBIC_BETA + 3 * (1 - CUBIC_BETA) / (1 + CUBIC_BETA)
+                        * elapsed / rtt)
+            target = np.maximum(target, friendly)
+            per_ack = np.clip((target - cwnd) / cwnd, 0.01 / cwnd, 0.5)
+            grow = np.where(is_cubic & ~slow, acked * per_ack, grow)
+        cwnd += grow * win_flows
+
+        if has_bbr:
+            # Windowed max of the delivery rate over the last 10 rounds
+            drate = served / dt
+            cur = bw_slots[rows, cols, slot]
+            bw_slots[rows, cols, slot] = np.where(active, np.maximum(cur, drate), cur)
+            # Rounds only count while the flow runs, or a late starter
+            # would forget its initial bandwidth estimate before sending
+            new_round = (t >= round_end) & active
+            if new_round.any():
+                round_end = np.where(new_round, t + rtt, round_end)
+                slot = np.where(new_round, (slot + 1) % BBR_BW_ROUNDS, slot)
+                bw_slots[rows[new_round], cols[new_round], slot[new_round]] = 0
+                # Startup ends when the bandwidth stops growing by 25%
+                check = new_round & (state == STARTUP) & active
+                grew = btl_bw >= full_bw * 1.25
+                full_bw = np.where(check & grew, btl_bw, full_bw)
+                full_cnt = np.where(check, np.where(grew, 0, full_cnt + 1), full_cnt)
+                to_drain = check & (full_cnt >= 3)
+                state[to_drain] = DRAIN
+                reached_full |= to_drain
+
+            inflight = backlog + served / dt * base
+            drained = (state == DRAIN) & (inflight <= btl_bw * rtprop)
+            state[drained] = PROBE_BW
+            phase_end = np.where(drained, t + rtprop, phase_end)
+
+            cycle = (state == PROBE_BW) & (t >= phase_end)
+            phase = np.where(cycle, (phase + 1) % len(BBR_CYCLE), phase)
+            phase_end = np.where(cycle, t + rtprop, phase_end)
+
+            expired = t - rtprop_stamp > BBR_RTPROP_SEC
+            lower = rtt < rtprop
+            rtprop = np.where(lower | expired, rtt, rtprop)
+            rtprop_stamp = np.where(lower | expired, t, rtprop_stamp)
+            probe = expired & (state != PROBE_RTT) & active
+            state[probe] = PROBE_RTT
+            probe_rtt_end = np.where(probe, t + BBR_PROBE_RTT_SEC + rtt, probe_rtt_end)
+            done = (state == PROBE_RTT) & (t >= probe_rtt_end)
+            state[done] = np.where(reached_full[done], PROBE_BW, STARTUP)
+            rtprop_stamp = np.where(done, t, rtprop_stamp)
+            phase_end = np.where(done, t + rtprop, phase_end)
+
+            pacing_gain = np.select([state == STARTUP, state == DRAIN,
+                                     state == PROBE_BW],
+                                    [BBR_HIGH_GAIN, 1 / BBR_HIGH_GAIN,
+                                     BBR_CYCLE[phase]], 1.0)
+            cwnd_gain = np.where(state == PROBE_BW, 2.0, BBR_HIGH_GAIN)
+
+    ret = {'t': out_t, 'qlen': out_q, 'drops': out_drops,
+           'bytes': delivered * MSS, 'ping_t': ping_t, 'ping_rtt': ping_rtt,
+           'dt': dt}
+    if record:
+        ret['delivered'] = out_del * MSS
+    return ret
+
+
+def jain(x, axis=-1):
+    """Jain's fairness index along axis (1.0 when everything is zero)."""
+    s = x.sum(axis=axis)
+    s2 = (x * x).sum(axis=axis)
+    n = x.shape[axis]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(s2 > 0, s * s / (n * s2), 1.0)
+
+
+def metrics(res, bw_net, duration, warmup=0.0):
+    """Per point summary of a simulate() result."""
+    bw_net = np.atleast_1d(bw_net).astype(float)
+    keep = res['t'] >= warmup
+    qlen = res['qlen'][:, keep]
+    cap = bw_net * 1e6 / (8 * MSS)
+    mbps = res['bytes'] * 8 / 1e6 / duration
+    total = res['drops'][:, -1] + res['bytes'].sum(axis=1) / MSS
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'throughput_mbps': mbps.sum(axis=1),
+            'utilization': mbps.sum(axis=1) / bw_net,
+            'mean_qlen': qlen.mean(axis=1),
+            'p95_qdelay_ms': np.percentile(qlen, 95, axis=1) / cap * 1e3,
+            'mean_rtt_ms': np.nanmean(res['ping_rtt'], axis=1),
+            'drop_rate': res['drops'][:, -1] / total,
+            'fairness': jain(mbps),
+        }
+
+
+def sweep(algos, bw_net, delay, maxq, duration, **kwargs):
+    """Simulates the cartesian product of the given bw_net, delay and maxq
+    values.  Returns (grid, metrics) as dicts of flat per point arrays."""
+    b, d, q = [g.ravel() for g in np.meshgrid(np.atleast_1d(bw_net),
+                                              np.atleast_1d(delay),
+                                              np.atleast_1d(maxq),
+                                              indexing='ij')]
+    warmup = kwargs.pop('warmup', 0.0)
+    res = simulate(algos, b, d, q, duration, record=False, **kwargs)
+    return {'bw_net': b, 'delay': d, 'maxq': q}, metrics(res, b, duration, warmup)
+
+
+def iperf_value(x, units, base):
+    """iperf2 adaptive unit formatting: '1.38 MBytes', '27.0 MBytes'."""
+    i = 0
+    while i < len(units) - 1 and x >= base:
+        x /= base
+        i += 1
+    if x < 9.995:
+        s = '%4.2f' % x
+    elif x < 99.95:
+        s = '%4.1f' % x
+    else:
+        s = '%4.0f' % x
+    return '%s %s' % (s, units[i])
+
+
+def iperf_line(start, end, nbytes):
+    return '[  5] %4.1f-%4.1f sec  %s  %s\n' % (
+        start, end,
+        iperf_value(nbytes, ['Bytes', 'KBytes', 'MBytes', 'GBytes'], 1024.0),
+        iperf_value(nbytes * 8 / max(end - start, 1e-9),
+                    ['bits/sec', 'Kbits/sec', 'Mbits/sec', 'Gbits/sec'], 1000.0))
+
+
+def write_iperf(fname, t, delivered, start, server_ip, client_ip, interval=5.0):
+    """Writes one flow like `iperf -c server -i 5` would have."""
+    rel = t - start
+    with open(fname, 'w') as f:
+        f.write('-' * 60 + '\n')
+        f.write('Client connecting to %s, TCP port 5001\n' % server_ip)
+        f.write('TCP window size: 85.3 KByte (default)\n')
+        f.write('-' * 60 + '\n')
+        f.write('[  5] local %s port 5001 connected with %s port 5001\n'
+                % (client_ip, server_ip))
+        f.write('[ ID] Interval       Transfer     Bandwidth\n')
+        at = lambda x: np.interp(x, rel, delivered)
+        end = rel[-1]
+        a = 0.0
+        while a + interval <= end + 1e-9:
+            f.write(iperf_line(a, a + interval, at(a + interval) - at(a)))
+            a += interval
+        f.write(iperf_line(0.0, end, at(end) - at(0.0)))
+
+
+def write_iperf_csv(fname, t, delivered, start, server_ip, client_ip,
+                    interval=0.1, epoch=None, stop=np.inf):
+    """Writes one flow like `iperf -c server -y C -i 0.1` would have,
+    timestamps counted from epoch (the start of the run)."""
+    if epoch is None:
+        epoch = time.time()
+    rel = t - start
+    end = min(rel[-1], stop - start)
+    n = int(end / interval + 1e-9)
+    a = np.arange(n) * interval
+    b = a + interval
+    # Final summary over the whole run, as iperf prints it
+    a = np.append(a, 0.0)
+    b = np.append(b, end)
+    nbytes = np.rint(np.interp(b, rel, delivered) - np.interp(a, rel, delivered))
+    bps = np.rint(nbytes * 8 / np.maximum(b - a, 1e-9))
+    with open(fname, 'w') as f:
+        for lo, hi, nb, rate in zip(a, b, nbytes, bps):
+            stamp = epoch + start + hi
+            f.write('%s.%03d,%s,5001,%s,5001,3,%.1f-%.1f,%d,%d\n' % (
+                time.strftime('%Y%m%d%H%M%S', time.localtime(stamp)),
+                int(stamp % 1 * 1000), client_ip, server_ip, lo, hi, nb, rate))
+
+
+def write_outputs(res, out_dir, algos, starts, competition=False,
+                  iperf_interval=0.1, names=None, stops=None):
+    """Writes the result of a single point run like the Mininet scripts;
+    names are the flows' log names (default h<N>_<cong>)."""
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    t = res['t']
+    out = open_series(os.path.join(out_dir, 'buffer.txt'), BUFFER_FIELDS)
+    qlen = np.rint(res['qlen'][0]).astype(int)
+    drops = res['drops'][0].astype(int)
+    for i in range(len(t)):
+        out.append(t[i], qlen[i], qlen[i] * MSS, drops[i], 0, 0, 0)
+    out.close()
+
+    ping_name = 'ping_competition.txt' if competition else 'ping.txt'
+    rtt = res['ping_rtt'][0]
+    out = open_series(os.path.join(out_dir, ping_name), RTT_FIELDS,
+                      header=True, source='simulate.py')
+    for seq, (sent, r) in enumerate(zip(res['ping_t'], rtt)):
+        out.append(sent, seq, r, sent + r / 1e3)
+    out.close()
+
+    server = len(algos) + 1
+    epoch = time.time()
+    for i, algo in enumerate(algos):
+        host = i + 1
+        name = names[i] if names else 'h%d_%s' % (host, algo)
+        fname = os.path.join(out_dir, 'iperf_%s.txt' % name)
+        ips = '10.0.0.%d' % server, '10.0.0.%d' % host
+        if competition:
+            write_iperf_csv(fname, t, res['delivered'][0, i], starts[i], *ips,
+                            interval=iperf_interval, epoch=epoch,
+                            stop=np.inf if stops is None else stops[i])
+        else:
+            write_iperf(fname, t, res['delivered'][0, i], starts[i], *ips)
+
+
+def print_summary(res, algos, bw_net, duration, starts, stops=None, names=None):
+    print('Per flow results:')
+    print('-' * 50)
+    mbps = []
+    for i, algo in enumerate(algos):
+        end = duration if stops is None else min(stops[i], duration)
+        mbps.append(res['bytes'][0, i] * 8 / 1e6 / (end - starts[i]))
+        name = names[i] if names else 'h%d' % (i + 1)
+        print('%s (TCP %s): %.2f Mbits/sec' % (name, algo.upper(), mbps[-1]))
+    print('-' * 50)
+    total = res['bytes'][0].sum() * 8 / 1e6 / duration
+    print('Total throughput: %.2f Mbits/sec' % total)
+    print('Link utilization (%s Mbits/sec): %.1f%%' % (bw_net, total / bw_net * 100))
+    if len(mbps) >= 2:
+        print("Jain's fairness index: %.3f" % jain(np.array(mbps)))
+    rtt = res['ping_rtt'][0]
+    print('RTT: mean %.1f ms, p95 %.1f ms, %d/%d probes lost'
+          % (np.nanmean(rtt), np.nanpercentile(rtt, 95), np.isnan(rtt).sum(), len(rtt)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fluid bottleneck simulator")
+    parser.add_argument('--bw-net', '-b', type=float, nargs='+', required=True,
+                        help="Bandwidth of bottleneck link (Mb/s)")
+    parser.add_argument('--bw-host', '-B', type=float, default=1000,
+                        help="Accepted for compatibility; host links are not modelled")
+    parser.add_argument('--delay', type=float, nargs='+', required=True,
+                        help="Link propagation delay (ms)")
+    parser.add_argument('--maxq', type=int, nargs='+', default=[100],
+                        help="Max buffer size of the bottleneck in packets")
+    parser.add_argument('--time', '-t', type=float, default=10,
+                        help="Simulated seconds")
+    parser.add_argument('--cong', nargs='+', default=['reno'],
+                        help="Congestion control of each flow (reno, cubic, bbr)")
+    parser.add_argument('--competition', action='store_true',
+                        help="CompTopo: 3 links per path, flows started 0.5 s apart")
+    parser.add_argument('--scenario',
+                        help="Flows of a bufferbloat_competition.py scenario: a "
+                             "name in scenarios/ (%s) or a JSON/YAML file"
+                             % ', '.join(scenario.available()))
+    parser.add_argument('--ping-interval', type=float, default=0.1)
+    parser.add_argument('--iperf-interval', type=float, default=0.1,
+                        help="Report interval of the competition iperf logs")
+    parser.add_argument('--dt', type=float, default=None,
+                        help="Time step in seconds (default: RTT/10 within 0.5-5 ms)")
+    parser.add_argument('--dir', '-d', help="Output directory (single point)")
+    parser.add_argument('--out', '-o', help="CSV file for sweeps (default stdout)")
+    parser.add_argument('--warmup', type=float, default=0.0,
+                        help="Seconds excluded from the queue metrics of sweeps")
+    args = parser.parse_args()
+
+    competition = args.competition or args.scenario is not None
+    hops = 3 if competition else 2
+    names = stops = base_rtt = None
+    if args.scenario:
+        try:
+            scen = scenario.load(args.scenario)
+        except ValueError as e:
+            parser.error(str(e))
+        algos = [f.cc for f in scen.flows]
+        names = [f.name for f in scen.flows]
+        starts = [f.start for f in scen.flows]
+        stops = [np.inf if f.stop is None else f.stop for f in scen.flows]
+        base_rtt = [np.nan if f.rtt is None else f.rtt / 1e3 for f in scen.flows]
+    else:
+        algos = args.cong
+        starts = [0.5 * i if competition else 0.0 for i in range(len(algos))]
+    kwargs = dict(hops=hops, starts=starts, stops=stops, base_rtt=base_rtt,
+                  dt=args.dt, ping_sec=args.ping_interval)
+
+    if len(args.bw_net) * len(args.delay) * len(args.maxq) > 1:
+        grid, m = sweep(algos, args.bw_net, args.delay, args.maxq, args.time,
+                        warmup=args.warmup, **kwargs)
+        names = list(grid) + list(m)
+        out = open(args.out, 'w') if args.out else sys.stdout
+        out.write(','.join(names) + '\n')
+        for i in range(len(grid['bw_net'])):
+            out.write(','.join('%g' % (grid.get(n, m.get(n))[i]) for n in names) + '\n')
+        if args.out:
+            out.close()
+        return
+
+    if args.dir is None:
+        parser.error('--dir is required for a single point')
+    res = simulate(algos, args.bw_net[0], args.delay[0], args.maxq[0], args.time,
+                   **kwargs)
+    write_outputs(res, args.dir, algos, starts, competition, args.iperf_interval,
+                  names, stops)
+    print_summary(res, algos, args.bw_net[0], args.time, starts, stops, names)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+'''
+Resumable parameter sweeps over bufferbloat.py / bufferbloat_competition.py
+with a content-addressed result cache.
+
+Every point of the sweep is keyed by a hash of the script, its parameters
+and the source of the code that produces the measurements (and, for
+competition points, of the scenario file).  A point runs
+in <root>/<key>/ and is marked done by <key>/done.json only when the
+experiment exits cleanly, so an interrupted sweep picks up where it
+stopped and completed points are never rerun.  Derived artifacts (plots,
+stats) are recorded with the hash of their inputs in <key>/derived.json
+and only recomputed when an input changes.
+
+A sweep is described by a JSON file (or the equivalent --grid/--fixed
+options):
+
+    {"script": "bufferbloat.py",
+     "fixed": {"bw-net": 1.5, "bw-host": 1000, "delay": 5, "time": 200},
+     "grid": {"maxq": [20, 100], "cong": ["reno", "bbr"]}}
+
+    sudo python3 sweep.py --spec reno_vs_bbr.json --root sweeps
+    sudo python3 sweep.py --grid maxq=20,50,100 --fixed bw-net=1.5 delay=5
+'''
+
+import argparse
+import ast
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+from time import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Sources that influence what an experiment measures; editing any of them
+# invalidates the cached runs.  Besides these (mostly programs the script
+# launches) every local module the script imports, directly or not, is
+# hashed.  Plotting code is tracked per artifact.
+EXPERIMENT_MODULES = ['monitor.py', 'rtnl.py', 'tsfile.py', 'sampler.py',
+                      'linkrate.py', 'rttprobe.py', 'webload.py',
+                      'http/webserver.py', 'scenario.py']
+# Competition points are also keyed by the content of their scenario file;
+# the scenario bufferbloat_competition.py runs without --scenario
+COMPETITION_SCRIPT = 'bufferbloat_competition.py'
+DEFAULT_SCENARIO = 'reno_vs_bbr'
+
+# Derived artifacts: (name, inputs, command, plotting script).  Paths are
+# relative to the run directory, commands are run from HERE with {dir}
+# replaced by the run directory.  The sources of an artifact are the
+# plotting script and the local modules it imports.
+DERIVED = [
+    ('queue-plot', ['buffer.txt'],
+     [sys.executable, 'plot_queue.py', '-f', '{dir}/buffer.txt', '-o', '{dir}/buffer.png'],
+     'plot_queue.py'),
+    ('rtt-plot', ['ping.txt'],
+     [sys.executable, 'plot_ping.py', '-f', '{dir}/ping.txt', '-o', '{dir}/rtt.png'],
+     'plot_ping.py'),
+]
+
+
+def file_digest(path, h=None):
+    h = h or hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h
+
+
+def local_imports(script):
+    """Modules of HERE imported by script and, recursively, by them."""
+    seen = []
+    todo = [script]
+    while todo:
+        path = os.path.join(HERE, todo.pop())
+        with open(path) as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module = name.split('.')[0] + '.py'
+                # The sweep itself only parses --session values for them
+                if module not in seen and module not in (script, 'sweep.py') and \
+                        os.path.exists(os.path.join(HERE, module)):
+                    seen.append(module)
+                    todo.append(module)
+    return sorted(seen)
+
+
+def code_version(script):
+    h = hashlib.sha1()
+    modules = EXPERIMENT_MODULES + [m for m in local_imports(script)
+                                    if m not in EXPERIMENT_MODULES]
+    for name in [script] + modules:
+        path = os.path.join(HERE, name)
+        if os.path.exists(path):
+            h.update(name.encode())
+            file_digest(path, h)
+    return h.hexdigest()
+
+
+def scenario_digest(script, params):
+    """Hash of the scenario file of a competition point, None otherwise."""
+    if os.path.basename(script) != COMPETITION_SCRIPT:
+        return None
+    import scenario
+    name = str(params.get('scenario', DEFAULT_SCENARIO))
+    # Paths are relative to HERE, where the points run
+    local = os.path.join(HERE, name)
+    try:
+        path = local if os.path.exists(local) else scenario.find(name)
+    except ValueError:
+        return None
+    return file_digest(path).hexdigest()
+
+
+def run_key(script, params, code):
+    key = {'script': script, 'params': params, 'code': code}
+    digest = scenario_digest(script, params)
+    if digest is not None:
+        key['scenario'] = digest
+    blob = json.dumps(key, sort_keys=True)
+    return hashlib.sha1(blob.encode()).hexdigest()[:16]
+
+
+def expand(fixed, grid):
+    """Cartesian product of the grid, each point merged with fixed."""
+    names = sorted(grid)
+    for values in itertools.product(*[grid[n] for n in names]):
+        params = dict(fixed)
+        params.update(zip(names, values))
+        yield params
+
+
+def command_line(script, params, run_dir):
+    cmd = [sys.executable, script, '--dir', run_dir]
+    for name, value in sorted(params.items()):
+        if value is True:
+            cmd.append('--' + name)
+        elif value is not False and value is not None:
+            cmd += ['--' + name, str(value)]
+    return cmd
+
+
+def parse_value(s):
+    for conv in (int, float):
+        try:
+            return conv(s)
+        except ValueError:
+            pass
+    return {'true': True, 'false': False}.get(s.lower(), s)
+
+
+def parse_assignments(items, multi):
+    ret = {}
+    for item in items or []:
+        name, _, value = item.partition('=')
+        if multi:
+            ret[name] = [parse_value(v) for v in value.split(',')]
+        else:
+            ret[name] = parse_value(value)
+    return ret
+
+
+def derive(run_dir, force=False):
+    """Recomputes the derived artifacts whose inputs changed."""
+    state_file = os.path.join(run_dir, 'derived.json')
+    state = json.load(open(state_file)) if os.path.exists(state_file) else {}
+    for name, inputs, cmd, script in DERIVED:
+        paths = [os.path.join(run_dir, i) for i in inputs]
+        if not all(os.path.exists(p) for p in paths):
+            continue
+        h = hashlib.sha1(json.dumps(cmd).encode())
+        sources = [script] + local_imports(script)
+        for p in paths + [os.path.join(HERE, s) for s in sources]:
+            file_digest(p, h)
+        digest = h.hexdigest()
+        if state.get(name) == digest and not force:
+            continue
+        ret = subprocess.call([c.format(dir=run_dir) for c in cmd], cwd=HERE)
+        if ret == 0:
+            state[name] = digest
+            with open(state_file, 'w') as f:
+                json.dump(state, f, indent=1)
+        else:
+            print('  %s failed (exit %d)' % (name, ret))
+
+
+def mn_cleanup():
+    try:
+        subprocess.call(['mn', '-c'], stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL)
+    except OSError:
+        pass
+
+
+def run_point(script, params, root, code, cleanup='on-failure', dry_run=False):
+    """Runs one point unless it is cached.  Returns (key, status)."""
+    key = run_key(script, params, code)
+    run_dir = os.path.abspath(os.path.join(root, key))
+    done = os.path.join(run_dir, 'done.json')
+    if os.path.exists(done):
+        return key, 'cached'
+    cmd = command_line(script, params, run_dir)
+    if dry_run:
+        print('  ' + ' '.join(cmd))
+        return key, 'pending'
+    if os.path.isdir(run_dir):
+        # Leftovers of an interrupted attempt
+        shutil.rmtree(run_dir)
+    os.makedirs(run_dir)
+    with open(os.path.join(run_dir, 'params.json'), 'w') as f:
+        json.dump({'script': script, 'params': params, 'code': code}, f,
+                  indent=1, sort_keys=True)
+    start = time()
+    with open(os.path.join(run_dir, 'stdout.txt'), 'w') as log:
+        ret = subprocess.call(cmd, cwd=HERE, stdout=log,
+                              stderr=subprocess.STDOUT)
+    if ret != 0:
+        if cleanup != 'never':
+            mn_cleanup()
+        return key, 'failed (exit %d)' % ret
+    if cleanup == 'always':
+        mn_cleanup()
+    with open(done, 'w') as f:
+        json.dump({'seconds': time() - start, 'finished': time()}, f)
+    return key, 'done'
+
+
+def load_spec(args):
+    spec = {'script': args.script, 'fixed': {}, 'grid': {}}
+    if args.spec:
+        spec.update(json.load(open(args.spec)))
+    spec['fixed'].update(parse_assignments(args.fixed, multi=False))
+    spec['grid'].update(parse_assignments(args.grid, multi=True))
+    return spec
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumable experiment sweeps")
+    parser.add_argument('--spec', help="JSON sweep description")
+    parser.add_argument('--script', default='bufferbloat.py',
+                        help="Experiment script (default bufferbloat.py)")
+    parser.add_argument('--fixed', nargs='+', metavar='NAME=VALUE',
+                        help="Parameters shared by every point")
+    parser.add_argument('--grid', nargs='+', metavar='NAME=V1,V2',
+                        help="Parameters to sweep")
+    parser.add_argument('--root', default='sweeps',
+                        help="Result cache directory")
+    parser.add_argument('--cleanup', choices=['on-failure', 'always', 'never'],
+                        default='on-failure',
+                        help="When to run 'mn -c' after a point")
+    parser.add_argument('--derive-only', action='store_true',
+                        help="Only (re)compute derived artifacts of finished points")
+    parser.add_argument('--force-derive', action='store_true',
+                        help="Recompute derived artifacts even if inputs are unchanged")
+    parser.add_argument('--dry-run', '-n', action='store_true',
+                        help="Print the commands of pending points")
+    args = parser.parse_args()
+
+    spec = load_spec(args)
+    script = spec['script']
+    code = code_version(script)
+    points = list(expand(spec['fixed'], spec['grid']))
+    print('%d points, code version %s' % (len(points), code[:12]))
+    failed = 0
+    for i, params in enumerate(points):
+        desc = ' '.join('%s=%s' % kv for kv in sorted(params.items())
+                        if kv[0] in spec['grid'])
+        if args.derive_only:
+            key, status = run_key(script, params, code), 'skipped'
+            if os.path.exists(os.path.join(args.root, key, 'done.json')):
+                status = 'cached'
+        else:
+            key, status = run_point(script, params, args.root, code,
+                                    args.cleanup, args.dry_run)
+        print('[%d/%d] %s %s: %s' % (i + 1, len(points), key, desc, status))
+        if status in ('done', 'cached'):
+            derive(os.path.abspath(os.path.join(args.root, key)),
+                   args.force_derive)
+        elif status.startswith('failed'):
+            failed += 1
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+'''
+Per-flow TCP state read over a NETLINK_SOCK_DIAG socket, like `ss -ti`
+without forking ss.
+
+One inet_diag dump returns struct tcp_info (cwnd, ssthresh, srtt, rttvar,
+retransmits, pacing and delivery rate, ...) and, for BBR flows, struct
+tcp_bbr_info (bandwidth estimate, min_rtt, pacing and cwnd gain) for every
+TCP socket of a network namespace.  Netlink sockets stay bound to the
+namespace they were created in, so TcpInfoSampler(pid=...) enters the
+namespace of a Mininet host just to open its socket and the sampler
+process can read every host without running anything inside them.
+
+Records follow tsfile.TCPINFO_FIELDS, one per flow and sample; only flows
+towards --port (the iperf server) are kept, so a host file holds the
+sender side of its iperf flows and flow_series() splits it by sport.
+
+    python3 tcpinfo.py -i 0.01 -w 10 -o /tmp/tcp.txt --port 5001
+'''
+
+import argparse
+import os
+import signal
+import socket
+import struct
+from time import monotonic, sleep
+
+from rtnl import (NLMSGHDR, NLMSGERR, NLMSG_DONE, NLMSG_ERROR, NLM_F_DUMP,
+                  NLM_F_REQUEST, iter_messages, netlink_socket, parse_attrs)
+from tsfile import clock, open_series, TCPINFO_FIELDS
+
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+
+INET_DIAG_INFO = 2
+INET_DIAG_VEGASINFO = 3
+INET_DIAG_CONG = 4
+INET_DIAG_BBRINFO = 16
+
+TCP_ESTABLISHED = 1
+TCP_LISTEN = 10
+# Every state but LISTEN: flows still show up while closing
+ALL_BUT_LISTEN = 0xFFF & ~(1 << TCP_LISTEN)
+
+# struct inet_diag_req_v2 and struct inet_diag_msg (linux/inet_diag.h);
+# ports and addresses of inet_diag_sockid are big endian
+INET_DIAG_REQ_V2 = struct.Struct('=BBBxI2s2s16s16sI8s')
+INET_DIAG_MSG = struct.Struct('=BBBB2s2s16s16sI8sIIIII')
+PORT = struct.Struct('!H')
+# struct tcp_info up to delivery_rate (linux/tcp.h); older kernels send a
+# shorter one, which is zero padded
+TCP_INFO = struct.Struct('=BBBBBBBB' + 'I' * 24 + 'QQQQII' + 'IIII' + 'Q')
+TCP_INFO_FIELDS = [
+    'state', 'ca_state', 'retransmits', 'probes', 'backoff', 'options',
+    'wscale', 'flags',
+    'rto', 'ato', 'snd_mss', 'rcv_mss', 'unacked', 'sacked', 'lost',
+    'retrans', 'fackets', 'last_data_sent', 'last_ack_sent',
+    'last_data_recv', 'last_ack_recv', 'pmtu', 'rcv_ssthresh', 'rtt',
+    'rttvar', 'snd_ssthresh', 'snd_cwnd', 'advmss', 'reordering',
+    'rcv_rtt', 'rcv_space', 'total_retrans',
+    'pacing_rate', 'max_pacing_rate', 'bytes_acked', 'bytes_received',
+    'segs_out', 'segs_in',
+    'notsent_bytes', 'min_rtt', 'data_segs_in', 'data_segs_out',
+    'delivery_rate']
+# struct tcp_bbr_info; gains are fixed point with BBR_UNIT = 256
+TCP_BBR_INFO = struct.Struct('=IIIII')
+BBR_UNIT = 256.0
+
+
+def diag_request(seq, family=socket.AF_INET, states=ALL_BUT_LISTEN):
+    """inet_diag dump request for all TCP sockets, with tcp_info and the
+    congestion control info (VEGASINFO also selects BBRINFO)."""
+    ext = (1 << (INET_DIAG_INFO - 1)) | (1 << (INET_DIAG_VEGASINFO - 1)) | \
+        (1 << (INET_DIAG_CONG - 1))
+    req = INET_DIAG_REQ_V2.pack(family, socket.IPPROTO_TCP, ext, states,
+                                b'', b'', b'', b'', 0, b'')
+    hdr = NLMSGHDR.pack(NLMSGHDR.size + len(req), SOCK_DIAG_BY_FAMILY,
+                        NLM_F_REQUEST | NLM_F_DUMP, seq, 0)
+    return hdr + req
+
+
+def decode_tcp_info(data):
+    """dict of the tcp_info fields present in the attribute."""
+    data = data[:TCP_INFO.size].ljust(TCP_INFO.size, b'\0')
+    return dict(zip(TCP_INFO_FIELDS, TCP_INFO.unpack(data)))
+
+
+def decode_flow(payload):
+    """(sport, dport, info, bbr, cong) of one SOCK_DIAG_BY_FAMILY message.
+
+    info is None if the kernel sent no tcp_info, bbr is None for flows
+    not using BBR: else (bw bytes/s, min_rtt us, pacing gain, cwnd gain)."""
+    msg = INET_DIAG_MSG.unpack_from(payload, 0)
+    sport, = PORT.unpack(msg[4])
+    dport, = PORT.unpack(msg[5])
+    attrs = parse_attrs(payload, INET_DIAG_MSG.size)
+    info = decode_tcp_info(attrs[INET_DIAG_INFO]) \
+        if INET_DIAG_INFO in attrs else None
+    bbr = None
+    if INET_DIAG_BBRINFO in attrs:
+        bw_lo, bw_hi, min_rtt, pacing_gain, cwnd_gain = \
+            TCP_BBR_INFO.unpack_from(attrs[INET_DIAG_BBRINFO])
+        bbr = ((bw_hi << 32) | bw_lo, min_rtt, pacing_gain / BBR_UNIT,
+               cwnd_gain / BBR_UNIT)
+    cong = attrs.get(INET_DIAG_CONG, b'').rstrip(b'\0').decode('ascii', 'replace')
+    return sport, dport, info, bbr, cong
+
+
+def flow_record(sport, dport, info, bbr):
+    """Values of a TCPINFO_FIELDS record, without the time."""
+    if bbr is None:
+        bbr = (-1, -1, float('nan'), float('nan'))
+    return (sport, dport, info['state'], info['ca_state'], info['snd_cwnd'],
+            min(info['snd_ssthresh'], 0x7FFFFFFF), info['rtt'], info['rttvar'],
+            info['min_rtt'], info['unacked'], info['lost'],
+            info['retransmits'], info['total_retrans'],
+            min(info['pacing_rate'], 2 ** 63 - 1), info['delivery_rate'],
+            info['bytes_acked']) + bbr
+
+
+def decode_dump(buf, length=None):
+    """Decodes one recv() worth of an inet_diag dump.
+
+    Returns (flows, done) like rtnl.decode_dump, flows as decode_flow()
+    tuples."""
+    ret = []
+    done = False
+    for msg_type, flags, seq, payload in iter_messages(buf, length):
+        if msg_type == NLMSG_DONE:
+            done = True
+        elif msg_type == NLMSG_ERROR:
+            err, = NLMSGERR.unpack_from(payload, 0)
+            if err:
+                raise OSError(-err, os.strerror(-err))
+            done = True
+        elif msg_type == SOCK_DIAG_BY_FAMILY:
+            ret.append(decode_flow(payload))
+    return ret, done
+
+
+class TcpInfoSampler(object):
+    """Keeps one sock_diag socket open and dumps the TCP flows of a netns."""
+
+    def __init__(self, pid=None, port=None, bufsize=65536):
+        self.port = port
+        self.sock = netlink_socket(NETLINK_SOCK_DIAG, pid)
+        self.sock.bind((0, 0))
+        self.buf = bytearray(bufsize)
+        self.seq = 0
+
+    def dump(self):
+        self.seq += 1
+        self.sock.send(diag_request(self.seq))
+        ret = []
+        while True:
+            n = self.sock.recv_into(self.buf)
+            flows, done = decode_dump(self.buf, n)
+            ret.extend(flows)
+            if done:
+                return ret
+
+    def sample(self):
+        """flow_record() tuples of the flows towards self.port (all flows
+        if None)."""
+        return [flow_record(sport, dport, info, bbr)
+                for sport, dport, info, bbr, _ in self.dump()
+                if info is not None and (self.port is None or dport == self.port)]
+
+    def close(self):
+        self.sock.close()
+
+
+def flow_series(recs):
+    """{sport: records} of a file loaded by parsers.load(fname, 'tcpinfo')."""
+    import numpy as np
+    recs = recs[np.argsort(recs['sport'], kind='stable')]
+    ports, first = np.unique(recs['sport'], return_index=True)
+    return dict(zip(ports.tolist(), np.split(recs, first[1:])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TCP flow state sampler (sock_diag)")
+    parser.add_argument('--interval', '-i', type=float, default=0.01,
+                        help="Seconds between samples")
+    parser.add_argument('--deadline', '-w', type=float, default=None,
+                        help="Stop after this many seconds")
+    parser.add_argument('--port', '-p', type=int, default=None,
+                        help="Only flows towards this port (e.g. 5001 for iperf)")
+    parser.add_argument('--pid', type=int, default=None,
+                        help="Sample the network namespace of this process")
+    parser.add_argument('--out', '-o', default='tcpinfo.txt',
+                        help="Output file (.bts for binary)")
+    args = parser.parse_args()
+
+    sampler = TcpInfoSampler(args.pid, args.port)
+    out = open_series(args.out, TCPINFO_FIELDS, header=True, source='tcpinfo.py')
+    stop = []
+    signal.signal(signal.SIGTERM, lambda *a: stop.append(1))
+    start = deadline = monotonic()
+    try:
+        while not stop and (args.deadline is None or
+                            deadline - start < args.deadline):
+            now = clock()
+            for rec in sampler.sample():
+                out.append(now, *rec)
+            deadline += args.interval
+            sleep(max(0.0, deadline - monotonic()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        out.close()
+        sampler.close()
+
+
+if __name__ == '__main__':
+    main()
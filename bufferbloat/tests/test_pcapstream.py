@@ -0,0 +1,24 @@
+import json
+import os
+
+import pytest
+
+from pcapstream import analyze, synthesize
+
+
+def test_analyze_matches_synthetic_truth(tmp_path):
+    d = str(tmp_path)
+    synthesize(d, flows=3, maxq=20, duration=2.0, delay=0.01, load=1.3)
+    with open(os.path.join(d, 'truth.json')) as f:
+        truth = json.load(f)
+    result = analyze([os.path.join(d, 'in.pcap')], [os.path.join(d, 'out.pcap')],
+                     delay=truth['delay'])
+    got = dict((r['flow'], r) for r in result['flows'])
+    assert sum(t['drops'] for t in truth['flows']) > 0
+    assert sum(t['retransmits'] for t in truth['flows']) > 0
+    for t in truth['flows']:
+        r = got[t['flow']]
+        assert r['drops'] == t['drops']
+        assert r['retransmits'] == t['retransmits']
+        assert r['packets_out'] == t['delivered_packets']
+        assert r['sojourn_ms']['mean'] == pytest.approx(t['sojourn_ms_mean'], rel=1e-3)
@@ -0,0 +1,41 @@
+import os
+import struct
+
+import rtnl
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+
+# Captured with QdiscSampler('lo').raw() after
+#   tc qdisc add dev lo root handle 5:0 htb default 1
+#   tc class add dev lo parent 5:0 classid 5:1 htb rate 1.5Mbit burst 15k
+#   tc qdisc add dev lo parent 5:1 handle 10: pfifo limit 20
+# and a burst of 300 UDP datagrams of 1000 bytes to 127.0.0.1
+def test_decode_qdisc_dump():
+    qdiscs, done = rtnl.decode_dump(fixture('qdisc_dump_lo.bin'))
+    assert done
+    assert [(q.kind, rtnl.format_handle(q.handle), rtnl.format_handle(q.parent))
+            for q in qdiscs] == [('htb', '5:', 'root'), ('pfifo', '10:', '5:1')]
+    q = rtnl.pick_qdisc(qdiscs)
+    assert q.kind == 'pfifo'
+    assert (q.packets, q.bytes, q.qlen, q.backlog, q.drops) == (3, 2674, 20, 20388, 279)
+    assert rtnl.pick_qdisc(qdiscs, rtnl.parse_handle('5:')).overlimits == 2
+
+
+def test_decode_class_dump():
+    classes, done = rtnl.decode_dump(fixture('class_dump_lo.bin'))
+    assert done
+    assert [(c.kind, rtnl.format_handle(c.handle)) for c in classes] == [('htb', '5:1')]
+    assert rtnl.htb_rate(classes[0].options) == 1500000
+
+
+def test_netem_options():
+    qopt = rtnl.NETEM_QOPT.pack(5000000 >> rtnl.PSCHED_SHIFT, 20, 0, 0, 0, 0)
+    assert rtnl.netem_options(qopt) == (0.005, 20)
+    latency64 = struct.pack('=HHQ', 12, rtnl.TCA_NETEM_LATENCY64, 2500000)
+    assert rtnl.netem_options(qopt + latency64) == (0.0025, 20)
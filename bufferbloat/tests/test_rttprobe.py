@@ -0,0 +1,55 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+import numpy as np
+
+from parsers import load
+from tsfile import RTT_FIELDS
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def lossy_echo(drop_every):
+    """UDP echo server on loopback answering all but every drop_every-th
+    datagram; returns its port."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+
+    def serve():
+        n = 0
+        while True:
+            data, addr = sock.recvfrom(2048)
+            n += 1
+            if n % drop_every:
+                sock.sendto(data, addr)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return sock.getsockname()[1]
+
+
+def test_udp_probe_over_loopback(tmp_path):
+    out = str(tmp_path / 'rtt.txt')
+    port = lossy_echo(3)
+    subprocess.run([sys.executable, 'rttprobe.py', '127.0.0.1', '--mode', 'udp',
+                    '--port', str(port), '-c', '9', '-i', '0.01', '-W', '0.5',
+                    '-o', out], cwd=HERE, check=True, timeout=30,
+                   stdout=subprocess.DEVNULL)
+    with open(out) as f:
+        header = f.readline()
+    assert header == '# %s\n' % ','.join(n for n, _ in RTT_FIELDS)
+    r = load(out, 'ping')
+    assert list(r['seq']) == list(range(9))
+    lost = np.isnan(r['rtt'])
+    # The 3rd, 6th and 9th probes get no answer
+    assert list(np.flatnonzero(lost)) == [2, 5, 8]
+    assert np.isnan(r['recv_time'][lost]).all()
+    ok = ~lost
+    assert (r['rtt'][ok] > 0).all()
+    assert (np.diff(r['time']) > 0).all()
+    # Received after sent, within the RTT (ms) plus clock jitter
+    delta = (r['recv_time'][ok] - r['time'][ok]) * 1e3
+    assert (delta >= 0).all()
+    assert np.allclose(delta, r['rtt'][ok], atol=1.0)
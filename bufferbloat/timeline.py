@@ -0,0 +1,219 @@
+'''
+One time-aligned table per run, joining the queue, RTT, throughput and
+page-fetch samples of a result directory.
+
+Every producer stamps its samples on the experiment clock of the run
+(tsfile.clock(), epoch in config.json), so the signals are joined on
+time directly: each column takes, for every row, the last sample of its
+signal at or before the row time (an as-of join done with one
+np.searchsorted per signal), or NaN when that sample is older than
+--tolerance (default: twice the median interval of the signal).  Rows
+are a regular grid of --dt seconds, or the samples of one signal with
+--on (--on fetch_ms: the queue and RTT seen by every page fetch).
+
+Alongside the measured RTT the queueing delay is estimated from the
+bottleneck backlog: backlog bytes * 8 / bottleneck rate (--bw-net, or the
+run's config.json), from qlen full-size packets for runs without a
+backlog column.
+
+Logs without absolute times (ping.txt from `ping` without -D, iperf text
+logs) are relative to their first sample; they are placed at the start
+of the run, which is only as good as the producers starting together.
+
+    python3 timeline.py reno-q100 -o reno-q100/timeline.csv
+    python3 timeline.py sweeps/<key> --on fetch_ms
+'''
+
+import argparse
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+
+from parsers import load, parse_iperf, parse_series
+from tsfile import fetch_ok, FETCH_FIELDS
+
+MSS = 1500
+# Times below this are relative to the start of the log, not epoch based
+RELATIVE_MAX = 1e8
+
+
+def find(run_dir, pattern):
+    return sorted(glob.glob(os.path.join(run_dir, pattern + '.txt')) +
+                  glob.glob(os.path.join(run_dir, pattern + '.bts')))
+
+
+def stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def read_config(run_dir):
+    try:
+        with open(os.path.join(run_dir, 'config.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def queueing_delay(backlog, bw_net):
+    """Milliseconds needed to drain backlog bytes at bw_net Mb/s."""
+    return backlog * 8 / (bw_net * 1e6) * 1e3
+
+
+def signals(run_dir, bw_net=None):
+    """Samples of a run as {column: (time, values)}, sorted by time."""
+    sig = {}
+    for path in find(run_dir, 'buffer')[:1]:
+        q = load(path, 'buffer')
+        sig['qlen'] = q['time'], q['qlen'].astype(float)
+        if 'backlog' in q.dtype.names:
+            backlog = q['backlog'].astype(float)
+            sig['backlog'] = q['time'], backlog
+        else:
+            backlog = q['qlen'] * float(MSS)
+        if bw_net:
+            sig['qdelay_ms'] = q['time'], queueing_delay(backlog, bw_net)
+    for path in (find(run_dir, 'ping') + find(run_dir, 'ping_competition'))[:1]:
+        p = load(path, 'ping')
+        sig['rtt_ms'] = p['time'], p['rtt']
+    for path in find(run_dir, 'rate_*'):
+        r = load(path, 'rate')
+        sig[stem(path) + '_mbps'] = r['time'], r['tx_bps'] / 1e6
+    for path in find(run_dir, 'iperf_*'):
+        intervals, _ = parse_iperf(path)
+        t = np.where(np.isnan(intervals['time']), intervals['end'], intervals['time'])
+        sig[stem(path)[len('iperf_'):] + '_mbps'] = t, intervals['bps'] / 1e6
+    for path in find(run_dir, 'fetch'):
+        f = load(path, 'fetch') if path.endswith('.bts') else \
+            parse_series(path, [n for n, _ in FETCH_FIELDS])
+        total = np.where(fetch_ok(f['status']), f['total_ns'] / 1e6, np.nan)
+        sig['fetch_ms'] = f['time'], total
+    for name, (t, v) in sig.items():
+        order = np.argsort(t, kind='stable')
+        sig[name] = np.asarray(t, float)[order], np.asarray(v, float)[order]
+    return sig
+
+
+def origin(run_dir, sig):
+    """Epoch of the run: config.json, else its earliest absolute sample."""
+    epoch = read_config(run_dir).get('epoch')
+    if epoch:
+        return epoch[0]
+    starts = [t[0] for t, _ in sig.values() if len(t) and t[0] >= RELATIVE_MAX]
+    return min(starts) if starts else 0.0
+
+
+def align(sig, t0):
+    """Times relative to t0.  Relative logs are kept as they are: their
+    times already count from the start of the producer ((icmp_seq - 1) *
+    interval for ping, the end of the interval for iperf)."""
+    out = {}
+    for name, (t, v) in sig.items():
+        if not len(t):
+            continue
+        if t[-1] < RELATIVE_MAX:
+            print('%s: no absolute times, assumed to start with the run' % name,
+                  file=sys.stderr)
+            out[name] = t, v
+        else:
+            out[name] = t - t0, v
+    return out
+
+
+def asof(grid, t, values, tolerance=np.inf):
+    """Last value at or before each grid time, NaN without one within
+    tolerance.  t must be sorted."""
+    idx = np.searchsorted(t, grid, side='right') - 1
+    found = idx >= 0
+    idx = np.maximum(idx, 0)
+    ok = found & (grid - t[idx] <= tolerance)
+    return np.where(ok, values[idx], np.nan)
+
+
+def default_tolerance(t):
+    return 2 * float(np.median(np.diff(t))) if len(t) > 1 else np.inf
+
+
+def build(run_dir, dt=0.1, on=None, tolerance=None, bw_net=None):
+    """Aligned timeline of a run: a structured array with 'time' (seconds
+    since the epoch of the run) and one column per signal."""
+    if bw_net is None:
+        bw_net = read_config(run_dir).get('args', {}).get('bw_net')
+    raw = signals(run_dir, bw_net)
+    sig = align(raw, origin(run_dir, raw))
+    if not sig:
+        raise ValueError('%s: no samples' % run_dir)
+    if on is not None:
+        if on not in sig:
+            raise ValueError('%s: no %r signal (have %s)' % (run_dir, on,
+                                                            ', '.join(sorted(sig))))
+        grid = sig[on][0]
+    else:
+        start = min(t[0] for t, _ in sig.values())
+        end = max(t[-1] for t, _ in sig.values())
+        grid = np.arange(start, end + dt / 2, dt)
+    names = sorted(sig)
+    out = np.empty(len(grid), dtype=[('time', 'f8')] + [(n, 'f8') for n in names])
+    out['time'] = grid
+    for name in names:
+        t, v = sig[name]
+        tol = default_tolerance(t) if tolerance is None else tolerance
+        out[name] = v if name == on else asof(grid, t, v, tol)
+    return out
+
+
+def nancorr(a, b):
+    ok = ~(np.isnan(a) | np.isnan(b))
+    if ok.sum() < 3 or a[ok].std() == 0 or b[ok].std() == 0:
+        return np.nan
+    return float(np.corrcoef(a[ok], b[ok])[0, 1])
+
+
+def print_summary(tl, on=None):
+    names = tl.dtype.names[1:]
+    print('%d rows, %.1f s' % (len(tl), tl['time'][-1] - tl['time'][0] if len(tl) else 0))
+    for name in names:
+        v = tl[name]
+        ok = ~np.isnan(v)
+        print('  %-22s %5.1f%% covered  median %10.3f' %
+              (name, 100.0 * ok.mean(), np.median(v[ok]) if ok.any() else np.nan))
+    if 'rtt_ms' in names and 'qdelay_ms' in names:
+        base = tl['rtt_ms'] - tl['qdelay_ms']
+        print('RTT vs estimated queueing delay: r = %.3f, median RTT - delay '
+              '%.1f ms (base RTT)' % (nancorr(tl['rtt_ms'], tl['qdelay_ms']),
+                                      np.nanmedian(base)))
+    if on == 'fetch_ms' and 'qdelay_ms' in names:
+        f = tl['fetch_ms']
+        ok = ~np.isnan(f) & ~np.isnan(tl['qdelay_ms'])
+        if ok.sum() >= 10:
+            slow = f[ok] >= np.percentile(f[ok], 90)
+            q = tl['qdelay_ms'][ok]
+            print('Queueing delay at fetch start: %.1f ms for the slowest 10%%, '
+                  '%.1f ms for the rest' % (q[slow].mean(), q[~slow].mean()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aligned experiment timeline")
+    parser.add_argument('dir', help="Result directory")
+    parser.add_argument('--dt', type=float, default=0.1,
+                        help="Grid step in seconds")
+    parser.add_argument('--on', help="Join on the samples of this column instead")
+    parser.add_argument('--tolerance', type=float,
+                        help="Max age of a joined sample in seconds")
+    parser.add_argument('--bw-net', '-b', type=float,
+                        help="Bottleneck rate in Mb/s (default: config.json)")
+    parser.add_argument('--out', '-o', help="CSV output")
+    args = parser.parse_args()
+
+    tl = build(args.dir, args.dt, args.on, args.tolerance, args.bw_net)
+    print_summary(tl, args.on)
+    if args.out:
+        np.savetxt(args.out, tl.view(np.float64).reshape(len(tl), -1),
+                   delimiter=',', fmt='%.6f', header=','.join(tl.dtype.names),
+                   comments='# ')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+'''
+Fixed-record binary time series (.bts) used for buffer and ping samples.
+
+Layout: a 12-byte preamble (magic, version, header length), a JSON header
+with the record schema and clock info, padded to 8 bytes, then packed
+little-endian records.  Readers map the records straight into a NumPy
+structured array, so loading millions of samples needs no parsing.
+
+    python3 tsfile.py reno-q100 bbr-q20 ...
+
+converts the buffer.txt/ping.txt files found in the given result
+directories to buffer.bts/ping.bts next to them.
+'''
+
+import json
+import os
+import re
+import struct
+import sys
+from time import time, monotonic
+
+MAGIC = b'BBTS'
+VERSION = 1
+PREAMBLE = struct.Struct('<4sHxxI')
+
+# Record layouts used by the monitors.  Every schema starts with a float64
+# timestamp so the plotters can always use column 'time' as x axis.
+QDISC_FIELDS = [('time', 'f8'), ('qlen', 'i4'), ('backlog', 'i8'),
+                ('drops', 'i8'), ('overlimits', 'i8'), ('requeues', 'i8')]
+PING_FIELDS = [('time', 'f8'), ('seq', 'i4'), ('rtt', 'f8')]
+# rttprobe.py: time is the send time, rtt/recv_time are NaN for losses
+RTT_FIELDS = PING_FIELDS + [('recv_time', 'f8')]
+# webload.py: durations in ns since the start of the request, status 0
+# (and -1 connect/ttfb) for failed fetches; only 2xx fetches count as
+# page loads (fetch_ok)
+FETCH_FIELDS = [('time', 'f8'), ('connect_ns', 'i8'), ('ttfb_ns', 'i8'),
+                ('total_ns', 'i8'), ('bytes', 'i8'), ('status', 'i4')]
+
+
+def fetch_ok(status):
+    """True for a successful (2xx) fetch status; works on arrays too."""
+    return status // 100 == 2
+
+
+RATE_FIELDS = [('time', 'f8'), ('tx_bps', 'f8'), ('rx_bps', 'f8'),
+               ('tx_pps', 'f8'), ('rx_pps', 'f8'), ('tx_drop_ps', 'f8'),
+               ('rx_drop_ps', 'f8'), ('tx_bps_ewma', 'f8'),
+               ('rx_bps_ewma', 'f8')]
+SOCK_FIELDS = [('time', 'f8'), ('tcp_inuse', 'i4'), ('tcp_tw', 'i4'),
+               ('tcp_mem', 'i8'), ('in_segs', 'i8'), ('out_segs', 'i8'),
+               ('retrans_segs', 'i8')]
+# tcpinfo.py: one record per flow and sample, flows told apart by sport.
+# Rates in bytes/s, times in us; the bbr_* columns are -1/NaN for other
+# congestion controls
+TCPINFO_FIELDS = [('time', 'f8'), ('sport', 'i4'), ('dport', 'i4'),
+                  ('state', 'i4'), ('ca_state', 'i4'), ('cwnd', 'i4'),
+                  ('ssthresh', 'i4'), ('srtt_us', 'i4'), ('rttvar_us', 'i4'),
+                  ('min_rtt_us', 'i4'), ('unacked', 'i4'), ('lost', 'i4'),
+                  ('retransmits', 'i4'), ('total_retrans', 'i4'),
+                  ('pacing_rate', 'i8'), ('delivery_rate', 'i8'),
+                  ('bytes_acked', 'i8'), ('bbr_bw', 'i8'),
+                  ('bbr_min_rtt_us', 'i4'), ('bbr_pacing_gain', 'f8'),
+                  ('bbr_cwnd_gain', 'f8')]
+# aqm.py: stats of the AQM qdisc of the bottleneck plus its xstats
+# (-1/NaN for the columns a discipline does not report)
+AQM_FIELDS = QDISC_FIELDS + [('ecn_mark', 'i8'), ('delay_us', 'i8'),
+                             ('prob', 'f8'), ('aqm_drops', 'i8'),
+                             ('drop_overlimit', 'i8'), ('flows', 'i4')]
+# fidelity.py: cgroup CPU of a Mininet host (cores used over the interval,
+# CPU limit in cores, cumulative throttling) and per-core load of the machine
+HOSTCPU_FIELDS = [('time', 'f8'), ('usage', 'f8'), ('limit', 'f8'),
+                  ('nr_throttled', 'i8'), ('throttled_sec', 'f8')]
+SYSCPU_FIELDS = [('time', 'f8'), ('busy_mean', 'f8'), ('busy_max', 'f8'),
+                 ('softirq_mean', 'f8'), ('softirq_max', 'f8'),
+                 ('steal_mean', 'f8')]
+
+# Experiment clock.  The experiment scripts fix an epoch (wall clock and
+# CLOCK_MONOTONIC read together) before starting any producer and export
+# it in EPOCH_ENV; every producer stamps its samples with clock(), the
+# wall clock at the epoch plus the monotonic time elapsed since.  Network
+# namespaces share CLOCK_MONOTONIC, so samples of the sampler, rttprobe.py,
+# webload.py, tcpinfo.py and the main script land on one clock that NTP
+# steps do not move, with the unit and magnitude of time().
+EPOCH_ENV = 'BUFFERBLOAT_EPOCH'
+_epoch = []
+
+
+def set_epoch():
+    """Starts the experiment clock for this process and the processes it
+    spawns from now on.  Returns (wall, monotonic)."""
+    epoch = (time(), monotonic())
+    os.environ[EPOCH_ENV] = '%.9f %.9f' % epoch
+    _epoch[:] = epoch
+    return epoch
+
+
+def get_epoch():
+    """(wall, monotonic) of the experiment epoch: EPOCH_ENV, else the
+    first call in this process (standalone producers)."""
+    if not _epoch:
+        value = os.environ.get(EPOCH_ENV)
+        _epoch[:] = [float(v) for v in value.split()] if value else \
+            [time(), monotonic()]
+    return tuple(_epoch)
+
+
+def clock():
+    """Current time on the experiment clock (seconds, epoch-based)."""
+    wall, mono = get_epoch()
+    return wall + (monotonic() - mono)
+
+
+_STRUCT_CODES = {'f8': 'd', 'f4': 'f', 'i8': 'q', 'i4': 'i', 'u8': 'Q',
+                 'u4': 'I', 'i2': 'h', 'u2': 'H'}
+
+
+def record_struct(fields):
+    return struct.Struct('<' + ''.join(_STRUCT_CODES[t] for _, t in fields))
+
+
+def is_binary(fname):
+    return fname.endswith('.bts')
+
+
+class SeriesWriter(object):
+    """Appends packed records through a bounded ring buffer.
+
+    Records are packed into a preallocated buffer of `capacity` slots and
+    written out in one call when it fills up, on flush() and on close()."""
+
+    def __init__(self, fname, fields, capacity=1024, clock='experiment',
+                 header=True, **meta):
+        self.fields = list(fields)
+        self.rec = record_struct(self.fields)
+        self.capacity = capacity
+        self.buf = bytearray(self.rec.size * capacity)
+        self.n = 0
+        header = dict(meta)
+        header['fields'] = self.fields
+        wall, mono = get_epoch()
+        header['clock'] = {'source': clock, 'wall': time(),
+                           'monotonic': monotonic(), 'epoch_wall': wall,
+                           'epoch_monotonic': mono}
+        blob = json.dumps(header).encode('utf-8')
+        hlen = PREAMBLE.size + len(blob)
+        blob += b' ' * (-hlen % 8)
+        self.out = open(fname, 'wb')
+        self.out.write(PREAMBLE.pack(MAGIC, VERSION, PREAMBLE.size + len(blob)))
+        self.out.write(blob)
+        self.out.flush()
+
+    def append(self, *values):
+        self.rec.pack_into(self.buf, self.n * self.rec.size, *values)
+        self.n += 1
+        if self.n == self.capacity:
+            self.flush()
+
+    def flush(self):
+        if self.n:
+            self.out.write(memoryview(self.buf)[:self.n * self.rec.size])
+            self.n = 0
+        self.out.flush()
+
+    def close(self):
+        self.flush()
+        self.out.close()
+
+
+class TextSeriesWriter(object):
+    """Same interface as SeriesWriter, for the legacy comma separated files.
+
+    With header=True the first line is a '# name,name,...' comment; the
+    legacy buffer.txt readers expect no header, so it is off by default."""
+
+    def __init__(self, fname, fields, capacity=1024, header=False, **meta):
+        self.fields = list(fields)
+        self.fmt = ','.join('%f' if t[0] == 'f' else '%d'
+                            for _, t in self.fields) + '\n'
+        self.capacity = capacity
+        self.lines = []
+        self.out = open(fname, 'w')
+        if header:
+            self.out.write('# %s\n' % ','.join(n for n, _ in self.fields))
+            self.out.flush()
+
+    def append(self, *values):
+        self.lines.append(self.fmt % values)
+        if len(self.lines) == self.capacity:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.out.writelines(self.lines)
+            self.lines = []
+        self.out.flush()
+
+    def close(self):
+        self.flush()
+        self.out.close()
+
+
+def open_series(fname, fields, **kwargs):
+    """Binary writer for *.bts, text writer otherwise."""
+    if is_binary(fname):
+        return SeriesWriter(fname, fields, **kwargs)
+    return TextSeriesWriter(fname, fields, **kwargs)
+
+
+def read_header(fname):
+    with open(fname, 'rb') as f:
+        magic, version, hlen = PREAMBLE.unpack(f.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError('%s: not a .bts file' % fname)
+        if version != VERSION:
+            raise ValueError('%s: unsupported .bts version %d' % (fname, version))
+        header = json.loads(f.read(hlen - PREAMBLE.size).decode('utf-8'))
+    header['header_len'] = hlen
+    return header
+
+
+def read_series(fname):
+    """Returns (header, records) with records a read-only memmap.
+
+    A trailing partial record (file still being written) is ignored."""
+    import numpy as np
+    header = read_header(fname)
+    dtype = np.dtype([(str(n), '<' + t) for n, t in header['fields']])
+    count = (os.path.getsize(fname) - header['header_len']) // dtype.itemsize
+    if count <= 0:
+        return header, np.zeros(0, dtype=dtype)
+    return header, np.memmap(fname, dtype=dtype, mode='r',
+                             offset=header['header_len'], shape=(count,))
+
+
+def convert_buffer(src, dst):
+    n = 0
+    with open(src) as f:
+        first = f.readline()
+        ncols = len(first.strip().split(','))
+        fields = QDISC_FIELDS[:max(2, min(ncols, len(QDISC_FIELDS)))]
+        out = SeriesWriter(dst, fields, clock='realtime', source=src)
+        for line in [first] + list(f):
+            vals = line.strip().split(',')
+            if len(vals) < len(fields):
+                continue
+            out.append(float(vals[0]), *[int(v) for v in vals[1:len(fields)]])
+            n += 1
+    out.close()
+    return n
+
+
+_ping_pat = re.compile(r'icmp_seq=(\d+).*time=([\d.]+)')
+
+
+def convert_ping(src, dst, interval=0.1):
+    """ping output has no timestamps; time is rebuilt from icmp_seq."""
+    out = SeriesWriter(dst, PING_FIELDS, clock='ping-seq', interval=interval,
+                       source=src)
+    n = 0
+    with open(src) as f:
+        for line in f:
+            m = _ping_pat.search(line)
+            if m is None:
+                continue
+            seq = int(m.group(1))
+            out.append((seq - 1) * interval, seq, float(m.group(2)))
+            n += 1
+    out.close()
+    return n
+
+
+def main(dirs):
+    for d in dirs:
+        for name, conv in (('buffer', convert_buffer), ('ping', convert_ping)):
+            src = os.path.join(d, name + '.txt')
+            if os.path.exists(src):
+                dst = os.path.join(d, name + '.bts')
+                print('%s -> %s (%d records)' % (src, dst, conv(src, dst)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or ['.'])
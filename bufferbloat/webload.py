@@ -0,0 +1,198 @@
+'''
+Concurrent asyncio page-fetch load generator, used instead of running curl
+three times in a row every 5 seconds.
+
+--concurrency workers each fetch the URL every --period seconds (or back
+to back with --period 0) for --duration seconds.  Every request records
+its start time and the connect, time-to-first-byte and total durations in
+nanoseconds, measured in-process so no process spawn cost ends up in the
+numbers.  The host name is resolved once before the run, so connect time
+is DNS-free.  At the end the p50/p95/p99 of the total time of the
+successful (2xx) fetches are printed.
+
+    python3 webload.py http://10.0.0.1/http/index.html -c 8 -p 0.5 -d 60 \\
+        -o fetch.txt
+'''
+
+import argparse
+import asyncio
+import math
+import socket
+import sys
+from time import monotonic, perf_counter_ns
+from urllib.parse import urlsplit
+
+from tsfile import clock, fetch_ok, open_series, FETCH_FIELDS
+
+# Seconds a back-to-back (--period 0) worker waits after a failed fetch
+FAIL_BACKOFF = 0.05
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float('nan')
+    k = max(0, int(math.ceil(p / 100.0 * len(sorted_values))) - 1)
+    return sorted_values[k]
+
+
+def summarize(values):
+    """Returns {n, mean, stdev, p50, p95, p99} for a list of numbers."""
+    n = len(values)
+    if n == 0:
+        return {'n': 0}
+    mean = sum(values) / n
+    stdev = (sum((v - mean) ** 2 for v in values) / n) ** 0.5
+    s = sorted(values)
+    return {'n': n, 'mean': mean, 'stdev': stdev, 'p50': percentile(s, 50),
+            'p95': percentile(s, 95), 'p99': percentile(s, 99)}
+
+
+async def read_body(reader, headers):
+    """Reads the response body, returns its size in bytes."""
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        n = 0
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await reader.readline()
+                return n
+            n += len(await reader.readexactly(size))
+            await reader.readline()
+    if 'content-length' in headers:
+        length = int(headers['content-length'])
+        await reader.readexactly(length)
+        return length
+    n = 0
+    while True:
+        chunk = await reader.read(65536)
+        if not chunk:
+            return n
+        n += len(chunk)
+
+
+async def fetch(addr, port, host, path, conn=None):
+    """One GET.  Returns (record, conn) where record is (start_time,
+    connect_ns, ttfb_ns, total_ns, nbytes, status) and conn is the
+    (reader, writer) pair if it may be reused, else None."""
+    start = clock()
+    t0 = perf_counter_ns()
+    if conn is None:
+        conn = await asyncio.open_connection(addr, port)
+    reader, writer = conn
+    t_conn = perf_counter_ns()
+    writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\n\r\n'
+                  % (path, host)).encode('ascii'))
+    status_line = await reader.readline()
+    t_first = perf_counter_ns()
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        k, _, v = line.decode('latin-1').partition(':')
+        headers[k.strip().lower()] = v.strip()
+    nbytes = await read_body(reader, headers)
+    t_end = perf_counter_ns()
+    keep = (headers.get('connection', '').lower() != 'close'
+            and ('content-length' in headers
+                 or 'transfer-encoding' in headers))
+    if not keep:
+        writer.close()
+        conn = None
+    return (start, t_conn - t0, t_first - t0, t_end - t0, nbytes, status), conn
+
+
+async def worker(url, out, period, stop_at, keepalive, totals):
+    parts = urlsplit(url)
+    host = parts.hostname
+    port = parts.port or 80
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    addr = socket.gethostbyname(host)
+    loop = asyncio.get_running_loop()
+    slot = loop.time()
+    conn = None
+    while monotonic() < stop_at:
+        start, t0 = clock(), perf_counter_ns()
+        try:
+            # A fetch still running at the end of the experiment is
+            # abandoned, so the run (and its caller) cannot hang on it
+            rec, conn = await asyncio.wait_for(
+                fetch(addr, port, host, path, conn), stop_at - monotonic())
+        except asyncio.TimeoutError:
+            # Timed out: status 0, total time up to the deadline
+            if conn is not None:
+                conn[1].close()
+            rec, conn = (start, -1, -1, perf_counter_ns() - t0, 0, 0), None
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            # Failed fetch: status 0 and whatever time it took
+            rec, conn = (start, -1, -1, perf_counter_ns() - t0, 0, 0), None
+        if not keepalive and conn is not None:
+            conn[1].close()
+            conn = None
+        out.append(*rec)
+        if fetch_ok(rec[5]):
+            totals.append(rec[3] / 1e9)
+        elif not rec[5] and period <= 0:
+            # Refused or broken connection: do not retry back to back
+            await asyncio.sleep(FAIL_BACKOFF)
+        if period > 0:
+            slot += period
+            delay = slot - loop.time()
+            if delay < 0:
+                # Fetch took longer than the period: skip missed slots
+                slot += math.ceil(-delay / period) * period
+                delay = slot - loop.time()
+            await asyncio.sleep(delay)
+    if conn is not None:
+        conn[1].close()
+
+
+async def run(url, out, concurrency=1, period=1.0, duration=10.0,
+              keepalive=False):
+    totals = []
+    stop_at = monotonic() + duration
+    # Stagger the workers over one period so they do not fire together
+    async def staggered(i):
+        if period > 0:
+            await asyncio.sleep(period * i / concurrency)
+        await worker(url, out, period, stop_at, keepalive, totals)
+    await asyncio.gather(*[staggered(i) for i in range(concurrency)])
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Async page-fetch load generator")
+    parser.add_argument('url')
+    parser.add_argument('--concurrency', '-c', type=int, default=4,
+                        help="Number of concurrent fetch workers")
+    parser.add_argument('--period', '-p', type=float, default=1.0,
+                        help="Seconds between fetches of each worker (0: back to back)")
+    parser.add_argument('--duration', '-d', type=float, default=10.0,
+                        help="Seconds to run")
+    parser.add_argument('--keepalive', action='store_true',
+                        help="Reuse connections (default: one per fetch, like curl)")
+    parser.add_argument('--out', '-o', default='fetch.txt',
+                        help="Output file (.bts for the binary format)")
+    args = parser.parse_args()
+
+    out = open_series(args.out, FETCH_FIELDS, capacity=256, header=True,
+                      url=args.url)
+    try:
+        totals = asyncio.run(run(args.url, out, args.concurrency, args.period,
+                                 args.duration, args.keepalive))
+    finally:
+        out.close()
+    s = summarize(totals)
+    if s['n'] == 0:
+        print('no successful fetches')
+        sys.exit(1)
+    print('%d fetches: mean %.4fs stdev %.4fs p50 %.4fs p95 %.4fs p99 %.4fs'
+          % (s['n'], s['mean'], s['stdev'], s['p50'], s['p95'], s['p99']))
+
+
+if __name__ == '__main__':
+    main()